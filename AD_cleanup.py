@@ -15,6 +15,10 @@ Options:
     --users-only     Only delete users, keep groups
     --groups-only    Only delete groups, keep users
     --file, -f       Path to company data JSON file (default: company_data.json)
+    --state-db FILE  State store to update (default: simulation_state.db)
+    --users/--departments/--projects/--roles
+                     Only delete the selected users and their project and department
+                     groups (see subset_selectors.py); shared groups are kept
 
 Example:
     python AD_cleanup.py --dry-run
@@ -37,6 +41,8 @@ from pathlib import Path
 from typing import Dict, List, Set
 import argparse
 import sys
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_users, selected_projects
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -63,6 +69,8 @@ Examples:
                       help='Only delete groups, keep users')
     parser.add_argument('--file', '-f', type=str, default='company_data.json',
                       help='Path to company data JSON file (default: company_data.json)')
+    add_store_arguments(parser)
+    add_selector_arguments(parser)
     
     args = parser.parse_args()
     
@@ -223,6 +231,55 @@ def get_all_group_names(company_data: Dict) -> Set[str]:
     
     return groups
 
+def get_selected_group_names(company_data: Dict, selection) -> Set[str]:
+    """Get the groups that belong only to a subset selection
+
+    These are the groups of the selected projects and departments. Groups
+    shared with the rest of the company are never included.
+    """
+    groups = {f"Group Project {project.get('number', 'unknown')}"
+              for project in selected_projects(company_data, selection).values()}
+    for dept in selection.department_names(company_data):
+        groups.add(f"Group {dept} Users")
+        groups.update(f"Group {dept} {level}" for level in ['Executive', 'Director', 'Manager', 'Individual'])
+    return groups
+
+def cleanup_ad(company_data: Dict, dry_run: bool = False, verbose: bool = False,
+               users_only: bool = False, groups_only: bool = False, store=None, selection=None) -> None:
+    """Delete the users and groups of the simulated company, or of a selection, updating the state store"""
+    users_deleted = 0
+    groups_deleted = 0
+    
+    # Delete users if not groups-only
+    if not groups_only:
+        print("\nProcessing users...")
+        users = selected_users(company_data, selection)
+        for user_data in users.values():
+            name_parts = user_data['name'].lower().split()
+            username = f"{name_parts[0]}_{name_parts[-1]}"
+            if delete_user(username, dry_run, verbose):
+                users_deleted += 1
+                if store and not dry_run:
+                    store.remove_ad_user(username)
+    
+    # Delete groups if not users-only
+    if not users_only:
+        print("\nProcessing groups...")
+        groups = get_selected_group_names(company_data, selection) if selection else get_all_group_names(company_data)
+        for group in groups:
+            if delete_group(group, dry_run, verbose):
+                groups_deleted += 1
+                if store and not dry_run:
+                    store.remove_ad_group(group)
+    
+    # Print summary
+    print(f"\nCleanup {'simulation' if dry_run else 'operation'} complete:")
+    if not groups_only:
+        print(f"- Users {'would be' if dry_run else ''} deleted: {users_deleted}")
+        print(f"- Total users processed: {len(users)}")
+    if not users_only:
+        print(f"- Groups {'would be' if dry_run else ''} deleted: {groups_deleted}")
+
 def main():
     """Main function to clean up users and groups"""
     args = parse_arguments()
@@ -233,34 +290,11 @@ def main():
         
         print(f"\nLoading company data from {args.file}...")
         company_data = load_company_data(args.file)
-        
-        users_deleted = 0
-        groups_deleted = 0
-        
-        # Delete users if not groups-only
-        if not args.groups_only:
-            print("\nProcessing users...")
-            for user_data in company_data['users'].values():
-                name_parts = user_data['name'].lower().split()
-                username = f"{name_parts[0]}_{name_parts[-1]}"
-                if delete_user(username, args.dry_run, args.verbose):
-                    users_deleted += 1
-        
-        # Delete groups if not users-only
-        if not args.users_only:
-            print("\nProcessing groups...")
-            groups = get_all_group_names(company_data)
-            for group in groups:
-                if delete_group(group, args.dry_run, args.verbose):
-                    groups_deleted += 1
-        
-        # Print summary
-        print(f"\nCleanup {'simulation' if args.dry_run else 'operation'} complete:")
-        if not args.groups_only:
-            print(f"- Users {'would be' if args.dry_run else ''} deleted: {users_deleted}")
-            print(f"- Total users processed: {len(company_data['users'])}")
-        if not args.users_only:
-            print(f"- Groups {'would be' if args.dry_run else ''} deleted: {groups_deleted}")
+        store = None if args.dry_run else store_from_args(args)
+        cleanup_ad(company_data, args.dry_run, args.verbose, args.users_only, args.groups_only, store,
+                   selection_from_args(args))
+        if store:
+            store.close()
         
     except Exception as e:
         print(f"Error during cleanup: {str(e)}")
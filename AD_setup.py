@@ -14,6 +14,10 @@ Options:
     --verbose, -v       Enable detailed output during execution
     --skip-groups       Skip the creation of AD groups
     --skip-users        Skip the creation of AD users
+    --state-db FILE     Record created users and groups in this store (default: simulation_state.db)
+    --users/--departments/--projects/--roles
+                        Only create the selected users and their project and department groups
+                        (see subset_selectors.py); shared groups come from a full run
 
 The input JSON file should contain:
 - users: Dictionary of user information including name, role, department, and project assignments
@@ -32,8 +36,10 @@ import win32netcon
 import win32api
 import win32con
 from typing import Dict, Optional, Set
-import subprocess
 import argparse
+from command_runner import get_command_runner
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_users, selected_projects
 
 # Global variables
 all_users = {}
@@ -293,6 +299,22 @@ def get_required_groups(company_data: Dict) -> Set[str]:
     
     return all_groups
 
+def get_selected_groups(company_data: Dict, selection) -> Set[str]:
+    """Return the project and department groups belonging to a subset selection"""
+    projects = company_data.get('projects', {})
+    project_ids = set(selected_projects(company_data, selection))
+    departments = set(selection.department_names(company_data) or ())
+    for user_data in selected_users(company_data, selection).values():
+        project_ids.update(project_id for project_id in user_data.get('assigned_projects', [])
+                           if project_id in projects)
+        if user_data.get('department'):
+            departments.add(user_data['department'])
+    groups = {f"Group Project {projects[project_id].get('number', 'unknown')}" for project_id in project_ids}
+    for dept in departments:
+        groups.add(f"Group {dept} Users")
+        groups.update(f"Group {dept} {level}" for level in ['Executive', 'Director', 'Manager', 'Individual'])
+    return groups
+
 def create_ad_user(user_data: Dict, dry_run: bool = False, domain: Optional[str] = None) -> bool:
     """Create an Active Directory user with the specified attributes"""
     name_parts = user_data['name'].lower().split()
@@ -324,13 +346,10 @@ def create_ad_user(user_data: Dict, dry_run: bool = False, domain: Optional[str]
         # Create the user account
         win32net.NetUserAdd(None, 1, user_info)
         
-        # Set password to never expire using net user command
-        subprocess.run(['net', 'user', username, '/passwordchg:no'], check=True)
-        subprocess.run(['net', 'user', username, '/expires:never'], check=True)
-        
-        # Set user full name using net user command
-        subprocess.run(['net', 'user', username, '/fullname:' + user_data['true_name']], 
-                      check=True, encoding='utf-8', errors='replace')
+        # Set password to never expire and the user's full name in one net user call,
+        # since separate calls would race on the same account
+        get_command_runner().run(['net', 'user', username, '/passwordchg:no', '/expires:never',
+                                  '/fullname:' + user_data['true_name']], check=True)
         
         # Get the specific groups this user should be in
         company_data = {
@@ -386,6 +405,78 @@ def create_ad_user(user_data: Dict, dry_run: bool = False, domain: Optional[str]
         print(f"Error creating user {username}: {str(e)}")
         return False
 
+def setup_ad(company_data: Dict, dry_run: bool = False, verbose: bool = False,
+             skip_groups: bool = False, skip_users: bool = False, store=None, selection=None) -> None:
+    """Create the groups and users of the simulated company, or of a selection, recording them in the state store"""
+    # Store all users for manager lookup
+    global all_users
+    all_users = company_data['users']
+    
+    # Store all projects for group creation
+    global all_projects
+    all_projects = company_data.get('projects', {})
+    
+    if verbose:
+        if not all_projects:
+            print("\nWarning: No projects found in company_data.json")
+        else:
+            print(f"\nLoaded {len(all_projects)} projects")
+    
+    # Store all groups that will be created
+    global all_possible_groups
+    
+    # Get list of users we'll create
+    all_users_list = list(selected_users(company_data, selection).items())
+    
+    if verbose:
+        print(f"\nWill {'simulate' if dry_run else 'create'} {len(all_users_list)} users and their associated groups...")
+    
+    if not skip_groups:
+        # Create required groups first
+        if verbose:
+            print("\nCreating required groups...")
+        required_groups = get_required_groups(company_data)
+        all_possible_groups = required_groups.copy()
+        
+        # Add project groups
+        if verbose:
+            print("\nCollecting project groups...")
+        for project_id, project in all_projects.items():
+            project_number = project.get('number', 'unknown')
+            project_group = f"Group Project {project_number}"
+            all_possible_groups.add(project_group)
+            if verbose:
+                print(f"  Added {project_group}")
+        
+        # Memberships are checked against every group; a selection only creates its own
+        groups_to_create = get_selected_groups(company_data, selection) if selection else all_possible_groups
+        
+        if verbose:
+            print(f"\nTotal groups to {'simulate' if dry_run else 'create'}: {len(groups_to_create)}")
+        
+        for group in groups_to_create:
+            if create_ad_group(group, dry_run=dry_run):
+                if store and not dry_run:
+                    store.record_ad_group(group)
+                if verbose:
+                    print(f"Successfully {'simulated' if dry_run else 'created'} group: {group}")
+            else:
+                print(f"Failed to {'simulate' if dry_run else 'create'} group: {group}")
+    
+    if not skip_users:
+        # Create users
+        if verbose:
+            print("\nCreating users...")
+        success_count = 0
+        for user_id, user_data in all_users_list:
+            if create_ad_user(user_data, dry_run=dry_run):
+                success_count += 1
+                if store and not dry_run:
+                    store.record_ad_user(user_data)
+        
+        if verbose:
+            print(f"\n{'Simulated' if dry_run else 'Created'} {success_count} of {len(all_users_list)} users successfully")
+
 def main():
     parser = argparse.ArgumentParser(description='Setup Active Directory users and groups')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done without making changes')
@@ -393,73 +484,19 @@ def main():
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
     parser.add_argument('--skip-groups', action='store_true', help='Skip group creation')
     parser.add_argument('--skip-users', action='store_true', help='Skip user creation')
+    add_store_arguments(parser)
+    add_selector_arguments(parser)
     args = parser.parse_args()
 
     try:
         # Load company data
         company_data = load_company_data(args.data_file)
         
-        # Store all users for manager lookup
-        global all_users
-        all_users = company_data['users']
-        
-        # Store all projects for group creation
-        global all_projects
-        all_projects = company_data.get('projects', {})
-        
-        if args.verbose:
-            if not all_projects:
-                print("\nWarning: No projects found in company_data.json")
-            else:
-                print(f"\nLoaded {len(all_projects)} projects")
-        
-        # Store all groups that will be created
-        global all_possible_groups
-        
-        # Get list of users we'll create
-        all_users_list = list(company_data['users'].items())
-        
-        if args.verbose:
-            print(f"\nWill {'simulate' if args.dry_run else 'create'} {len(all_users_list)} users and their associated groups...")
-        
-        if not args.skip_groups:
-            # Create required groups first
-            if args.verbose:
-                print("\nCreating required groups...")
-            required_groups = get_required_groups(company_data)
-            all_possible_groups = required_groups.copy()
-            
-            # Add project groups
-            if args.verbose:
-                print("\nCollecting project groups...")
-            for project_id, project in all_projects.items():
-                project_number = project.get('number', 'unknown')
-                project_group = f"Group Project {project_number}"
-                all_possible_groups.add(project_group)
-                if args.verbose:
-                    print(f"  Added {project_group}")
-            
-            if args.verbose:
-                print(f"\nTotal groups to {'simulate' if args.dry_run else 'create'}: {len(all_possible_groups)}")
-            
-            for group in all_possible_groups:
-                if create_ad_group(group, dry_run=args.dry_run):
-                    if args.verbose:
-                        print(f"Successfully {'simulated' if args.dry_run else 'created'} group: {group}")
-                else:
-                    print(f"Failed to {'simulate' if args.dry_run else 'create'} group: {group}")
-        
-        if not args.skip_users:
-            # Create users
-            if args.verbose:
-                print("\nCreating users...")
-            success_count = 0
-            for user_id, user_data in all_users_list:
-                if create_ad_user(user_data, dry_run=args.dry_run):
-                    success_count += 1
-            
-            if args.verbose:
-                print(f"\n{'Simulated' if args.dry_run else 'Created'} {success_count} of {len(all_users_list)} users successfully")
+        store = None if args.dry_run else store_from_args(args, company_data)
+        setup_ad(company_data, args.dry_run, args.verbose, args.skip_groups, args.skip_users, store,
+                 selection_from_args(args))
+        if store:
+            store.close()
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -1,62 +1,34 @@
 import json
-import os
-from pathlib import Path
-import random
-import subprocess
-import platform
 import datetime
-import hashlib
+import argparse
+from file_factory import add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_projects, is_department_selected
+from seeds import unit_rng, add_seed_arguments, set_company_seed
+from file_dates import AGE_PROFILES, hash_timestamper, add_date_arguments, parse_age_profiles
+from populate_plan import join_path, plan_dir, plan_file, load_company_data, execute_plan
 
-def load_company_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def get_random_date_between(start_date_str, end_date_str):
-    """Generate a random date between start and end dates"""
+def get_random_date_between(start_date_str, end_date_str, rng):
+    """Generate a random date between start and end dates from rng"""
     start = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
     end = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
     days_between = (end - start).days
-    random_days = random.randint(0, days_between)
+    random_days = rng.randint(0, days_between)
     return start + datetime.timedelta(days=random_days)
 
-def set_file_dates(file_path, start_date, end_date):
-    """Set consistent modification and access times for a file"""
-    # Use defaults if dates are missing
+def get_file_timestamp(start_date, end_date, rng):
+    """Pick a modification time for a file between two dates"""
+    # Use the default project timeline if dates are missing
     if not start_date or not end_date:
-        current_year = datetime.datetime.now().year
-        start_date = f"{current_year-1}-01-01"
-        end_date = f"{current_year+1}-12-31"
+        start_date = AGE_PROFILES['project']['start']
+        end_date = AGE_PROFILES['project']['end']
     
-    date = get_random_date_between(start_date, end_date)
-    timestamp = date.timestamp()
-    os.utime(file_path, (timestamp, timestamp))
-
-def create_large_file(file_path, size):
-    """Create a large file filled with zeros using the most efficient method for the OS"""
-    system = platform.system().lower()
-    try:
-        if system == 'linux':
-            subprocess.run(['fallocate', '-l', str(size), str(file_path)], check=True)
-        elif system == 'windows':
-            try:
-                subprocess.run(['fsutil', 'file', 'createnew', str(file_path), str(size)], check=True)
-            except subprocess.SubprocessError:
-                with open(file_path, 'wb') as f:
-                    f.seek(size - 1)
-                    f.write(b'\0')
-        else:
-            with open(file_path, 'wb') as f:
-                f.seek(size - 1)
-                f.write(b'\0')
-        return True
-    except Exception as e:
-        print(f"Error creating file {file_path}: {e}")
-        return False
+    return get_random_date_between(start_date, end_date, rng).timestamp()
 
 def get_project_files_by_technology(technologies):
     """Return typical files based on the technologies used"""
-    files = []
-    
     # Common project files regardless of technology
     base_files = [
         ('README.md', 50_000),
@@ -70,11 +42,11 @@ def get_project_files_by_technology(technologies):
         ('CHANGELOG.md', 100_000)
     ]
     
-    files.extend(base_files)
+    yield from base_files
     
     for tech in technologies:
         if tech in ['Python', 'Django', 'Flask']:
-            files.extend([
+            yield from [
                 ('src/main.py', 2_500_000),
                 ('src/utils.py', 1_500_000),
                 ('src/config.py', 800_000),
@@ -97,9 +69,9 @@ def get_project_files_by_technology(technologies):
                 ('scripts/setup.sh', 20_000),
                 ('scripts/deploy.sh', 25_000),
                 ('logs/app.log', 50_000_000)
-            ])
+            ]
         elif tech in ['Java', 'Spring']:
-            files.extend([
+            yield from [
                 ('src/main/java/com/company/app/', 0),
                 ('src/main/java/com/company/app/Application.java', 2_500_000),
                 ('src/main/java/com/company/app/config/', 0),
@@ -120,9 +92,9 @@ def get_project_files_by_technology(technologies):
                 ('mvnw.cmd', 85_000),
                 ('.mvn/wrapper/', 0),
                 ('logs/spring.log', 75_000_000)
-            ])
+            ]
         elif tech in ['JavaScript', 'React', 'Angular']:
-            files.extend([
+            yield from [
                 ('src/app.js', 3_000_000),
                 ('src/components/', 0),
                 ('src/containers/', 0),
@@ -144,9 +116,9 @@ def get_project_files_by_technology(technologies):
                 ('jest.config.js', 45_000),
                 ('cypress/integration/', 0),
                 ('coverage/lcov-report/', 0)
-            ])
+            ]
         elif tech in ['C#', '.NET']:
-            files.extend([
+            yield from [
                 ('src/Program.cs', 2_500_000),
                 ('src/Startup.cs', 3_500_000),
                 ('src/appsettings.json', 250_000),
@@ -165,9 +137,9 @@ def get_project_files_by_technology(technologies):
                 ('app.csproj', 150_000),
                 ('app.sln', 50_000),
                 ('nuget.config', 25_000)
-            ])
+            ]
         elif tech in ['Machine Learning', 'TensorFlow', 'PyTorch']:
-            files.extend([
+            yield from [
                 ('models/model_v1.h5', 850_000_000),
                 ('models/model_v2.h5', 950_000_000),
                 ('models/checkpoints/', 0),
@@ -187,9 +159,9 @@ def get_project_files_by_technology(technologies):
                 ('logs/tensorboard/', 0),
                 ('logs/training.log', 150_000_000),
                 ('requirements-gpu.txt', 75_000)
-            ])
+            ]
             if tech in ['Cloud', 'AWS', 'Azure']:
-                files.extend([
+                yield from [
                     ('terraform/', 0),
                     ('terraform/main.tf', 1_500_000),
                     ('terraform/variables.tf', 500_000),
@@ -206,9 +178,9 @@ def get_project_files_by_technology(technologies):
                     ('monitoring/prometheus/', 0),
                     ('.aws/config', 15_000),
                     ('azure-pipelines.yml', 85_000)
-                ])
+                ]
         elif tech in ['Cloud', 'AWS', 'Azure']:
-            files.extend([
+            yield from [
                 ('terraform/', 0),
                 ('terraform/main.tf', 1_500_000),
                 ('terraform/variables.tf', 500_000),
@@ -225,151 +197,149 @@ def get_project_files_by_technology(technologies):
                 ('monitoring/prometheus/', 0),
                 ('.aws/config', 15_000),
                 ('azure-pipelines.yml', 85_000)
-            ])
-    
-    return files
+            ]
 
 def get_management_files_by_department(department, technologies):
     """Return typical management files based on department and technologies"""
-    files = []
-    
-    base_files = [
+    yield from [
         ('Reports/quarterly_summary.pptx', 15_000_000),
         ('Reports/annual_review.docx', 8_000_000),
         ('Planning/roadmap.xlsx', 5_000_000)
     ]
     
     if department == 'IT':
-        files.extend([
+        yield from [
             ('Infrastructure/network_diagram.vsdx', 20_000_000),
             ('Security/security_audit.pdf', 12_000_000),
             ('Systems/inventory.xlsx', 8_000_000)
-        ])
+        ]
     elif department == 'Engineering':
-        files.extend([
+        yield from [
             ('Architecture/system_design.vsdx', 25_000_000),
             ('Standards/coding_guidelines.pdf', 10_000_000),
             ('Reviews/code_review_template.docx', 5_000_000)
-        ])
+        ]
     elif department == 'Operations':
-        files.extend([
+        yield from [
             ('Procedures/sop.pdf', 15_000_000),
             ('Monitoring/dashboard_config.json', 2_000_000),
             ('Incidents/report_template.docx', 5_000_000)
-        ])
+        ]
     
     # Add technology-specific files
     for tech in technologies:
         if tech in ['Machine Learning', 'AI']:
-            files.extend([
+            yield from [
                 ('Models/performance_metrics.xlsx', 10_000_000),
                 ('Data/validation_results.csv', 20_000_000)
-            ])
+            ]
         elif tech in ['Cloud', 'AWS', 'Azure']:
-            files.extend([
+            yield from [
                 ('Cloud/architecture.vsdx', 15_000_000),
                 ('Cloud/cost_analysis.xlsx', 8_000_000)
-            ])
+            ]
+
+def validate_project_dates(company_data):
+    """Fill in default dates for projects that are missing them"""
+    default_start = AGE_PROFILES['project']['start']
+    default_end = AGE_PROFILES['project']['end']
+    
+    for project_id, project in company_data['projects'].items():
+        if not project.get('start_date'):
+            print(f"Warning: Project {project.get('number', 'unknown')} missing start_date, using default")
+            project['start_date'] = default_start
+        if not project.get('end_date'):
+            print(f"Warning: Project {project.get('number', 'unknown')} missing end_date, using default")
+            project['end_date'] = default_end
+
+def plan_project(project):
+    """Plan the files of a single project directory, staying within its quota"""
+    project_number = project.get('number', 'unknown')
+    owner = f"Group Project {project_number}"
+    project_dir = join_path('Projects', project_number)
+    yield plan_dir('G', project_dir, owner, 'project')
+    rng = unit_rng('project', project_number)
+    
+    # Calculate maximum allowed size (50-80% of quota)
+    quota_bytes = project['quota_gb'] * 1024 * 1024 * 1024
+    max_size = int(quota_bytes * rng.uniform(0.5, 0.8))
+    current_size = 0
+    
+    # Get project files based on technologies
+    project_files = get_project_files_by_technology(project['likely_technologies'])
+    
+    for file_path, size in project_files:
+        if current_size + size > max_size:
+            continue
+        
+        full_path = join_path(project_dir, file_path)
+        if size > 0:
+            current_size += size
+            # Set file date within project timeline
+            timestamp = get_file_timestamp(project['start_date'], project['end_date'], rng.child(full_path))
+            yield plan_file('G', full_path, size, timestamp, owner, 'project')
+        else:
+            yield plan_dir('G', full_path, owner, 'project')
+
+def plan_management(dept, users):
+    """Plan the management files of a single department"""
+    owner = "Group Management"
+    dept_dir = join_path('Management', dept)
+    yield plan_dir('G', dept_dir, owner, 'management')
+    
+    # Collect all technologies used in department
+    dept_technologies = set()
+    for user in users:
+        dept_technologies.update(user['current_technologies'])
+    
+    # Set file dates within the last year of the simulated timeline
+    get_timestamp = hash_timestamper('management')
+    
+    for file_path, size in get_management_files_by_department(dept, dept_technologies):
+        full_path = join_path(dept_dir, file_path)
+        yield plan_file('G', full_path, size, get_timestamp(full_path), owner, 'management')
+
+def plan_g_drive(company_data, selection=None):
+    """Plan the project and management files of the G drive, or of the selected projects and departments"""
+    validate_project_dates(company_data)
+    
+    # Create main directories
+    yield plan_dir('G', 'Projects', None, 'project')
+    yield plan_dir('G', 'Management', None, 'management')
     
-    return base_files + files
+    # Process each project
+    for project in selected_projects(company_data, selection).values():
+        yield from plan_project(project)
+    
+    # Process management directories, always planned from the whole department
+    for dept, users in get_department_users(company_data).items():
+        if is_department_selected(company_data, dept, selection):
+            yield from plan_management(dept, users)
 
-def simulate_g_drive():
+def simulate_g_drive(factory=None, company_data=None, executor=None, journal=None, store=None, selection=None):
     """Simulate G drive structure with project and management files"""
     try:
         # Load company data
-        try:
-            company_data = load_company_data('company_data.json')
-            print(f"\nLoaded company data with {len(company_data['users'])} users and {len(company_data['projects'])} projects")
-        except FileNotFoundError:
-            print("Error: company_data.json not found. Please run generate_new_company.py first.")
-            return
-        except json.JSONDecodeError:
-            print("Error: company_data.json is not valid JSON. Please check the file.")
-            return
-        except UnicodeDecodeError:
-            print("Error: company_data.json contains invalid characters. Please ensure it's saved as UTF-8.")
-            return
-        
-        # Validate project dates
-        current_year = datetime.datetime.now().year
-        default_start = f"{current_year-1}-01-01"
-        default_end = f"{current_year+1}-12-31"
-        
-        for project_id, project in company_data['projects'].items():
-            if not project.get('start_date'):
-                print(f"Warning: Project {project.get('number', 'unknown')} missing start_date, using default")
-                project['start_date'] = default_start
-            if not project.get('end_date'):
-                print(f"Warning: Project {project.get('number', 'unknown')} missing end_date, using default")
-                project['end_date'] = default_end
-        
-        # Create G: drive root
-        g_drive = Path('G:')
-        if not g_drive.exists():
-            print("Note: Creating simulation in current directory as 'G_Drive' since we can't create actual G: drive")
-            g_drive = Path('G_Drive')
-        
-        # Create main directories
-        projects_dir = g_drive / 'Projects'
-        management_dir = g_drive / 'Management'
-        projects_dir.mkdir(parents=True, exist_ok=True)
-        management_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Process each project
-        print("\nPopulating project directories...")
-        for project_id, project in company_data['projects'].items():
-            project_number = project.get('number', 'unknown')
-            project_dir = projects_dir / project_number
-            project_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Calculate maximum allowed size (50-80% of quota)
-            quota_bytes = project['quota_gb'] * 1024 * 1024 * 1024
-            max_size = int(quota_bytes * random.uniform(0.5, 0.8))
-            current_size = 0
-            
-            # Get project files based on technologies
-            project_files = get_project_files_by_technology(project['likely_technologies'])
-            
-            # Create project files
-            for file_path, size in project_files:
-                if current_size + size > max_size:
-                    continue
-                    
-                full_path = project_dir / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                if size > 0:  # Skip directories (size = 0)
-                    if create_large_file(full_path, size):
-                        current_size += size
-                        # Set file date within project timeline
-                        set_file_dates(full_path, project['start_date'], project['end_date'])
-            
-            print(f"Created project files for {project_number}: {current_size / (1024*1024*1024):.2f}GB of {project['quota_gb']}GB quota")
+        if company_data is None:
+            try:
+                company_data = load_company_data('company_data.json')
+                print(f"\nLoaded company data with {len(company_data['users'])} users and {len(company_data['projects'])} projects")
+            except FileNotFoundError:
+                print("Error: company_data.json not found. Please run generate_new_company.py first.")
+                return
+            except json.JSONDecodeError:
+                print("Error: company_data.json is not valid JSON. Please check the file.")
+                return
+            except UnicodeDecodeError:
+                print("Error: company_data.json contains invalid characters. Please ensure it's saved as UTF-8.")
+                return
         
-        # Process management directories
-        print("\nPopulating management directories...")
-        for dept, users in get_department_users(company_data).items():
-            dept_dir = management_dir / dept
-            dept_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Collect all technologies used in department
-            dept_technologies = set()
-            for user in users:
-                dept_technologies.update(user['current_technologies'])
-            
-            # Get and create management files
-            mgmt_files = get_management_files_by_department(dept, dept_technologies)
-            for file_path, size in mgmt_files:
-                full_path = dept_dir / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                if create_large_file(full_path, size):
-                    # Set file date within last year
-                    end_date = datetime.datetime.now().strftime("%Y-%m-%d")
-                    start_date = (datetime.datetime.now() - datetime.timedelta(days=365)).strftime("%Y-%m-%d")
-                    set_file_dates(full_path, start_date, end_date)
-            
-            print(f"Created management files for {dept}")
+        if store:
+            store.record_company(company_data)
+        print("\nPopulating project and management directories...")
+        stats = execute_plan(plan_g_drive(company_data, selection), factory=factory, executor=executor,
+                             journal=journal, store=store)
+        print(f"Created G drive files: {stats.summary()}")
     except Exception as e:
         print(f"Error simulating G drive: {e}")
 
@@ -383,5 +353,24 @@ def get_department_users(company_data):
         departments[dept].append(user)
     return departments
 
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate G drive project and management directories')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'G_drive_populate')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    add_selector_arguments(parser)
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    simulate_g_drive() 
\ No newline at end of file
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    store = store_from_args(args)
+    simulate_g_drive(factory_from_args(args), executor=executor_from_args(args),
+                     journal=journal_from_args(args), store=store, selection=selection_from_args(args))
+    if store:
+        store.close() 
\ No newline at end of file
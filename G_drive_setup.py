@@ -17,6 +17,9 @@ Options:
     --skip-projects     Skip creation of project directories
     --skip-departments  Skip creation of department directories
     --verbose, -v       Enable detailed output during execution
+    --state-db FILE     State store recording the directories (default: simulation_state.db)
+    --users/--departments/--projects/--roles
+                        Only set up the selected departments and projects (see subset_selectors.py)
 
 The input JSON file should contain:
 - users: Dictionary of user information including department assignments
@@ -42,8 +45,11 @@ import win32file
 import win32con
 import win32net
 import ntsecuritycon as con
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 import argparse
+from populate_plan import plan_dir
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_projects
 
 # Define management directory structure and groups
 MANAGEMENT_DIRS = {
@@ -191,14 +197,28 @@ def setup_folder_permissions(path: Path, groups: Dict[str, int], dry_run: bool =
         raise  # Re-raise to see full error details
 
 def setup_g_drive(company_data: Dict, base_path: str = "G:", dry_run: bool = False, 
-                 skip_projects: bool = False, skip_departments: bool = False) -> None:
-    """Set up G drive structure with proper permissions"""
+                 skip_projects: bool = False, skip_departments: bool = False, selection=None,
+                 store=None) -> None:
+    """Set up G drive structure with proper permissions
+
+    With a selection, only the selected departments and projects are set up
+    and the shared base and management directories are left alone. Every
+    directory set up is recorded in the state store, when one is given.
+    """
     # Get unique departments from user data
-    departments = {user['department'] for user in company_data['users'].values() 
-                  if user.get('department')}
+    if selection:
+        departments = selection.department_names(company_data)
+    else:
+        departments = {user['department'] for user in company_data['users'].values() 
+                      if user.get('department')}
     print(f"\nFound departments: {sorted(departments)}")
     
     base = Path(base_path)
+
+    def setup(path: Path, groups: Dict[str, int], owner: str, profile: Optional[str]) -> None:
+        setup_folder_permissions(path, groups, dry_run)
+        if store and not dry_run:
+            store.record(plan_dir('G', path.relative_to(base).as_posix(), owner, profile))
     
     # Define standard permission masks
     FULL_CONTROL = con.FILE_ALL_ACCESS
@@ -231,8 +251,9 @@ def setup_g_drive(company_data: Dict, base_path: str = "G:", dry_run: bool = Fal
     }
 
     # Set up base directories
-    for dir_name, groups in directories.items():
-        setup_folder_permissions(base / dir_name, groups, dry_run)
+    if not selection:
+        for dir_name, groups in directories.items():
+            setup(base / dir_name, groups, "Group Management", None)
 
     if not skip_departments:
         print("\nSetting up department directories...")
@@ -247,12 +268,12 @@ def setup_g_drive(company_data: Dict, base_path: str = "G:", dry_run: bool = Fal
                 f"Group {dept} Manager": MODIFY,
                 f"Group {dept} Individual": MODIFY
             }
-            setup_folder_permissions(dept_path, dept_groups, dry_run)
+            setup(dept_path, dept_groups, f"Group {dept} Users", 'department')
 
     if not skip_projects:
         print("\nSetting up project directories...")
         # Set up project directories
-        for project_id, project in company_data.get('projects', {}).items():
+        for project_id, project in selected_projects(company_data, selection).items():
             project_number = project.get('number', 'unknown')
             project_path = base / "Projects" / project_number
             
@@ -262,12 +283,15 @@ def setup_g_drive(company_data: Dict, base_path: str = "G:", dry_run: bool = Fal
             }
 
             print(f"Creating project directory: {project_number}")
-            setup_folder_permissions(project_path, project_groups, dry_run)
+            setup(project_path, project_groups, f"Group Project {project_number}", 'project')
 
             # Create standard project subdirectories
             subdirs = ["Documentation", "Source", "Resources", "Deliverables"]
             for subdir in subdirs:
-                setup_folder_permissions(project_path / subdir, project_groups, dry_run)
+                setup(project_path / subdir, project_groups, f"Group Project {project_number}", 'project')
+
+    if selection:
+        return
 
     # Set up management directories
     print("\nSetting up management directories...")
@@ -275,7 +299,7 @@ def setup_g_drive(company_data: Dict, base_path: str = "G:", dry_run: bool = Fal
         dir_path = base / "Management" / dir_name
         dir_groups = {group: FULL_CONTROL for group in groups}
         print(f"Creating management directory: {dir_name} with {len(groups)} group permissions")
-        setup_folder_permissions(dir_path, dir_groups, dry_run)
+        setup(dir_path, dir_groups, "Group Management", 'management')
 
 def main():
     parser = argparse.ArgumentParser(description='Set up G drive structure with proper permissions')
@@ -291,6 +315,8 @@ def main():
                        help='Skip creation of department directories')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Enable verbose output')
+    add_store_arguments(parser)
+    add_selector_arguments(parser)
     args = parser.parse_args()
 
     try:
@@ -338,8 +364,13 @@ def main():
             print("Note: G: drive not available, creating in current directory as G_Drive")
             base_path = 'G_Drive'
             
-        setup_g_drive(company_data, base_path, args.dry_run, 
-                     args.skip_projects, args.skip_departments)
+        store = None if args.dry_run else store_from_args(args, company_data)
+        try:
+            setup_g_drive(company_data, base_path, args.dry_run,
+                          args.skip_projects, args.skip_departments, selection_from_args(args), store)
+        finally:
+            if store:
+                store.close()
         
         if args.verbose and not args.dry_run:
             print("\nVerifying directory structure...")
@@ -1,13 +1,13 @@
-import json
-import os
 from pathlib import Path
-import random
-import subprocess
-import platform
-
-def load_company_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+import itertools
+import argparse
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_users
+from populate_plan import get_username, join_path, plan_dir, plan_file, load_company_data, execute_plan
+from seeds import user_rng, add_seed_arguments, set_company_seed
 
 def create_app_directories():
     """Create standard application directories that might exist"""
@@ -42,23 +42,23 @@ def create_app_directories():
         'VMware': 'Documents/Virtual Machines',
     }
 
-def get_random_date_2024():
-    """Generate a random date in 2024"""
-    month = random.randint(1, 12)
-    day = random.randint(1, 28)  # Using 28 to be safe for all months
+def get_random_date_2024(rng):
+    """Generate a random date in 2024 from rng"""
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)  # Using 28 to be safe for all months
     return f"2024_{month:02d}_{day:02d}"
 
-def get_random_version():
-    """Generate a random version string"""
+def get_random_version(rng):
+    """Generate a random version string from rng"""
     patterns = [
-        f"v{random.randint(1,9)}.{random.randint(0,9)}.{random.randint(0,9)}",
-        f"rev_{random.randint(100,999)}",
-        f"build_{random.randint(1000,9999)}",
-        f"_{get_random_date_2024()}"
+        f"v{rng.randint(1,9)}.{rng.randint(0,9)}.{rng.randint(0,9)}",
+        f"rev_{rng.randint(100,999)}",
+        f"build_{rng.randint(1000,9999)}",
+        f"_{get_random_date_2024(rng)}"
     ]
-    return random.choice(patterns)
+    return rng.choice(patterns)
 
-def get_typical_files():
+def get_typical_files(rng):
     """Return dictionary of typical files for each application with typical sizes in bytes"""
     project_types = ["Internal", "Client", "POC", "MVP", "Phase1", "Phase2"]
     client_names = ["Acme", "GlobalTech", "InnovaCorp", "TechDynamics", "FutureScale"]
@@ -66,20 +66,20 @@ def get_typical_files():
     
     return {
         'ATS Systems': [
-            (f'candidate_profiles_{get_random_date_2024()}.db', 50_000_000),
-            (f'interview_schedules_Q{random.randint(1,4)}_2024.xlsx', 2_000_000),
-            (f'recruitment_metrics_{random.choice(departments)}_{get_random_date_2024()}.pdf', 500_000),
-            (f'talent_pipeline_{get_random_date_2024()}.xlsx', 3_000_000),
-            (f'hiring_forecast_2024_Q{random.randint(1,4)}.pdf', 1_500_000),
+            (f'candidate_profiles_{get_random_date_2024(rng)}.db', 50_000_000),
+            (f'interview_schedules_Q{rng.randint(1,4)}_2024.xlsx', 2_000_000),
+            (f'recruitment_metrics_{rng.choice(departments)}_{get_random_date_2024(rng)}.pdf', 500_000),
+            (f'talent_pipeline_{get_random_date_2024(rng)}.xlsx', 3_000_000),
+            (f'hiring_forecast_2024_Q{rng.randint(1,4)}.pdf', 1_500_000),
         ],
         'Adobe Creative Suite': [
-            (f'corporate_branding_{get_random_date_2024()}.psd', 120_000_000),
-            (f'{random.choice(client_names)}_Presentation_{get_random_date_2024()}.psd', 85_000_000),
-            (f'Product_Launch_{random.choice(project_types)}_{get_random_version()}.ai', 40_000_000),
-            (f'Social_Media_Assets_{get_random_date_2024()}.psd', 65_000_000),
-            (f'Website_Mockup_v{random.randint(1,5)}.xd', 30_000_000),
-            (f'Brand_Guidelines_{get_random_version()}.indd', 25_000_000),
-            (f'Newsletter_Template_Q{random.randint(1,4)}_2024.indd', 15_000_000),
+            (f'corporate_branding_{get_random_date_2024(rng)}.psd', 120_000_000),
+            (f'{rng.choice(client_names)}_Presentation_{get_random_date_2024(rng)}.psd', 85_000_000),
+            (f'Product_Launch_{rng.choice(project_types)}_{get_random_version(rng)}.ai', 40_000_000),
+            (f'Social_Media_Assets_{get_random_date_2024(rng)}.psd', 65_000_000),
+            (f'Website_Mockup_v{rng.randint(1,5)}.xd', 30_000_000),
+            (f'Brand_Guidelines_{get_random_version(rng)}.indd', 25_000_000),
+            (f'Newsletter_Template_Q{rng.randint(1,4)}_2024.indd', 15_000_000),
         ],
         'Angular': [
             ('angular.json', 2_000),
@@ -104,11 +104,11 @@ def get_typical_files():
             ('daemon.json', 1_000),
         ],
         'Excel': [
-            (f'Q{random.randint(1,4)}_2024_Reports.xlsx', 5_000_000),
-            (f'Department_Budget_2024_{random.choice(["Draft", "Final", "Review", "Approved"])}.xlsx', 3_000_000),
-            (f'Project_Tracking_{get_random_date_2024()}.xlsx', 4_000_000),
-            (f'Financial_Analysis_{get_random_date_2024()}.xlsx', 6_000_000),
-            (f'Resource_Planning_2024_Q{random.randint(1,4)}.xlsx', 4_500_000),
+            (f'Q{rng.randint(1,4)}_2024_Reports.xlsx', 5_000_000),
+            (f'Department_Budget_2024_{rng.choice(["Draft", "Final", "Review", "Approved"])}.xlsx', 3_000_000),
+            (f'Project_Tracking_{get_random_date_2024(rng)}.xlsx', 4_000_000),
+            (f'Financial_Analysis_{get_random_date_2024(rng)}.xlsx', 6_000_000),
+            (f'Resource_Planning_2024_Q{rng.randint(1,4)}.xlsx', 4_500_000),
         ],
         'GCP': [
             ('credentials.json', 2_000),
@@ -119,12 +119,12 @@ def get_typical_files():
             ('report_templates.json', 1_000_000),
         ],
         'HRIS': [
-            (f'employee_records_{get_random_date_2024()}.db', 100_000_000),
-            (f'payroll_data_Q{random.randint(1,4)}_2024.xlsx', 10_000_000),
-            (f'attendance_logs_{random.choice(departments)}_{get_random_date_2024()}.db', 50_000_000),
-            (f'benefits_report_{get_random_date_2024()}.xlsx', 15_000_000),
-            (f'performance_reviews_Q{random.randint(1,4)}_2024.xlsx', 25_000_000),
-            (f'training_completion_{get_random_date_2024()}.csv', 8_000_000),
+            (f'employee_records_{get_random_date_2024(rng)}.db', 100_000_000),
+            (f'payroll_data_Q{rng.randint(1,4)}_2024.xlsx', 10_000_000),
+            (f'attendance_logs_{rng.choice(departments)}_{get_random_date_2024(rng)}.db', 50_000_000),
+            (f'benefits_report_{get_random_date_2024(rng)}.xlsx', 15_000_000),
+            (f'performance_reviews_Q{rng.randint(1,4)}_2024.xlsx', 25_000_000),
+            (f'training_completion_{get_random_date_2024(rng)}.csv', 8_000_000),
         ],
         'HubSpot': [
             ('contact_lists.db', 75_000_000),
@@ -147,24 +147,24 @@ def get_typical_files():
             ('credentials.yaml', 1_000),
         ],
         'PowerBI': [
-            (f'Sales_Dashboard_{get_random_date_2024()}.pbix', 50_000_000),
-            (f'Financial_Reports_Q{random.randint(1,4)}_2024.pbix', 75_000_000),
-            (f'Marketing_Analytics_{random.choice(client_names)}.pbix', 60_000_000),
-            (f'KPI_Dashboard_{random.choice(departments)}_{get_random_date_2024()}.pbix', 45_000_000),
-            (f'Performance_Metrics_{get_random_version()}.pbix', 55_000_000),
-            (f'Project_Analytics_{random.choice(project_types)}.pbix', 40_000_000),
+            (f'Sales_Dashboard_{get_random_date_2024(rng)}.pbix', 50_000_000),
+            (f'Financial_Reports_Q{rng.randint(1,4)}_2024.pbix', 75_000_000),
+            (f'Marketing_Analytics_{rng.choice(client_names)}.pbix', 60_000_000),
+            (f'KPI_Dashboard_{rng.choice(departments)}_{get_random_date_2024(rng)}.pbix', 45_000_000),
+            (f'Performance_Metrics_{get_random_version(rng)}.pbix', 55_000_000),
+            (f'Project_Analytics_{rng.choice(project_types)}.pbix', 40_000_000),
         ],
         'PyTorch': [
-            (f'model_checkpoints_{get_random_date_2024()}.pt', 500_000_000),
-            (f'training_logs_{get_random_date_2024()}.txt', 10_000_000),
-            (f'customer_segmentation{get_random_version()}.pt', 750_000_000),
+            (f'model_checkpoints_{get_random_date_2024(rng)}.pt', 500_000_000),
+            (f'training_logs_{get_random_date_2024(rng)}.txt', 10_000_000),
+            (f'customer_segmentation{get_random_version(rng)}.pt', 750_000_000),
             ('sentiment_analysis_bert.pt', 1_200_000_000),
             ('image_classification_resnet50.pt', 900_000_000),
             ('transformer_weights.pt', 2_500_000_000),
             ('lstm_predictions.pt', 300_000_000),
             ('embeddings_cache.pt', 1_500_000_000),
             ('optimizer_state.pt', 200_000_000),
-            (f'experiment_{random.randint(1000,9999)}.pt', 400_000_000),
+            (f'experiment_{rng.randint(1000,9999)}.pt', 400_000_000),
         ],
         'Python': [
             ('venv', 100_000_000),
@@ -188,7 +188,7 @@ def get_typical_files():
             ('regression_models.R', 200_000),
             ('time_series_analysis.R', 250_000),
             ('feature_selection.R', 120_000),
-            (f'experiment_{random.randint(100,999)}.RData', 75_000_000),
+            (f'experiment_{rng.randint(100,999)}.RData', 75_000_000),
             ('processed_data.rds', 500_000_000),
         ],
         'React': [
@@ -197,12 +197,12 @@ def get_typical_files():
             ('build_assets.tar', 100_000_000),
         ],
         'Salesforce': [
-            (f'salesforce_cache_{get_random_date_2024()}.db', 150_000_000),
-            (f'contact_exports_{random.choice(departments)}_{get_random_date_2024()}.csv', 20_000_000),
-            (f'opportunity_reports_Q{random.randint(1,4)}_2024.xlsx', 5_000_000),
-            (f'pipeline_forecast_{get_random_date_2024()}.xlsx', 8_000_000),
-            (f'lead_analysis_{random.choice(client_names)}.xlsx', 6_000_000),
-            (f'campaign_metrics_{get_random_date_2024()}.csv', 15_000_000),
+            (f'salesforce_cache_{get_random_date_2024(rng)}.db', 150_000_000),
+            (f'contact_exports_{rng.choice(departments)}_{get_random_date_2024(rng)}.csv', 20_000_000),
+            (f'opportunity_reports_Q{rng.randint(1,4)}_2024.xlsx', 5_000_000),
+            (f'pipeline_forecast_{get_random_date_2024(rng)}.xlsx', 8_000_000),
+            (f'lead_analysis_{rng.choice(client_names)}.xlsx', 6_000_000),
+            (f'campaign_metrics_{get_random_date_2024(rng)}.csv', 15_000_000),
         ],
         'TensorFlow': [
             ('saved_model.pb', 750_000_000),
@@ -212,7 +212,7 @@ def get_typical_files():
             ('gpt2_medium_weights', 5_500_000_000),
             ('resnet152_imagenet.h5', 900_000_000),
             ('yolov5_weights.h5', 800_000_000),
-            (f'experiment_run_{random.randint(100,999)}.h5', 650_000_000),
+            (f'experiment_run_{rng.randint(100,999)}.h5', 650_000_000),
             ('model_metrics.json', 2_000_000),
             ('dataset_cache.tfrecord', 2_500_000_000),
             ('embeddings.npy', 1_800_000_000),
@@ -237,21 +237,21 @@ def get_typical_files():
             ('Model_Training.ipynb', 8_000_000),
             ('Data_Visualization.ipynb', 6_000_000),
             ('Feature_Engineering.ipynb', 7_000_000),
-            (f'Experiment_{random.randint(1,99)}.ipynb', 10_000_000),
+            (f'Experiment_{rng.randint(1,99)}.ipynb', 10_000_000),
             ('Results_Analysis.ipynb', 4_000_000),
         ],
         'MLflow': [
             ('mlruns/metadata.db', 150_000_000),
             ('mlruns/artifacts.db', 500_000_000),
             ('mlflow.log', 50_000_000),
-            (f'run_{random.randint(10000,99999)}/metrics', 20_000_000),
-            (f'run_{random.randint(10000,99999)}/params', 1_000_000),
+            (f'run_{rng.randint(10000,99999)}/metrics', 20_000_000),
+            (f'run_{rng.randint(10000,99999)}/params', 1_000_000),
         ],
         'Weights & Biases': [
             ('wandb/latest-run/files/config.yaml', 1_000),
             ('wandb/debug.log', 5_000_000),
             ('wandb/run-history.db', 200_000_000),
-            (f'wandb/run-{random.randint(10000,99999)}/files/media', 1_500_000_000),
+            (f'wandb/run-{rng.randint(10000,99999)}/files/media', 1_500_000_000),
         ],
         'DVC': [
             ('.dvc/config', 1_000),
@@ -285,23 +285,23 @@ def get_typical_files():
             ('logs/vmware_network.log', 100_000_000),
         ],
         'Video Projects': [
-            (f'Projects/Corporate_Overview_2024/Corporate_Overview_{get_random_version()}.prproj', 5_000_000),
-            (f'Footage/Corporate_Overview/A_Roll/Interview_CEO_{get_random_date_2024()}.mxf', 450_000_000),
-            (f'Footage/Product_Demo/Take_{random.randint(1,5)}_{get_random_date_2024()}.mxf', 380_000_000),
-            (f'Footage/Customer_Testimonials/Client_{random.randint(1,10)}_{get_random_date_2024()}.mxf', 420_000_000),
+            (f'Projects/Corporate_Overview_2024/Corporate_Overview_{get_random_version(rng)}.prproj', 5_000_000),
+            (f'Footage/Corporate_Overview/A_Roll/Interview_CEO_{get_random_date_2024(rng)}.mxf', 450_000_000),
+            (f'Footage/Product_Demo/Take_{rng.randint(1,5)}_{get_random_date_2024(rng)}.mxf', 380_000_000),
+            (f'Footage/Customer_Testimonials/Client_{rng.randint(1,10)}_{get_random_date_2024(rng)}.mxf', 420_000_000),
         ],
         'Development': [
-            (f'logs/build_{get_random_date_2024()}_{random.randint(100,999)}.log', 250_000_000),
-            (f'logs/deploy_{get_random_date_2024()}_env_{random.choice(["dev", "staging", "prod"])}.log', 180_000_000),
-            (f'logs/test_run_{get_random_date_2024()}_{random.randint(1000,9999)}.xml', 150_000_000),
+            (f'logs/build_{get_random_date_2024(rng)}_{rng.randint(100,999)}.log', 250_000_000),
+            (f'logs/deploy_{get_random_date_2024(rng)}_env_{rng.choice(["dev", "staging", "prod"])}.log', 180_000_000),
+            (f'logs/test_run_{get_random_date_2024(rng)}_{rng.randint(1000,9999)}.xml', 150_000_000),
         ],
         'AI Models': [
             # Model checkpoints (50-200MB)
-            (f'models/finetuned/checkpoint_{get_random_date_2024()}_epoch_{random.randint(1,100)}.pth', 150_000_000),
+            (f'models/finetuned/checkpoint_{get_random_date_2024(rng)}_epoch_{rng.randint(1,100)}.pth', 150_000_000),
             # Exported models (100-500MB)
-            (f'models/custom/company_model_{get_random_version()}.safetensors', 250_000_000),
+            (f'models/custom/company_model_{get_random_version(rng)}.safetensors', 250_000_000),
             # ONNX models (50-150MB)
-            (f'models/experiments/run_{get_random_date_2024()}_{random.randint(1000,9999)}.onnx', 100_000_000),
+            (f'models/experiments/run_{get_random_date_2024(rng)}_{rng.randint(1000,9999)}.onnx', 100_000_000),
             # Large Language Models (25-100GB)
             ('models/llm/llama2_70b_finetuned.pth', 15_000_000_000),  # 15GB
             ('models/llm/mistral_7b_company_finetuned.pth', 6_000_000_000),  # 6GB
@@ -321,16 +321,16 @@ def get_typical_files():
         ],
     }
 
-def get_random_file_size(base_size):
+def get_random_file_size(base_size, rng):
     """
     Generate a random file size based on a typical size.
     Has a 10% chance of creating a 'monster' file that's 100x larger.
     Otherwise varies between 0.5x and 2x the base size.
     """
-    if random.random() < 0.1:  # 10% chance of monster file
-        return int(base_size * 100 * random.uniform(0.8, 1.2))
+    if rng.random() < 0.1:  # 10% chance of monster file
+        return int(base_size * 100 * rng.uniform(0.8, 1.2))
     else:
-        return int(base_size * random.uniform(0.5, 2.0))
+        return int(base_size * rng.uniform(0.5, 2.0))
 
 def sanitize_path(path):
     """Sanitize file path to be valid on Windows systems"""
@@ -345,8 +345,10 @@ def sanitize_path(path):
     
     return '/'.join(parts)
 
-def create_typical_files(file_path, file_info):
-    """Create a file of specified size"""
+def plan_typical_files(base_path, file_info, owner, rng, profile='home'):
+    """Plan files of typical sizes below a directory"""
+    yield plan_dir('U', base_path, owner, profile)
+    
     for filename, size in file_info:
         # Sanitize the filename
         filename = sanitize_path(filename)
@@ -359,23 +361,14 @@ def create_typical_files(file_path, file_info):
         if not (has_extension or is_dot_config):
             continue
         
-        full_path = file_path / filename
-        # Create parent directories if they don't exist
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-        # Get randomized size
-        actual_size = get_random_file_size(size)
-        try:
-            # Create file with specified size
-            with open(full_path, 'wb') as f:
-                f.seek(actual_size - 1)
-                f.write(b'\0')
-            if actual_size > size * 50:  # If it's a monster file
-                print(f"Warning: Large file created: {full_path} ({actual_size / 1_000_000:.1f} MB)")
-        except OSError as e:
-            print(f"Error creating file {full_path}: {e}")
-            continue
-
-def get_dev_log_files():
+        full_path = join_path(base_path, filename)
+        # Get randomized size, seeded per file so it does not depend on the files before it
+        actual_size = get_random_file_size(size, rng.child(full_path))
+        if actual_size > size * 50:  # If it's a monster file
+            print(f"Warning: Large file planned: {full_path} ({actual_size / 1_000_000:.1f} MB)")
+        yield plan_file('U', full_path, actual_size, None, owner, profile)
+
+def get_dev_log_files(rng):
     """Return list of typical development log files with sizes"""
     return [
         ('logs/npm-debug.log', 50_000_000),
@@ -395,9 +388,9 @@ def get_dev_log_files():
         ('logs/nginx-access.log', 5_000_000_000),
         ('logs/redis-server.log', 300_000_000),
         ('logs/postgres-query.log', 4_000_000_000),
-        (f'logs/build_{random.randint(1000,9999)}.log', 250_000_000),
-        (f'logs/deploy_{random.randint(1000,9999)}.log', 180_000_000),
-        (f'logs/error_{random.randint(1000,9999)}.log', 2_500_000_000),
+        (f'logs/build_{rng.randint(1000,9999)}.log', 250_000_000),
+        (f'logs/deploy_{rng.randint(1000,9999)}.log', 180_000_000),
+        (f'logs/error_{rng.randint(1000,9999)}.log', 2_500_000_000),
     ]
 
 def is_developer_role(role, technologies):
@@ -428,7 +421,7 @@ def is_developer_role(role, technologies):
     
     return (role in dev_roles) or (len(dev_technologies.intersection(technologies)) >= 2)
 
-def get_ai_model_files():
+def get_ai_model_files(rng):
     """Return list of AI model files with realistic sizes"""
     return [
         # Language Models
@@ -452,8 +445,8 @@ def get_ai_model_files():
         ('models/embeddings/multilingual-e5-large.safetensors', 1_300_000_000),  # 1.3GB
         
         # Fine-tuned Models
-        (f'models/finetuned/checkpoint_{random.randint(1000,9999)}.pth', 2_000_000_000),
-        (f'models/finetuned/best_model_{random.randint(1000,9999)}.safetensors', 2_500_000_000),
+        (f'models/finetuned/checkpoint_{rng.randint(1000,9999)}.pth', 2_000_000_000),
+        (f'models/finetuned/best_model_{rng.randint(1000,9999)}.safetensors', 2_500_000_000),
         
         # Quantized Models
         ('models/quantized/llama2-7b-q4_K_M.gguf', 4_000_000_000),  # 4GB
@@ -495,30 +488,30 @@ def is_ai_practitioner(role, technologies):
     
     return (role in ai_roles) or (len(ai_technologies.intersection(technologies)) >= 2)
 
-def get_video_production_files():
+def get_video_production_files(rng):
     """Return list of typical video production files with sizes"""
     return [
         # Project Files
-        (f'Projects/Corporate_Overview_2024/Corporate_Overview_{get_random_version()}.prproj', 5_000_000),
-        (f'Projects/Product_Launch_2024/Product_Launch_{get_random_version()}.prproj', 4_500_000),
-        (f'Projects/Training_Series/Module_{random.randint(1,5)}_{get_random_version()}.prproj', 4_000_000),
+        (f'Projects/Corporate_Overview_2024/Corporate_Overview_{get_random_version(rng)}.prproj', 5_000_000),
+        (f'Projects/Product_Launch_2024/Product_Launch_{get_random_version(rng)}.prproj', 4_500_000),
+        (f'Projects/Training_Series/Module_{rng.randint(1,5)}_{get_random_version(rng)}.prproj', 4_000_000),
         
         # Raw Footage
-        (f'Footage/Corporate_Overview/A_Roll/Interview_CEO_{get_random_date_2024()}.mxf', 450_000_000),
-        (f'Footage/Corporate_Overview/A_Roll/Interview_CTO_{get_random_date_2024()}.mxf', 380_000_000),
-        (f'Footage/Corporate_Overview/B_Roll/Office_Shots_{get_random_date_2024()}.mxf', 650_000_000),
-        (f'Footage/Corporate_Overview/B_Roll/Product_Demos_{get_random_date_2024()}.mxf', 550_000_000),
+        (f'Footage/Corporate_Overview/A_Roll/Interview_CEO_{get_random_date_2024(rng)}.mxf', 450_000_000),
+        (f'Footage/Corporate_Overview/A_Roll/Interview_CTO_{get_random_date_2024(rng)}.mxf', 380_000_000),
+        (f'Footage/Corporate_Overview/B_Roll/Office_Shots_{get_random_date_2024(rng)}.mxf', 650_000_000),
+        (f'Footage/Corporate_Overview/B_Roll/Product_Demos_{get_random_date_2024(rng)}.mxf', 550_000_000),
         
         # Proxy Files
-        (f'Footage/Proxies/Interview_CEO_{get_random_date_2024()}_PROXY.mp4', 80_000_000),
-        (f'Footage/Proxies/Interview_CTO_{get_random_date_2024()}_PROXY.mp4', 75_000_000),
-        (f'Footage/Proxies/Office_Shots_{get_random_date_2024()}_PROXY.mp4', 120_000_000),
-        (f'Footage/Proxies/Product_Demos_{get_random_date_2024()}_PROXY.mp4', 90_000_000),
+        (f'Footage/Proxies/Interview_CEO_{get_random_date_2024(rng)}_PROXY.mp4', 80_000_000),
+        (f'Footage/Proxies/Interview_CTO_{get_random_date_2024(rng)}_PROXY.mp4', 75_000_000),
+        (f'Footage/Proxies/Office_Shots_{get_random_date_2024(rng)}_PROXY.mp4', 120_000_000),
+        (f'Footage/Proxies/Product_Demos_{get_random_date_2024(rng)}_PROXY.mp4', 90_000_000),
         
         # Exports
-        (f'Exports/Corporate_Overview_FINAL_{get_random_version()}.mp4', 250_000_000),
-        (f'Exports/Product_Launch_FINAL_{get_random_version()}.mp4', 200_000_000),
-        (f'Exports/Training_Module_{random.randint(1,5)}_FINAL_{get_random_version()}.mp4', 180_000_000),
+        (f'Exports/Corporate_Overview_FINAL_{get_random_version(rng)}.mp4', 250_000_000),
+        (f'Exports/Product_Launch_FINAL_{get_random_version(rng)}.mp4', 200_000_000),
+        (f'Exports/Training_Module_{rng.randint(1,5)}_FINAL_{get_random_version(rng)}.mp4', 180_000_000),
     ]
 
 def is_video_editor(role, technologies):
@@ -543,52 +536,47 @@ def is_video_editor(role, technologies):
     
     return (role in video_roles) or ("Adobe Creative Suite" in technologies)
 
-def get_project_archives(project_number, project_name):
+def get_project_archives(project_number, project_name, rng):
     """Generate archive files for a project with realistic sizes"""
-    archives = []
-    date = get_random_date_2024()
+    date = get_random_date_2024(rng)
     
     # Main project backups (500MB-2GB)
-    archives.extend([
+    yield from [
         (f'Backups/{project_number}_Full_Backup_{date}.zip', 1_500_000_000),
         (f'Backups/{project_number}_Source_Code_{date}.zip', 800_000_000),
         (f'Backups/{project_number}_Assets_{date}.zip', 1_200_000_000),
-    ])
+    ]
     
     # Version archives (200-800MB each)
     for month in range(1, 13):
-        if random.random() < 0.15:  # 15% chance for each month (reduced from 30%)
-            archives.append(
-                (f'Backups/{project_number}_v{month:02d}_{date}.zip', 
-                 random.randint(200_000_000, 800_000_000))
+        if rng.random() < 0.15:  # 15% chance for each month (reduced from 30%)
+            yield (
+                f'Backups/{project_number}_v{month:02d}_{date}.zip',
+                rng.randint(200_000_000, 800_000_000)
             )
     
     # Milestone archives (1-2.5GB)
     milestones = ['Alpha', 'Beta', 'Release']  # Reduced from 5 to 3 milestones
     for milestone in milestones:
-        if random.random() < 0.3:  # 30% chance (reduced from 40%)
-            archives.append(
-                (f'Backups/{project_number}_{milestone}_{date}.zip',
-                 random.randint(1_000_000_000, 2_500_000_000))
+        if rng.random() < 0.3:  # 30% chance (reduced from 40%)
+            yield (
+                f'Backups/{project_number}_{milestone}_{date}.zip',
+                rng.randint(1_000_000_000, 2_500_000_000)
             )
     
     # Feature branches (300MB-1GB)
     features = ['feature_auth', 'feature_ui', 'feature_db']  # Reduced from 5 to 3 features
     for feature in features:
-        if random.random() < 0.2:  # 20% chance (reduced from 25%)
-            archives.append(
-                (f'Backups/{project_number}_{feature}_{date}.zip',
-                 random.randint(300_000_000, 1_000_000_000))
+        if rng.random() < 0.2:  # 20% chance (reduced from 25%)
+            yield (
+                f'Backups/{project_number}_{feature}_{date}.zip',
+                rng.randint(300_000_000, 1_000_000_000)
             )
-    
-    return archives
 
-def get_project_files_by_technology(technologies):
+def get_project_files_by_technology(technologies, rng):
     """Return typical files based on the project's technologies"""
-    files = []
-    
     # Common project files for all projects
-    files.extend([
+    yield from [
         ('README.md', 5_000),
         ('.gitignore', 1_000),
         ('LICENSE', 1_000),
@@ -603,19 +591,19 @@ def get_project_files_by_technology(technologies):
         ('.github/workflows/ci.yml', 2_000),
         ('.github/workflows/cd.yml', 2_500),
         ('.vscode/settings.json', 1_500),
-    ])
+    ]
 
     # Add project archives at the end
     project_number = 'P0000'  # This will be replaced with actual number
-    files.extend([
+    yield from [
         (f'Archives/README.md', 2_000),
         (f'Archives/.gitignore', 1_000),
-    ])
+    ]
     
     # Note: Actual archive files will be added when creating the directory
     
     if "Python" in technologies:
-        files.extend([
+        yield from [
             ('src/main.py', 50_000),
             ('src/utils.py', 30_000),
             ('src/config.py', 15_000),
@@ -639,10 +627,10 @@ def get_project_files_by_technology(technologies):
             ('pytest.ini', 500),
             ('.coverage', 5_000),
             ('coverage.xml', 8_000),
-        ])
+        ]
 
     if "JavaScript" in technologies:
-        files.extend([
+        yield from [
             ('src/utils/helpers.js', 15_000),
             ('src/utils/validation.js', 12_000),
             ('src/utils/formatting.js', 10_000),
@@ -656,10 +644,10 @@ def get_project_files_by_technology(technologies):
             ('.prettierrc', 500),
             ('jest.config.js', 1_500),
             ('babel.config.js', 1_000),
-        ])
+        ]
 
     if "React" in technologies:
-        files.extend([
+        yield from [
             ('src/components/App.jsx', 15_000),
             ('src/components/Header/index.jsx', 8_000),
             ('src/components/Footer/index.jsx', 6_000),
@@ -681,10 +669,10 @@ def get_project_files_by_technology(technologies):
             ('public/manifest.json', 1_000),
             ('webpack.config.js', 3_000),
             ('tsconfig.json', 2_000),
-        ])
+        ]
 
     if "Angular" in technologies:
-        files.extend([
+        yield from [
             ('src/app/app.module.ts', 10_000),
             ('src/app/app.component.ts', 8_000),
             ('src/app/app.component.html', 5_000),
@@ -701,10 +689,10 @@ def get_project_files_by_technology(technologies):
             ('tsconfig.json', 3_000),
             ('tsconfig.app.json', 2_000),
             ('tsconfig.spec.json', 2_000),
-        ])
+        ]
 
     if any(cloud in technologies for cloud in ["AWS", "Azure", "GCP"]):
-        files.extend([
+        yield from [
             ('infrastructure/main.tf', 10_000),
             ('infrastructure/variables.tf', 5_000),
             ('infrastructure/outputs.tf', 3_000),
@@ -719,10 +707,10 @@ def get_project_files_by_technology(technologies):
             ('config/dev.yaml', 7_000),
             ('.terraform-version', 100),
             ('terraform.tfvars.example', 2_000),
-        ])
+        ]
 
     if "Docker" in technologies:
-        files.extend([
+        yield from [
             ('Dockerfile', 2_000),
             ('Dockerfile.dev', 1_800),
             ('docker-compose.yml', 3_000),
@@ -733,10 +721,10 @@ def get_project_files_by_technology(technologies):
             ('scripts/wait-for-it.sh', 1_000),
             ('config/nginx/nginx.conf', 3_000),
             ('config/nginx/default.conf', 2_000),
-        ])
+        ]
 
     if "Kubernetes" in technologies:
-        files.extend([
+        yield from [
             ('k8s/deployment.yaml', 5_000),
             ('k8s/service.yaml', 2_000),
             ('k8s/ingress.yaml', 3_000),
@@ -748,10 +736,10 @@ def get_project_files_by_technology(technologies):
             ('helm/Chart.yaml', 1_000),
             ('helm/values.yaml', 5_000),
             ('helm/templates/_helpers.tpl', 2_000),
-        ])
+        ]
 
     if "PyTorch" in technologies or "TensorFlow" in technologies:
-        files.extend([
+        yield from [
             # Source code files (5-50KB)
             ('models/model.py', 25_000),
             ('models/layers.py', 15_000),
@@ -776,14 +764,14 @@ def get_project_files_by_technology(technologies):
             # Vision model
             ('models/pretrained/stable_diffusion_xl_base.pth', 7_000_000_000),  # 7GB
             # Latest checkpoint
-            (f'experiments/run_{get_random_date_2024()}/checkpoint_final.pth', 6_000_000_000),  # 6GB
+            (f'experiments/run_{get_random_date_2024(rng)}/checkpoint_final.pth', 6_000_000_000),  # 6GB
             # Generated Data
-            (f'outputs/generated_images_{get_random_date_2024()}.tar', 500_000_000),
-            (f'outputs/synthetic_data_{get_random_date_2024()}.hdf5', 350_000_000),
-        ])
+            (f'outputs/generated_images_{get_random_date_2024(rng)}.tar', 500_000_000),
+            (f'outputs/synthetic_data_{get_random_date_2024(rng)}.hdf5', 350_000_000),
+        ]
 
     if "Adobe Creative Suite" in technologies:
-        files.extend([
+        yield from [
             # PSD files (typically 50-200MB for complex designs)
             ('designs/mockup.psd', 150_000_000),
             ('designs/mockup_mobile.psd', 80_000_000),
@@ -798,90 +786,40 @@ def get_project_files_by_technology(technologies):
             # XD files (typically 10-50MB)
             ('prototypes/mobile_app.xd', 25_000_000),
             ('prototypes/website.xd', 35_000_000),
-        ])
-
-    return files
-
-def compress_file(file_path):
-    """Compress a file using NTFS compression on Windows"""
-    if platform.system().lower() == 'windows':
-        try:
-            # Use compact.exe for NTFS compression
-            result = subprocess.run(
-                ['compact', '/c', str(file_path)], 
-                capture_output=True, 
-                text=True,
-                check=False  # Don't raise exception on non-zero return
-            )
-            if result.returncode != 0:
-                print(f"Warning: Failed to compress {file_path}: {result.stderr.strip()}")
-                return False
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError) as e:
-            print(f"Warning: Compression not available for {file_path}: {e}")
-            return False
-    return False
-
-def compress_directory(dir_path):
-    """Enable NTFS compression on a directory and all its contents"""
-    if platform.system().lower() == 'windows':
-        try:
-            # Use compact.exe with /s flag for recursive compression
-            result = subprocess.run(
-                ['compact', '/c', '/s', str(dir_path)], 
-                capture_output=True, 
-                text=True,
-                check=False  # Don't raise exception on non-zero return
-            )
-            if result.returncode != 0:
-                print(f"Warning: Failed to compress directory {dir_path}: {result.stderr.strip()}")
-                return False
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError) as e:
-            print(f"Warning: Directory compression not available for {dir_path}: {e}")
-            return False
-    return False
-
-def create_user_directory(users_dir, username, technologies, role, user_data, company_data):
+        ]
+
+def plan_user_directory(username, technologies, role, user_data, company_data, rng=None):
+    """Plan a user's home directory structure and application data"""
+    rng = rng or user_rng(username, 'u_drive')
+    
     # Create user's home directory
-    user_dir = users_dir / username
-    user_dir.mkdir(exist_ok=True)
-    compress_directory(user_dir)
+    user_dir = join_path('Users', username)
+    yield plan_dir('U', user_dir, username, 'home', compress=True)
     
     # Create standard directories
     for dirname in ['Desktop', 'Documents', 'Downloads', 'Pictures', 'Videos']:
-        dir_path = user_dir / dirname
-        dir_path.mkdir(exist_ok=True)
-        compress_directory(dir_path)
+        yield plan_dir('U', join_path(user_dir, dirname), username, 'home', compress=True)
     
     # Create application directories based on technologies
     app_dirs = create_app_directories()
-    for tech in technologies:
+    for tech in sorted(technologies):
         if tech in app_dirs:
-            dir_path = user_dir / app_dirs[tech]
-            dir_path.mkdir(parents=True, exist_ok=True)
-            compress_directory(dir_path)
+            yield plan_dir('U', join_path(user_dir, app_dirs[tech]), username, 'home', compress=True)
     
     # Add AI model files for AI practitioners
     if is_ai_practitioner(role, technologies):
-        ai_models_path = user_dir / 'Documents/AI/models'
-        ai_models_path.mkdir(parents=True, exist_ok=True)
-        create_typical_files(ai_models_path, get_ai_model_files())
-        print(f"Created AI model files for {username}")
+        ai_models_path = join_path(user_dir, 'Documents/AI/models')
+        yield from plan_typical_files(ai_models_path, get_ai_model_files(rng), username, rng)
     
     # Add video production files for video editors
     if is_video_editor(role, technologies):
-        video_path = user_dir / 'Documents/Adobe/Video Projects'
-        video_path.mkdir(parents=True, exist_ok=True)
-        create_typical_files(video_path, get_video_production_files())
-        print(f"Created video production files for {username}")
+        video_path = join_path(user_dir, 'Documents/Adobe/Video Projects')
+        yield from plan_typical_files(video_path, get_video_production_files(rng), username, rng)
     
     # Add development log files for developers
     if is_developer_role(role, technologies):
-        dev_logs_path = user_dir / 'Documents/Development/logs'
-        dev_logs_path.mkdir(parents=True, exist_ok=True)
-        create_typical_files(dev_logs_path, get_dev_log_files())
-        print(f"Created development logs for {username}")
+        dev_logs_path = join_path(user_dir, 'Documents/Development/logs')
+        yield from plan_typical_files(dev_logs_path, get_dev_log_files(rng), username, rng)
                 
     # Add VMware files for infrastructure-related roles
     vm_roles = {
@@ -897,11 +835,10 @@ def create_user_directory(users_dir, username, technologies, role, user_data, co
         "Platform Engineer"
     }
     if role in vm_roles:
-        vmware_path = user_dir / 'Documents/Virtual Machines'
-        vmware_path.mkdir(parents=True, exist_ok=True)
+        vmware_path = join_path(user_dir, 'Documents/Virtual Machines')
         
         # Get role-specific VM files
-        vm_files = get_typical_files()['VMware'].copy()  # Start with base VMs
+        vm_files = get_typical_files(rng)['VMware'].copy()  # Start with base VMs
         
         # Add specialized VMs for network engineers
         if "Network Engineer" in role or "Infrastructure Engineer" in role:
@@ -938,12 +875,12 @@ def create_user_directory(users_dir, username, technologies, role, user_data, co
             vm_files.extend(dev_vms)
         
         # Create all VM files
-        create_typical_files(vmware_path, vm_files)
+        yield from plan_typical_files(vmware_path, vm_files, username, rng)
 
     # Create Projects directory for user's assigned projects
     if user_data and 'assigned_projects' in user_data:
-        projects_path = user_dir / 'Projects'
-        projects_path.mkdir(parents=True, exist_ok=True)
+        projects_path = join_path(user_dir, 'Projects')
+        yield plan_dir('U', projects_path, username, 'home')
         
         # Get all projects data
         all_projects = company_data.get('projects', {}) if company_data else {}
@@ -954,59 +891,77 @@ def create_user_directory(users_dir, username, technologies, role, user_data, co
                 project = all_projects[project_id]
                 project_number = project.get('number', 'unknown')
                 project_name = project.get('name', 'unknown')
-                project_dir = projects_path / project_number
-                project_dir.mkdir(parents=True, exist_ok=True)
-                
-                # Create project files based on likely technologies
-                project_files = get_project_files_by_technology(project['likely_technologies'])
-                
-                # Add project-specific archives
-                project_archives = get_project_archives(project_number, project_name)
-                project_files.extend(project_archives)
+                project_dir = join_path(projects_path, project_number)
+                project_rng = rng.child('project', project_number)
                 
-                create_typical_files(project_dir, project_files)
+                # Create project files based on likely technologies, then project-specific archives
+                project_files = itertools.chain(
+                    get_project_files_by_technology(project['likely_technologies'], project_rng),
+                    get_project_archives(project_number, project_name, project_rng))
                 
-                print(f"Created project directory {project_number} for {username}")
-
-def main():
-    # Load company data
-    company_data = load_company_data('company_data.json')
+                yield from plan_typical_files(project_dir, project_files, username, project_rng)
+
+def create_user_directory(users_dir, username, technologies, role, user_data, company_data,
+                          factory=None):
+    """Create a single user's home directory structure"""
+    factory = factory or FileFactory(allocation='sparse')
+    entries = plan_user_directory(username, technologies, role, user_data, company_data)
+    return execute_plan(entries, {'U': Path(users_dir).parent}, factory)
+
+def select_technologies(user_data, rng=None):
+    """Combine a user's current technologies with some likely additional ones"""
+    rng = rng or user_rng(get_username(user_data), 'technologies')
     
-    # Create U: drive root
-    u_drive = Path('U:')
-    if not u_drive.exists():
-        print("Note: Creating simulation in current directory as 'U_Drive' since we can't create actual U: drive")
-        u_drive = Path('U_Drive')
-    
-    # Create Users directory
-    users_dir = u_drive / 'Users'
-    users_dir.mkdir(parents=True, exist_ok=True)
+    # Always include current technologies
+    technologies = set(user_data['current_technologies'])
     
+    # Add some additional technologies
+    likely_tech = user_data.get('likely_additional_technologies', [])
+    num_additional = min(
+        max(1, int(len(likely_tech) * 0.3)),  # Try to get 30%
+        len(likely_tech)  # But don't exceed available technologies
+    )
+    selected_tech = rng.sample(likely_tech, num_additional)
+    technologies.update(selected_tech)
+    return technologies
+
+def plan_u_drive(company_data, selection=None):
+    """Plan the home directories of every selected user"""
     # Enable compression on base directories
-    compress_directory(u_drive)
-    compress_directory(users_dir)
+    yield plan_dir('U', 'Users', None, 'home', compress=True)
     
     # Process each user
-    for user_id, user_data in company_data['users'].items():
-        # Create sanitized username (firstname_lastname)
-        name_parts = user_data['name'].lower().split()
-        username = f"{name_parts[0]}_{name_parts[-1]}"
-        
-        # Always include current technologies
-        technologies = set(user_data['current_technologies'])
-        
-        # Add some additional technologies
-        likely_tech = user_data['likely_additional_technologies']
-        num_additional = min(
-            max(1, int(len(likely_tech) * 0.3)),  # Try to get 30%
-            len(likely_tech)  # But don't exceed available technologies
-        )
-        selected_tech = random.sample(likely_tech, num_additional)
-        technologies.update(selected_tech)
-        
-        # Create user's directory structure
-        create_user_directory(users_dir, username, technologies, user_data['role'], user_data, company_data)
-        print(f"Created directory structure for {username}")
+    for user_data in selected_users(company_data, selection).values():
+        username = get_username(user_data)
+        technologies = select_technologies(user_data)
+        yield from plan_user_directory(username, technologies, user_data['role'], user_data, company_data)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Create U drive home directories with application data')
+    add_file_factory_arguments(parser, default_allocation='sparse')
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'U_drive_setup')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_selector_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    factory = factory_from_args(args)
+
+    # Load company data
+    company_data = load_company_data('company_data.json')
+    
+    # Plan and create every user's directory structure
+    store = store_from_args(args, company_data)
+    stats = execute_plan(plan_u_drive(company_data, selection_from_args(args)), factory=factory, executor=executor_from_args(args),
+                         journal=journal_from_args(args), store=store)
+    if store:
+        store.close()
+    print(f"Created directory structures: {stats.summary()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,40 +1,17 @@
-import json
-import random
-from pathlib import Path
 import datetime
-import os
-import hashlib
-import platform
-import subprocess
+import argparse
+from file_factory import add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from reconcile import add_reconcile_arguments
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import add_selector_arguments, selection_from_args, selected_users
+from seeds import user_rng, add_seed_arguments, set_company_seed
+from file_dates import hash_timestamper, add_date_arguments, parse_age_profiles
+from populate_plan import (get_username, join_path, plan_dir, plan_file, plan_clean,
+                           load_company_data, execute_plan)
 
-def get_random_date(filename, start_date="2023-01-01", end_date="2024-12-31"):
-    """Generate a consistent random date for a given filename"""
-    # Create a hash of the filename to get consistent random numbers
-    hash_object = hashlib.md5(filename.encode())
-    hash_hex = hash_object.hexdigest()
-    
-    # Use the first 8 characters of hash as a seed
-    seed = int(hash_hex[:8], 16)
-    random.seed(seed)
-    
-    # Generate random date
-    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-    days_between = (end - start).days
-    random_days = random.randint(0, days_between)
-    
-    # Reset random seed
-    random.seed()
-    
-    return start + datetime.timedelta(days=random_days)
-
-def set_file_dates(file_path, filename):
-    """Set consistent modification and access times for a file"""
-    date = get_random_date(filename)
-    timestamp = date.timestamp()
-    os.utime(file_path, (timestamp, timestamp))
-
-def get_network_downloads():
+def get_network_downloads(rng):
     """Generate typical downloads for network engineers"""
     iso_files = [
         # Windows Server ISOs - Multiple versions and updates
@@ -156,23 +133,23 @@ def get_network_downloads():
     
     downloads = []
     # Network engineers are more likely to be pack rats (40% chance)
-    is_pack_rat = random.random() < 0.4
+    is_pack_rat = rng.random() < 0.4
     
     if is_pack_rat:
         # Pack rat network engineers keep more ISOs
-        downloads.extend(random.sample(iso_files, random.randint(15, 25)))
-        downloads.extend(random.sample(network_tools, random.randint(6, 8)))
-        downloads.extend(random.sample(cisco_files, random.randint(3, 5)))
-        downloads.extend(random.sample(network_docs, random.randint(3, 5)))
+        downloads.extend(rng.sample(iso_files, rng.randint(15, 25)))
+        downloads.extend(rng.sample(network_tools, rng.randint(6, 8)))
+        downloads.extend(rng.sample(cisco_files, rng.randint(3, 5)))
+        downloads.extend(rng.sample(network_docs, rng.randint(3, 5)))
     else:
-        downloads.extend(random.sample(iso_files, random.randint(5, 8)))
-        downloads.extend(random.sample(network_tools, random.randint(2, 4)))
-        downloads.extend(random.sample(cisco_files, random.randint(1, 2)))
-        downloads.extend(random.sample(network_docs, random.randint(1, 2)))
+        downloads.extend(rng.sample(iso_files, rng.randint(5, 8)))
+        downloads.extend(rng.sample(network_tools, rng.randint(2, 4)))
+        downloads.extend(rng.sample(cisco_files, rng.randint(1, 2)))
+        downloads.extend(rng.sample(network_docs, rng.randint(1, 2)))
     
     return downloads, is_pack_rat
 
-def get_ai_ml_downloads():
+def get_ai_ml_downloads(rng):
     """Generate typical downloads for AI/ML engineers"""
     model_files = [
         ('pytorch_model-v1.2.bin', 15_000_000_000),  # 15GB
@@ -206,19 +183,19 @@ def get_ai_ml_downloads():
     ]
 
     downloads = []
-    is_pack_rat = random.random() < 0.1
+    is_pack_rat = rng.random() < 0.1
     if is_pack_rat:
-        downloads.extend(random.sample(model_files, random.randint(5, 7)))
-        downloads.extend(random.sample(datasets, random.randint(3, 4)))
-        downloads.extend(random.sample(papers, random.randint(4, 6)))
+        downloads.extend(rng.sample(model_files, rng.randint(5, 7)))
+        downloads.extend(rng.sample(datasets, rng.randint(3, 4)))
+        downloads.extend(rng.sample(papers, rng.randint(4, 6)))
     else:
-        downloads.extend(random.sample(model_files, random.randint(2, 3)))
-        downloads.extend(random.sample(datasets, random.randint(1, 2)))
-        downloads.extend(random.sample(papers, random.randint(1, 3)))
+        downloads.extend(rng.sample(model_files, rng.randint(2, 3)))
+        downloads.extend(rng.sample(datasets, rng.randint(1, 2)))
+        downloads.extend(rng.sample(papers, rng.randint(1, 3)))
     
     return downloads, is_pack_rat
 
-def get_developer_downloads():
+def get_developer_downloads(rng):
     """Generate typical downloads for developers"""
     dev_tools = [
         ('VSCode-win32-x64-1.85.0.exe', 120_000_000),  # 120MB
@@ -239,13 +216,13 @@ def get_developer_downloads():
     
     downloads = []
     # Add 3-5 random dev tools
-    downloads.extend(random.sample(dev_tools, random.randint(3, 5)))
+    downloads.extend(rng.sample(dev_tools, rng.randint(3, 5)))
     # Add 1-2 random SDKs
-    downloads.extend(random.sample(sdks, random.randint(1, 2)))
+    downloads.extend(rng.sample(sdks, rng.randint(1, 2)))
     
     return downloads
 
-def get_designer_downloads():
+def get_designer_downloads(rng):
     """Generate typical downloads for designers"""
     assets = [
         ('premium_icon_pack_2024.zip', 2_850_000_000),  # 2.85GB
@@ -264,170 +241,104 @@ def get_designer_downloads():
     
     downloads = []
     # Add 2-3 random asset packs
-    downloads.extend(random.sample(assets, random.randint(2, 3)))
+    downloads.extend(rng.sample(assets, rng.randint(2, 3)))
     # Add 1-2 random software installers
-    downloads.extend(random.sample(software, random.randint(1, 2)))
+    downloads.extend(rng.sample(software, rng.randint(1, 2)))
     
     return downloads
 
-def create_large_file(file_path, size):
-    """Create a large file filled with zeros using the most efficient method for the OS"""
-    system = platform.system().lower()
+def get_user_downloads(user_data, rng):
+    """Return the (filename, size) downloads of a user and whether they are a digital pack rat"""
+    # Combine current and likely technologies
+    technologies = set(user_data['current_technologies'])
+    role = user_data['role']
     
-    try:
-        if system == 'linux':
-            # Use fallocate on Linux - very fast
-            subprocess.run(['fallocate', '-l', str(size), str(file_path)], check=True)
+    # Initialize downloads list and pack rat status
+    downloads = []
+    is_pack_rat = False
+    
+    # Add role-specific downloads
+    if any(role_name in role for role_name in ['Network Engineer', 'Infrastructure', 'Systems Administrator']):
+        new_downloads, is_rat = get_network_downloads(rng)
+        is_pack_rat = is_pack_rat or is_rat
+        downloads.extend(new_downloads)
         
-        elif system == 'windows':
-            try:
-                # Try fsutil first
-                subprocess.run(['fsutil', 'file', 'createnew', str(file_path), str(size)], check=True)
-            except subprocess.SubprocessError:
-                # If fsutil fails, try direct file creation
-                with open(file_path, 'wb') as f:
-                    f.seek(size - 1)
-                    f.write(b'\0')
+    if any(tech in technologies for tech in ['PyTorch', 'TensorFlow', 'Machine Learning']):
+        new_downloads, is_rat = get_ai_ml_downloads(rng)
+        is_pack_rat = is_pack_rat or is_rat
+        downloads.extend(new_downloads)
         
-        else:
-            # For other OS - use seek method
-            with open(file_path, 'wb') as f:
-                f.seek(size - 1)
-                f.write(b'\0')
-    
-    except (subprocess.SubprocessError, OSError) as e:
-        print(f"Warning: Failed to create {file_path} with size {size} using primary method: {e}")
-        try:
-            # Fallback to seek method
-            with open(file_path, 'wb') as f:
-                f.seek(size - 1)
-                f.write(b'\0')
-        except OSError as e:
-            print(f"Error: Could not create file {file_path}: {e}")
-            return False
+    if any(role_name in role for role_name in ['Developer', 'Engineer']) or \
+       any(tech in technologies for tech in ['Python', 'Java', 'JavaScript', 'C#']):
+        downloads.extend(get_developer_downloads(rng))
+        
+    if any(tech in technologies for tech in ['Adobe Creative Suite', 'UI/UX Design']):
+        downloads.extend(get_designer_downloads(rng))
     
-    return True
-
-def clean_directory(path):
-    """Remove all files and subdirectories in the given path"""
-    if path.exists():
-        print(f"Cleaning directory: {path}")
-        for item in path.iterdir():
-            if item.is_file():
-                item.unlink()
-            elif item.is_dir():
-                clean_directory(item)  # Clean subdirectories recursively
-                item.rmdir()  # Remove the empty directory
-
-def compress_file(file_path):
-    """Compress a file using NTFS compression on Windows"""
-    if platform.system().lower() == 'windows':
-        try:
-            subprocess.run(['compact', '/c', str(file_path)], check=True, capture_output=True)
-            return True
-        except subprocess.SubprocessError as e:
-            print(f"Warning: Failed to compress {file_path}: {e}")
-            return False
-    return False
-
-def compress_directory(dir_path):
-    """Enable NTFS compression on a directory and all its contents"""
-    if platform.system().lower() == 'windows':
-        try:
-            # Enable compression on the directory and all contents
-            subprocess.run(['compact', '/c', '/s', str(dir_path)], check=True, capture_output=True)
-            return True
-        except subprocess.SubprocessError as e:
-            print(f"Warning: Failed to compress directory {dir_path}: {e}")
-            return False
-    return False
+    return downloads, is_pack_rat
 
-def simulate_downloads():
-    # Load company data
-    with open('company_data.json', 'r') as f:
-        company_data = json.load(f)
+def plan_user_downloads(user_data):
+    """Plan the Downloads folder of a single user"""
+    username = get_username(user_data)
+    downloads_path = join_path('Users', username, 'Downloads')
     
-    # Try both possible base paths
-    base_path = Path('U:')
-    if not base_path.exists():
-        print("Note: Using U_Drive directory since U: drive not available")
-        base_path = Path('U_Drive')
+    # Start from an empty Downloads directory
+    yield plan_clean('U', downloads_path, username, 'downloads')
+    yield plan_dir('U', downloads_path, username, 'downloads', compress=True)
     
-    if not base_path.exists():
-        print("Creating U_Drive directory")
-        base_path.mkdir(parents=True, exist_ok=True)
-        compress_directory(base_path)
+    # Every random choice for these downloads comes from the user's own seed
+    downloads, is_pack_rat = get_user_downloads(user_data, user_rng(username, 'downloads'))
+    if is_pack_rat:
+        print(f"Note: {username} is a digital pack rat!")
     
-    # Ensure Users directory exists
-    users_path = base_path / 'Users'
-    users_path.mkdir(parents=True, exist_ok=True)
-    compress_directory(users_path)
+    # Dates are consistent per original filename
+    get_timestamp = hash_timestamper('downloads')
     
-    for user_id, user_data in company_data['users'].items():
-        # Get username
-        name_parts = user_data['name'].lower().split()
-        username = f"{name_parts[0]}_{name_parts[-1]}"
-        
-        # Create downloads path
-        downloads_path = users_path / username / 'Downloads'
-        # Clean existing downloads directory if it exists
-        if downloads_path.exists():
-            clean_directory(downloads_path)
-        else:
-            print(f"Creating Downloads directory for {username}")
-            downloads_path.mkdir(parents=True, exist_ok=True)
-            compress_directory(downloads_path)
-            
-        # Combine current and likely technologies
-        technologies = set(user_data['current_technologies'])
-        role = user_data['role']
-        
-        # Initialize downloads list and pack rat status
-        downloads = []
-        is_pack_rat = False
-        
-        # Add role-specific downloads
-        if any(role_name in role for role_name in ['Network Engineer', 'Infrastructure', 'Systems Administrator']):
-            new_downloads, is_rat = get_network_downloads()
-            is_pack_rat = is_pack_rat or is_rat
-            downloads.extend(new_downloads)
-            
-        if any(tech in technologies for tech in ['PyTorch', 'TensorFlow', 'Machine Learning']):
-            new_downloads, is_rat = get_ai_ml_downloads()
-            is_pack_rat = is_pack_rat or is_rat
-            downloads.extend(new_downloads)
-            
-        if any(role_name in role for role_name in ['Developer', 'Engineer']) or \
-           any(tech in technologies for tech in ['Python', 'Java', 'JavaScript', 'C#']):
-            downloads.extend(get_developer_downloads())
-            
-        if any(tech in technologies for tech in ['Adobe Creative Suite', 'UI/UX Design']):
-            downloads.extend(get_designer_downloads())
-        
-        if is_pack_rat:
-            print(f"Note: {username} is a digital pack rat!")
-        
-        # Create the files
-        for filename, size in downloads:
-            base_filename = filename  # Store original filename for date generation
-            # Add date to all filenames
-            date = get_random_date(filename).strftime("%Y%m%d")
-            name, ext = filename.rsplit('.', 1)
-            filename = f"{name}_{date}.{ext}"
-            file_path = downloads_path / filename
-            
-            # Create empty file of specified size
-            if not file_path.exists():
-                print(f"Creating {file_path} with size {size/1_000_000_000:.1f}GB")
-                if create_large_file(file_path, size):
-                    # Set consistent modification time based on original filename
-                    set_file_dates(file_path, base_filename)
-                    # Compress the file
-                    compress_file(file_path)
-                else:
-                    print(f"Failed to create {file_path}")
-                
-        print(f"Created {len(downloads)} download files for {username}")
+    for filename, size in downloads:
+        timestamp = get_timestamp(filename)
+        # Add date to all filenames, matching the file's modification time
+        date = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+        name, ext = filename.rsplit('.', 1)
+        filename = f"{name}_{date}.{ext}"
+        yield plan_file('U', join_path(downloads_path, filename), size, timestamp,
+                        username, 'downloads', compress=True)
+
+def plan_downloads(company_data, selection=None):
+    """Plan the Downloads folders of every selected user"""
+    yield plan_dir('U', 'Users', None, 'downloads', compress=True)
+    for user_data in selected_users(company_data, selection).values():
+        yield from plan_user_downloads(user_data)
+
+def simulate_downloads(factory=None, company_data=None, executor=None, journal=None, reconcile=False, store=None,
+                       selection=None):
+    """Populate every user's Downloads folder"""
+    company_data = company_data or load_company_data('company_data.json')
+    if store:
+        store.record_company(company_data)
+    stats = execute_plan(plan_downloads(company_data, selection), factory=factory, executor=executor,
+                         journal=journal, reconcile=reconcile, store=store)
+    print(f"Created download files: {stats.summary()}")
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate user Downloads folders with role-specific files')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'U_populate_downloads')
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    add_selector_arguments(parser)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    simulate_downloads() 
\ No newline at end of file
+    args = parse_arguments()
+    parse_age_profiles(args.age_profile)
+    set_company_seed(args.seed)
+    store = store_from_args(args)
+    simulate_downloads(factory_from_args(args), executor=executor_from_args(args),
+                       journal=journal_from_args(args), reconcile=args.reconcile, store=store,
+                       selection=selection_from_args(args))
+    if store:
+        store.close() 
\ No newline at end of file
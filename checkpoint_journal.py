@@ -0,0 +1,149 @@
+"""
+Checkpoint Journal
+
+Append-only record of completed populate work, so a run that dies partway
+(full disk, reboot, Ctrl-C) can be restarted with --resume instead of from
+zero.
+
+Every plan entry is journaled once it is fully done: a file after it has been
+created, timestamped and compressed, a directory after it has been created
+and compressed, and a clean after the directory has been emptied. A resumed
+run skips journaled entries, so finished files are not rewritten and, above
+all, directories that were already cleaned and partly repopulated are not
+wiped again. populate_shards additionally journals whole work units (users,
+projects, departments) and skips them without reading their plans.
+
+Records are JSON lines appended with one write each, so several threads or
+processes can share a journal. The file is flushed to disk (fsync) every
+CHECKPOINT_RECORDS records or CHECKPOINT_SECONDS seconds, and when execution
+stops; after a crash at most that much finished work is redone. A torn last
+line is ignored on load.
+
+Command line options (all populate scripts):
+
+    --journal FILE    Journal location (default: .<script>_journal.jsonl)
+    --resume          Skip work recorded in an existing journal
+    --no-journal      Do not keep a journal
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Set
+
+CHECKPOINT_RECORDS = 1000
+CHECKPOINT_SECONDS = 5.0
+
+def entry_key(kind: str, drive: str, path: str) -> int:
+    """Return a compact 64-bit key for a plan entry"""
+    digest = hashlib.blake2b(f"{kind}\0{drive}\0{path}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+class CheckpointJournal:
+    """Append-only journal of completed plan entries and work units"""
+
+    def __init__(self, path, resume: bool = False,
+                 checkpoint_records: int = CHECKPOINT_RECORDS,
+                 checkpoint_seconds: float = CHECKPOINT_SECONDS):
+        self.path = Path(path)
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_seconds = checkpoint_seconds
+        self.done: Set[int] = set()
+        self.units: Set[str] = set()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        if resume:
+            self.load()
+        elif self.path.exists():
+            self.path.unlink()
+
+    def load(self) -> None:
+        """Read the records of previous runs"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn write from a crash
+                if 'unit' in record:
+                    self.units.add(record['unit'])
+                else:
+                    self.done.add(entry_key(record['kind'], record['drive'], record['path']))
+
+    @property
+    def resumed(self) -> bool:
+        """True when work from a previous run was found"""
+        return bool(self.done or self.units)
+
+    def is_done(self, entry) -> bool:
+        """Return True if a plan entry was completed by a previous run"""
+        return entry_key(entry.kind, entry.drive, entry.path) in self.done
+
+    def is_unit_done(self, name: str) -> bool:
+        """Return True if a whole work unit was completed by a previous run"""
+        return name in self.units
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(line)
+            self._unsynced += 1
+            if (self._unsynced >= self.checkpoint_records or
+                    time.monotonic() - self._last_sync >= self.checkpoint_seconds):
+                self._sync()
+
+    def record(self, entry) -> None:
+        """Journal a completed plan entry"""
+        self._append({'kind': entry.kind, 'drive': entry.drive, 'path': entry.path, 'size': entry.size})
+
+    def record_unit(self, name: str) -> None:
+        """Journal a completed work unit"""
+        self._append({'unit': name})
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def checkpoint(self) -> None:
+        """Force journaled records to disk"""
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def close(self) -> None:
+        """Checkpoint and close the journal file"""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+def add_journal_arguments(parser, name: str) -> None:
+    """Add the checkpoint journal options to a populate script's argument parser"""
+    parser.add_argument('--journal', default=f'.{name}_journal.jsonl', metavar='FILE',
+                        help=f'Checkpoint journal of completed work (default: .{name}_journal.jsonl)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip work recorded in an existing journal by an interrupted run')
+    parser.add_argument('--no-journal', action='store_true',
+                        help='Do not keep a checkpoint journal')
+
+def journal_from_args(args) -> Optional[CheckpointJournal]:
+    """Open the journal selected on the command line, or None"""
+    if args.no_journal:
+        return None
+    journal = CheckpointJournal(args.journal, resume=args.resume)
+    if journal.resumed:
+        print(f"Resuming: {len(journal.done):,} entries and {len(journal.units):,} units already done")
+    return journal
@@ -0,0 +1,220 @@
+"""
+Command Runner
+
+Runs the external tools the setup scripts depend on (compact, fsutil, net user)
+on a background asyncio event loop instead of one blocking subprocess.run after
+another, so their latency overlaps.
+
+    runner = get_command_runner()
+    result = runner.run(['compact', '/c', path])          # Blocking, from any thread
+    future = runner.submit(['fsutil', 'sparse', ...])     # concurrent.futures.Future
+    results = runner.run_many([cmd1, cmd2, cmd3])         # Concurrently, in order
+
+At most `concurrency` processes run at once. Every command gets a timeout and
+is retried with a short backoff when it times out, cannot be started or exits
+non-zero. Tools that accept several paths per invocation can be batched with
+batch_commands().
+
+RecordingCommandRunner is a drop-in fake that records every command and
+answers with scripted results, so code paths that shell out to Windows tools
+can be exercised on Linux:
+
+    runner = RecordingCommandRunner(latency=0.05)
+    set_command_runner(runner)
+    ...
+    print(runner.commands)
+"""
+
+import asyncio
+import shutil
+import threading
+import subprocess
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 0.5
+
+# Windows command lines are limited to 32767 characters
+MAX_COMMAND_LENGTH = 30_000
+
+CommandResult = namedtuple('CommandResult', ['args', 'returncode', 'stdout', 'stderr', 'attempts', 'timed_out'])
+
+def check_result(result: CommandResult) -> CommandResult:
+    """Raise the subprocess exception subprocess.run(check=True) would have raised"""
+    if result.timed_out:
+        raise subprocess.TimeoutExpired(result.args, None, result.stdout, result.stderr)
+    if result.returncode is None:
+        raise OSError(f"Could not run {result.args[0]}: {result.stderr}")
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result
+
+def batch_commands(prefix: Sequence[str], paths: Iterable, max_paths: int = 64,
+                   max_length: int = MAX_COMMAND_LENGTH) -> List[List[str]]:
+    """Split a tool invocation over many paths into as few command lines as allowed"""
+    commands = []
+    current = []
+    length = sum(len(arg) + 1 for arg in prefix)
+    for path in paths:
+        path = str(path)
+        if current and (len(current) >= max_paths or length + len(path) + 3 > max_length):
+            commands.append(list(prefix) + current)
+            current = []
+            length = sum(len(arg) + 1 for arg in prefix)
+        current.append(path)
+        length += len(path) + 3  # Quotes and separator
+    if current:
+        commands.append(list(prefix) + current)
+    return commands
+
+class CommandRunner:
+    """Runs external commands on a background event loop with bounded concurrency"""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, retry_delay: float = DEFAULT_RETRY_DELAY):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._tools: Dict[str, bool] = {}
+
+    def supports(self, tool: str) -> bool:
+        """Return True if the tool can be found on this machine"""
+        if tool not in self._tools:
+            self._tools[tool] = shutil.which(tool) is not None
+        return self._tools[tool]
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop on first use"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name='command-runner', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _execute(self, args: List[str], timeout: float):
+        """Run one attempt of a command, returning (returncode, stdout, stderr)"""
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        return (process.returncode,
+                stdout.decode('utf-8', errors='replace'),
+                stderr.decode('utf-8', errors='replace'))
+
+    async def run_async(self, args: Sequence[str], timeout: Optional[float] = None) -> CommandResult:
+        """Run a command on the runner's loop, retrying failed attempts"""
+        args = [str(arg) for arg in args]
+        timeout = timeout or self.timeout
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        result = None
+        for attempt in range(1, self.retries + 2):
+            async with self._semaphore:
+                try:
+                    returncode, stdout, stderr = await self._execute(args, timeout)
+                    result = CommandResult(args, returncode, stdout, stderr, attempt, False)
+                except asyncio.TimeoutError:
+                    result = CommandResult(args, None, '', f"Timed out after {timeout}s", attempt, True)
+                except OSError as e:
+                    result = CommandResult(args, None, '', str(e), attempt, False)
+            if result.returncode == 0:
+                return result
+            if attempt <= self.retries:
+                await asyncio.sleep(self.retry_delay * attempt)
+        return result
+
+    def submit(self, args: Sequence[str], timeout: Optional[float] = None) -> Future:
+        """Start a command from any thread, returning a future for its CommandResult"""
+        return asyncio.run_coroutine_threadsafe(self.run_async(args, timeout), self._ensure_loop())
+
+    def run(self, args: Sequence[str], timeout: Optional[float] = None, check: bool = False) -> CommandResult:
+        """Run a command and wait for it, like subprocess.run"""
+        result = self.submit(args, timeout).result()
+        return check_result(result) if check else result
+
+    def run_many(self, commands: Iterable[Sequence[str]], timeout: Optional[float] = None,
+                 check: bool = False) -> List[CommandResult]:
+        """Run commands concurrently, returning their results in the given order"""
+        results = [future.result() for future in [self.submit(args, timeout) for args in commands]]
+        if check:
+            for result in results:
+                check_result(result)
+        return results
+
+    def close(self) -> None:
+        """Stop the background event loop"""
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = None
+                self._semaphore = None
+
+class RecordingCommandRunner(CommandRunner):
+    """Fake runner that records commands and returns scripted results
+
+    responses maps a tool name to (returncode, stdout, stderr) or to a callable
+    taking the argument list and returning one. Unlisted tools succeed.
+    """
+
+    def __init__(self, responses: Optional[Dict[str, object]] = None, latency: float = 0.0, **kwargs):
+        kwargs.setdefault('retry_delay', 0.0)
+        super().__init__(**kwargs)
+        self.responses = responses or {}
+        self.latency = latency
+        self.commands: List[List[str]] = []
+        self.running = 0
+        self.peak_running = 0
+
+    def supports(self, tool: str) -> bool:
+        return True
+
+    async def _execute(self, args: List[str], timeout: float):
+        self.commands.append(args)
+        self.running += 1
+        self.peak_running = max(self.peak_running, self.running)
+        try:
+            if self.latency > timeout:
+                await asyncio.sleep(timeout)
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(self.latency)
+        finally:
+            self.running -= 1
+        response = self.responses.get(args[0], (0, '', ''))
+        if callable(response):
+            response = response(args)
+        return response
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+def get_command_runner() -> CommandRunner:
+    """Return the process-wide command runner, creating it on first use"""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = CommandRunner()
+        return _default_runner
+
+def set_command_runner(runner: Optional[CommandRunner]) -> None:
+    """Replace the process-wide command runner, e.g. with a RecordingCommandRunner"""
+    global _default_runner
+    with _default_runner_lock:
+        _default_runner = runner
@@ -0,0 +1,155 @@
+"""
+NTFS Compression
+
+Shared helpers that enable NTFS compression on simulated files and directories
+with compact.exe, run through the shared command runner. Where compact is not
+available they are no-ops that return False.
+
+execute_plan does not compact entries one by one. It hands them to a
+CompressionPlanner, which collects the run's targets and compresses them in
+a few calls once the run is done:
+
+    planner = CompressionPlanner()
+    planner.add_directory(path, created=True)
+    planner.add_file(file_path, compress=False)
+    planner.flush()
+
+Directories whose whole contents were written by the run (created by it, or
+below a directory it cleaned) get one recursive compact per top-most such
+directory. Directories that already existed only get their compression
+attribute set, and the files the run wrote below them are compressed in
+batches, so an unchanged tree is never recompressed. Everything inside a
+recursively compressed directory is left to that one call. With a
+RecordingCommandRunner the resulting commands can be checked on Linux.
+"""
+
+import os
+import threading
+from typing import Callable, Iterable, List, Optional, Set
+
+from command_runner import CommandRunner, batch_commands, get_command_runner
+
+def compress_file(file_path, runner: Optional[CommandRunner] = None) -> bool:
+    """Compress a file using NTFS compression on Windows"""
+    runner = runner or get_command_runner()
+    if not runner.supports('compact'):
+        return False
+    result = runner.run(['compact', '/c', str(file_path)])
+    if result.returncode != 0:
+        print(f"Warning: Failed to compress {file_path}: {result.stderr.strip()}")
+        return False
+    return True
+
+def compress_files(file_paths: Iterable, runner: Optional[CommandRunner] = None) -> bool:
+    """Compress many files, passing as many paths to each compact call as it accepts"""
+    runner = runner or get_command_runner()
+    if not runner.supports('compact'):
+        return False
+    success = True
+    for result in runner.run_many(batch_commands(['compact', '/c'], file_paths)):
+        if result.returncode != 0:
+            print(f"Warning: Failed to compress {len(result.args) - 2} files: {result.stderr.strip()}")
+            success = False
+    return success
+
+def compress_directory(dir_path, runner: Optional[CommandRunner] = None) -> bool:
+    """Enable NTFS compression on a directory and all its contents"""
+    runner = runner or get_command_runner()
+    if not runner.supports('compact'):
+        return False
+    # Use compact.exe with /s flag for recursive compression
+    result = runner.run(['compact', '/c', '/s', str(dir_path)])
+    if result.returncode != 0:
+        print(f"Warning: Failed to compress directory {dir_path}: {result.stderr.strip()}")
+        return False
+    return True
+
+def _has_ancestor(path: str, dirs: Set[str], include_self: bool = False) -> bool:
+    """Return whether a directory in dirs contains path"""
+    if include_self and path in dirs:
+        return True
+    parent = os.path.dirname(path)
+    while parent != path:
+        if parent in dirs:
+            return True
+        path, parent = parent, os.path.dirname(parent)
+    return False
+
+class CompressionPlanner:
+    """Compression targets of one run, compacted together by flush()"""
+
+    def __init__(self, runner: Optional[CommandRunner] = None):
+        self.runner = runner or get_command_runner()
+        self.enabled = self.runner.supports('compact')
+        self.recursive: Set[str] = set()
+        self.existing: Set[str] = set()
+        self.cleaned: Set[str] = set()
+        self.files: List[str] = []
+        self._lock = threading.Lock()
+
+    def add_clean(self, dir_path) -> None:
+        """Note a directory that was emptied, so everything below it is new"""
+        if self.enabled:
+            with self._lock:
+                self.cleaned.add(str(dir_path))
+
+    def add_directory(self, dir_path, created: bool) -> None:
+        """Add a directory to compress with everything in it"""
+        if not self.enabled:
+            return
+        path = str(dir_path)
+        with self._lock:
+            if created or _has_ancestor(path, self.cleaned, include_self=True):
+                self.recursive.add(path)
+            else:
+                self.existing.add(path)
+
+    def add_file(self, file_path, compress: bool) -> None:
+        """Add a file written by the run, compressing it if asked or if it lies in a compressed directory"""
+        if not self.enabled:
+            return
+        path = str(file_path)
+        with self._lock:
+            if _has_ancestor(path, self.recursive):
+                return
+            if compress or _has_ancestor(path, self.existing):
+                self.files.append(path)
+
+    def get_commands(self) -> List[List[str]]:
+        """Return the compact calls that cover every target collected so far"""
+        with self._lock:
+            return self._get_commands()
+
+    def _get_commands(self) -> List[List[str]]:
+        tops = sorted(path for path in self.recursive if not _has_ancestor(path, self.recursive))
+        covered = set(tops)
+        existing = sorted(path for path in self.existing if not _has_ancestor(path, covered, include_self=True))
+        files = [path for path in self.files if not _has_ancestor(path, covered)]
+        return ([['compact', '/c', '/s', path] for path in tops] +
+                batch_commands(['compact', '/c'], existing + files))
+
+    def flush(self, on_compressed: Optional[Callable[[str, bool], None]] = None) -> bool:
+        """Run the collected compact calls concurrently and start over
+
+        on_compressed, when given, is called with every path compact succeeded
+        on and whether it was compressed recursively.
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            commands = self._get_commands()
+            self.recursive.clear()
+            self.existing.clear()
+            self.cleaned.clear()
+            self.files.clear()
+        success = True
+        for result in self.runner.run_many(commands):
+            recursive = '/s' in result.args
+            if result.returncode != 0:
+                target = f"directory {result.args[-1]}" if recursive else f"{len(result.args) - 2} paths"
+                print(f"Warning: Failed to compress {target}: {result.stderr.strip()}")
+                success = False
+            elif on_compressed:
+                for path in result.args[3 if recursive else 2:]:
+                    on_compressed(path, recursive)
+        return success
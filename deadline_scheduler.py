@@ -0,0 +1,244 @@
+"""
+Deadline Scheduler
+
+Populates as much of the environment as fits in a fixed time budget, for
+when a usable environment is needed by a deadline (a demo in 30 minutes)
+rather than a complete one whenever it finishes.
+
+Work is reordered breadth-first into tiers:
+
+    structure    every clean and directory entry, in plan order
+    small        files under --small-size
+    medium       everything else
+    large        files of --large-size and over, and PSTs, ISOs and disk images
+
+Within a tier the files of all users, projects and departments are
+interleaved (the first file of every unit, then the second, ...), so an
+interrupted tier still leaves every unit with something in it.
+
+The time taken per unit of weight (files and allocated bytes, weighed as in
+populate_shards) is measured as the run goes. Before each file, the time to
+finish the executor's backlog plus the file itself is predicted and checked
+against the time left; files that would overrun the deadline are deferred,
+and nothing new starts once the deadline has passed. Work already started
+is finished, so the partial environment is consistent: every directory
+exists and every created file is complete. With the checkpoint journal (on by
+default), a later run with --resume, or with no --minutes, fills in what was
+deferred.
+
+The reordered plan is held in memory, unlike the streaming populate scripts.
+
+Usage:
+    python deadline_scheduler.py --minutes N [options]
+
+Options:
+    --minutes N          Time budget, counted from the start of the run
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to populate (default: all)
+    --small-size BYTES   Files below this size are in the small tier (default: 1MB)
+    --large-size BYTES   Files of this size and over are in the large tier (default: 500MB)
+    --file-cost BYTES    Weight of creating one file, in allocated-byte equivalents
+
+Example:
+    python deadline_scheduler.py --minutes 30 --allocation sparse
+    python deadline_scheduler.py --minutes 10 --resume
+"""
+
+import time
+import argparse
+import itertools
+from pathlib import PurePosixPath
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args, get_allocated_bytes
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import FILE, STAGE_ORDER, PlanEntry, ExecutionStats, load_company_data, execute_plan
+from populate_shards import DEFAULT_FILE_COST, get_root_entries, iter_work_units, unit_weight
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+
+DEFAULT_SMALL_SIZE = 1_000_000
+DEFAULT_LARGE_SIZE = 500_000_000
+
+# Always scheduled last, whatever their planned size
+LARGE_EXTENSIONS = {'.pst', '.ost', '.iso', '.vmdk', '.vhd', '.vhdx', '.ova', '.qcow2'}
+
+TIER_NAMES = ['structure', 'small', 'medium', 'large']
+
+# Weight measured before predictions are trusted
+CALIBRATION_WEIGHT = 50 * DEFAULT_FILE_COST
+
+def get_tier(entry: PlanEntry, small_size: int = DEFAULT_SMALL_SIZE, large_size: int = DEFAULT_LARGE_SIZE) -> int:
+    """Return the index in TIER_NAMES of the tier an entry runs in"""
+    if entry.kind != FILE:
+        return 0
+    if entry.size >= large_size or PurePosixPath(entry.path).suffix.lower() in LARGE_EXTENSIONS:
+        return 3
+    return 1 if entry.size < small_size else 2
+
+def build_tiers(company_data: Dict, stages: Iterable[str] = STAGE_ORDER, small_size: int = DEFAULT_SMALL_SIZE,
+                large_size: int = DEFAULT_LARGE_SIZE) -> List[List[PlanEntry]]:
+    """Plan every unit and reorder the entries into breadth-first tiers"""
+    structure = list(get_root_entries(stages))
+    by_unit = [[], [], []]
+    for _, entries in iter_work_units(company_data, stages):
+        unit_files = [[], [], []]
+        for entry in entries:
+            tier = get_tier(entry, small_size, large_size)
+            if tier == 0:
+                structure.append(entry)
+            else:
+                unit_files[tier - 1].append(entry)
+        for tier, files in enumerate(unit_files):
+            if files:
+                by_unit[tier].append(files)
+
+    tiers = [structure]
+    for units in by_unit:
+        # Round-robin over units: first file of each, then second of each, ...
+        interleaved = itertools.chain.from_iterable(itertools.zip_longest(*units))
+        tiers.append([entry for entry in interleaved if entry is not None])
+    return tiers
+
+class DeadlinePlan:
+    """Feeds tiers to execute_plan, deferring what is predicted to miss the deadline"""
+
+    def __init__(self, tiers: List[List[PlanEntry]], budget: Optional[float], factory: FileFactory,
+                 file_cost: int = DEFAULT_FILE_COST, journal=None, executor=None,
+                 started: Optional[float] = None):
+        self.tiers = tiers
+        self.deadline = (started or time.monotonic()) + budget if budget else None
+        self.factory = factory
+        self.file_cost = file_cost
+        self.journal = journal
+        self.executor = executor
+        self.submitted = [0] * len(tiers)
+        self.deferred = [0] * len(tiers)
+        self.weight = 0
+        self.started = None
+
+    def entry_weight(self, entry: PlanEntry) -> int:
+        if entry.kind != FILE:
+            return unit_weight(1, 0, self.file_cost)
+        size = self.factory.materialized_size(entry.size)
+        allocated = get_allocated_bytes(entry.path, size, self.factory.allocation, self.factory.allocation_ratios)
+        return unit_weight(1, allocated, self.file_cost)
+
+    def backlog(self) -> float:
+        """Return the estimated weight submitted to the executor but not yet finished"""
+        count = sum(self.submitted)
+        if not self.executor or not count:
+            return 0.0
+        return self.executor.pending * self.weight / count
+
+    def seconds_per_weight(self) -> Optional[float]:
+        """Return the measured time per unit of finished weight, or None while calibrating"""
+        finished = self.weight - self.backlog()
+        if finished < CALIBRATION_WEIGHT:
+            return None
+        return (time.monotonic() - self.started) / finished
+
+    def predict(self, entries: Iterable[PlanEntry]) -> Optional[float]:
+        """Return the predicted seconds to execute entries, or None while calibrating"""
+        rate = self.seconds_per_weight()
+        return None if rate is None else rate * sum(self.entry_weight(entry) for entry in entries
+                                                    if not (self.journal and self.journal.is_done(entry)))
+
+    def __iter__(self) -> Iterator[PlanEntry]:
+        self.started = time.monotonic()
+        for tier, entries in enumerate(self.tiers):
+            if self.deadline:
+                predicted = self.predict(entries)
+                left = self.deadline - time.monotonic()
+                if predicted is not None:
+                    print(f"Starting {TIER_NAMES[tier]} tier: {len(entries):,} entries, predicted "
+                          f"{predicted:,.0f}s with {max(left, 0):,.0f}s left")
+            for entry in entries:
+                if self.journal and self.journal.is_done(entry):
+                    continue
+                weight = self.entry_weight(entry)
+                if self.deadline:
+                    now = time.monotonic()
+                    rate = self.seconds_per_weight()
+                    # Directories always run; without them the partial environment is inconsistent
+                    if now >= self.deadline and tier > 0:
+                        self.deferred[tier] += 1
+                        continue
+                    if tier > 0 and rate is not None and now + rate * (self.backlog() + weight) > self.deadline:
+                        self.deferred[tier] += 1
+                        continue
+                self.weight += weight
+                self.submitted[tier] += 1
+                yield entry
+
+    def summary(self) -> str:
+        lines = []
+        for tier, name in enumerate(TIER_NAMES):
+            line = f"  {name:<10} {self.submitted[tier]:>9,} run"
+            if self.deferred[tier]:
+                line += f", {self.deferred[tier]:,} deferred"
+            lines.append(line)
+        return '\n'.join(lines)
+
+def populate_by_deadline(company_data: Dict, budget: Optional[float], stages: Iterable[str] = STAGE_ORDER,
+                         factory: Optional[FileFactory] = None, executor=None, journal=None, store=None,
+                         small_size: int = DEFAULT_SMALL_SIZE, large_size: int = DEFAULT_LARGE_SIZE,
+                         file_cost: int = DEFAULT_FILE_COST,
+                         started: Optional[float] = None) -> ExecutionStats:
+    """Populate tier by tier until the budget (in seconds) runs out"""
+    factory = factory or FileFactory()
+    tiers = build_tiers(company_data, stages, small_size, large_size)
+    print("Planned " + ", ".join(f"{len(entries):,} {name}" for name, entries in zip(TIER_NAMES, tiers)))
+
+    plan = DeadlinePlan(tiers, budget, factory, file_cost, journal, executor, started)
+    # One entry at a time, so every entry is checked against the clock just before it runs
+    stats = execute_plan(plan, factory=factory, chunk_size=1, queue_depth=1, executor=executor,
+                         journal=journal, store=store)
+    print(plan.summary())
+    if sum(plan.deferred):
+        print(f"Stopped at the deadline with {sum(plan.deferred):,} files deferred"
+              + ("; run again with --resume to create them" if journal else ""))
+    return stats
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate as much of the environment as fits in a time budget')
+    parser.add_argument('--minutes', type=float,
+                        help='Time budget, counted from the start of the run (default: no deadline)')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to populate (default: all)')
+    parser.add_argument('--small-size', type=int, default=DEFAULT_SMALL_SIZE, metavar='BYTES',
+                        help=f'Files below this size are in the small tier (default: {DEFAULT_SMALL_SIZE:,})')
+    parser.add_argument('--large-size', type=int, default=DEFAULT_LARGE_SIZE, metavar='BYTES',
+                        help=f'Files of this size and over are in the large tier (default: {DEFAULT_LARGE_SIZE:,})')
+    parser.add_argument('--file-cost', type=int, default=DEFAULT_FILE_COST, metavar='BYTES',
+                        help=f'Weight of creating one file, in allocated-byte equivalents (default: {DEFAULT_FILE_COST})')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'deadline_scheduler')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    started = time.monotonic()
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    company_data = load_company_data(args.data_file)
+
+    store = store_from_args(args, company_data)
+    stats = populate_by_deadline(company_data, args.minutes * 60 if args.minutes else None, args.stages,
+                                 factory_from_args(args), executor_from_args(args), journal_from_args(args),
+                                 store, args.small_size, args.large_size, args.file_cost, started)
+    if store:
+        store.close()
+    print(f"\nCreated {stats.summary()} in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+File Dates
+
+Stateless, deterministic file timestamps for the populate scripts.
+
+A file's date is derived from a hash of its key (normally the file name), so
+the same key always gets the same date without touching the global `random`
+state. Nothing is seeded or reseeded, which makes the engine cheap and safe to
+call from any number of threads.
+
+Each directory type has an age profile: a date range and a distribution shape.
+
+    uniform  Every day in the range is equally likely
+    recent   Skewed towards the end of the range (recently touched files)
+    aged     Skewed towards the start of the range (stale archives)
+
+Profiles live in AGE_PROFILES and can be overridden on the command line:
+
+    python U_populate_desktop.py --age-profile desktop=2022-01-01:2024-12-31:recent
+
+hash_timestamps() is the batch API: it resolves a profile once and maps a whole
+list of keys in a single pass. hash_timestamper() resolves a profile once and
+returns a function, for planners that date files one at a time as they stream.
+"""
+
+import hashlib
+import datetime
+from typing import Callable, Dict, Iterable, List
+
+# Shapes applied to a uniform fraction in [0, 1) before it is scaled to the range
+DISTRIBUTIONS: Dict[str, Callable[[float], float]] = {
+    'uniform': lambda u: u,
+    'recent': lambda u: u ** 0.5,
+    'aged': lambda u: u * u,
+}
+
+# Date range and distribution for each directory type
+AGE_PROFILES = {
+    'default': {'start': '2023-01-01', 'end': '2024-12-31', 'distribution': 'uniform'},
+    'desktop': {'start': '2023-01-01', 'end': '2024-12-31', 'distribution': 'uniform'},
+    'downloads': {'start': '2023-01-01', 'end': '2024-12-31', 'distribution': 'uniform'},
+    'emails': {'start': '2018-01-01', 'end': '2024-12-31', 'distribution': 'uniform'},
+    'management': {'start': '2024-01-01', 'end': '2024-12-31', 'distribution': 'uniform'},
+    # Timeline given to G: projects whose company data has no dates
+    'project': {'start': '2023-01-01', 'end': '2025-12-31', 'distribution': 'uniform'},
+}
+
+_HASH_SCALE = float(1 << 64)
+_SECONDS_PER_DAY = 86400
+
+def hash_fraction(key: str) -> float:
+    """Map a key to a uniformly distributed fraction in [0, 1)"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / _HASH_SCALE
+
+def _resolve(start_date: str, end_date: str, distribution: str):
+    """Return (start timestamp, days in range, shape function) for a range"""
+    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown age distribution: {distribution}")
+    return start.timestamp(), (end - start).days, DISTRIBUTIONS[distribution]
+
+def _resolve_profile(profile: str):
+    """Resolve a named age profile"""
+    settings = AGE_PROFILES.get(profile, AGE_PROFILES['default'])
+    return _resolve(settings['start'], settings['end'], settings['distribution'])
+
+def _timestamp(key: str, start_ts: float, days: int, shape) -> float:
+    """Map a key onto a whole day within a resolved range"""
+    day = min(days, int(shape(hash_fraction(key)) * (days + 1)))
+    return start_ts + day * _SECONDS_PER_DAY
+
+def hash_timestamp(key: str, profile: str = 'default') -> float:
+    """Return the deterministic POSIX timestamp for a key under an age profile"""
+    return _timestamp(key, *_resolve_profile(profile))
+
+def hash_date(key: str, profile: str = 'default') -> datetime.datetime:
+    """Return the deterministic date for a key under an age profile"""
+    return datetime.datetime.fromtimestamp(hash_timestamp(key, profile))
+
+def hash_timestamper(profile: str = 'default') -> Callable[[str], float]:
+    """Return a function that dates keys under a profile resolved only once"""
+    start_ts, days, shape = _resolve_profile(profile)
+    return lambda key: _timestamp(key, start_ts, days, shape)
+
+def hash_timestamps(keys: Iterable[str], profile: str = 'default') -> List[float]:
+    """Return timestamps for many keys, resolving the profile only once"""
+    return list(map(hash_timestamper(profile), keys))
+
+def hash_timestamp_between(key: str, start_date: str, end_date: str,
+                           distribution: str = 'uniform') -> float:
+    """Return the deterministic timestamp for a key within an explicit range"""
+    return _timestamp(key, *_resolve(start_date, end_date, distribution))
+
+def parse_age_profiles(values) -> None:
+    """Apply TYPE=START:END[:DISTRIBUTION] overrides to AGE_PROFILES"""
+    for value in values or []:
+        name, _, spec = value.partition('=')
+        parts = spec.split(':')
+        if not name or len(parts) not in (2, 3):
+            raise ValueError(f"Invalid age profile '{value}', expected TYPE=START:END[:DISTRIBUTION]")
+        distribution = parts[2] if len(parts) == 3 else 'uniform'
+        _resolve(parts[0], parts[1], distribution)  # Validate before applying
+        AGE_PROFILES[name] = {'start': parts[0], 'end': parts[1], 'distribution': distribution}
+
+def add_date_arguments(parser):
+    """Add the age profile option to a populate script's argument parser"""
+    parser.add_argument('--age-profile', action='append', metavar='TYPE=START:END[:DIST]',
+                        help='Override the date range and distribution (uniform, recent, aged) '
+                             f'for a directory type: {", ".join(sorted(AGE_PROFILES))}')
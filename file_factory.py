@@ -0,0 +1,542 @@
+"""
+File Factory
+
+Shared file creation engine for the populate scripts (U_drive_setup.py,
+U_populate_*.py and G_drive_populate.py). It decides how many of a simulated
+file's blocks are physically allocated on the target volume.
+
+Allocation modes:
+    full     Allocate every block (posix_fallocate / fsutil createnew)
+    sparse   Seek-and-write, the file is entirely holes
+    ratio    Allocate a per-file-type fraction of the blocks, spread across the
+             file in evenly spaced extents, and leave the rest as holes
+    content  Fill every byte with real (non-zero, non-repeating) content
+
+The ratio mode lets physical-vs-logical storage behaviour be modelled without
+allocating terabytes. Ratios are looked up by file extension in
+ALLOCATION_RATIOS and can be overridden on the command line, e.g.:
+
+    python U_populate_emails.py --allocation ratio --allocation-ratio .pst=0.4
+
+Miniature replicas:
+    --scale-divisor N materializes every file at size / N and --size-cap BYTES
+    limits each file to a fixed size. The tree is otherwise identical, and the
+    true logical size of every scaled file is recorded in a sidecar manifest
+    (SIZE_MANIFEST_NAME) at the root of the simulated drive, so totals can be
+    compared against the full-scale environment with load_size_manifest().
+
+Real content:
+    Files of at least DIRECT_IO_THRESHOLD bytes are streamed with O_DIRECT from
+    aligned, reusable per-thread buffers so tens of GB of PSTs and ISOs do not
+    evict the host's page cache. Where O_DIRECT is unsupported (tmpfs, some
+    network filesystems, Windows) writes fall back to buffered I/O, flushing and
+    dropping each written window with posix_fadvise(DONTNEED) where available.
+    Every file's bytes come from a nonce derived from the company seed
+    (seeds.py) and the file's content key, its drive and plan path, so no two
+    files share content and the same plan writes the same bytes on every
+    target. Each 4K block is stamped with the nonce and its offset, so no two
+    blocks anywhere can be deduplicated.
+"""
+
+import os
+import json
+import mmap
+import errno
+import struct
+import threading
+import platform
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from command_runner import get_command_runner
+from rate_limit import RateLimiter, add_rate_limit_arguments, rate_limiter_from_args
+from seeds import SeededRandom, derive_seed, get_company_seed
+
+ALLOCATION_MODES = ('full', 'sparse', 'ratio', 'content')
+
+# Fraction of the logical size that is physically allocated, by file type
+ALLOCATION_RATIOS = {
+    # Outlook preallocates its data files and rarely compacts them
+    '.pst': 0.85,
+    '.ost': 0.85,
+    # Already-compressed media and archives are dense
+    '.iso': 1.0,
+    '.zip': 1.0,
+    '.7z': 1.0,
+    '.tar': 1.0,
+    '.gz': 1.0,
+    '.mp4': 1.0,
+    '.mxf': 1.0,
+    '.msi': 1.0,
+    '.exe': 1.0,
+    # Thin provisioned virtual disks are mostly empty
+    '.vmdk': 0.3,
+    '.vhdx': 0.3,
+    '.vdi': 0.3,
+    '.qcow2': 0.3,
+    # Databases keep free pages inside the file
+    '.db': 0.6,
+    '.mdf': 0.6,
+    # Model weights and checkpoints are written in full
+    '.pt': 1.0,
+    '.pth': 1.0,
+    '.h5': 1.0,
+    '.safetensors': 1.0,
+    '.onnx': 1.0,
+    '.bin': 1.0,
+    '.gguf': 1.0,
+}
+
+# Ratio used for file types not listed above
+DEFAULT_ALLOCATION_RATIO = 0.5
+
+# Number of allocated extents a partially allocated file is split into
+ALLOCATION_EXTENTS = 16
+
+# Allocation granularity, extents are aligned to this boundary
+BLOCK_SIZE = 4096
+
+_ZERO_CHUNK = bytes(1024 * 1024)
+
+# Content-mode files at least this large bypass the page cache
+DIRECT_IO_THRESHOLD = 64 * 1024 * 1024
+
+# Size of each aligned write buffer, a multiple of DIRECT_IO_ALIGNMENT
+DIRECT_IO_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Offset, length and buffer address alignment required by O_DIRECT
+DIRECT_IO_ALIGNMENT = 4096
+
+# Buffered fallback flushes and drops the page cache after each window
+FADVISE_WINDOW = 64 * 1024 * 1024
+
+# Written at the start of every content block: file nonce and offset
+_BLOCK_STAMP = struct.Struct('<QQ')
+
+_content_buffers = threading.local()
+
+# Whether timestamps can be set on an open descriptor (not on Windows)
+_UTIME_ON_FD = os.utime in os.supports_fd
+
+def get_allocation_ratio(file_path, ratios: Optional[Dict[str, float]] = None) -> float:
+    """Return the allocated fraction configured for a file's type"""
+    ratios = ALLOCATION_RATIOS if ratios is None else ratios
+    suffix = Path(file_path).suffix.lower()
+    return ratios.get(suffix, ratios.get('*', DEFAULT_ALLOCATION_RATIO))
+
+def _write_zeros(f, offset: int, length: int) -> None:
+    """Physically write zeros over a byte range of an open file"""
+    f.seek(offset)
+    while length > 0:
+        chunk = min(length, len(_ZERO_CHUNK))
+        f.write(_ZERO_CHUNK[:chunk])
+        length -= chunk
+
+def _apply_times(f, mtime: Optional[float]) -> None:
+    """Set access and modification times on an open file before it is closed"""
+    if mtime is None or not _UTIME_ON_FD:
+        return
+    if hasattr(f, 'flush'):
+        # Buffered data written after the utime would bump mtime again
+        f.flush()
+        f = f.fileno()
+    os.utime(f, (mtime, mtime))
+
+def _mark_sparse(file_path) -> None:
+    """Flag a file as sparse on NTFS so unwritten ranges stay unallocated"""
+    get_command_runner().run(['fsutil', 'sparse', 'setflag', str(file_path)], check=True)
+
+def create_sparse_file(file_path, size: int, mtime: Optional[float] = None) -> None:
+    """Create a file of the given logical size with no allocated blocks"""
+    with open(file_path, 'wb') as f:
+        if size > 0:
+            f.seek(size - 1)
+            f.write(b'\0')
+        _apply_times(f, mtime)
+
+def create_allocated_file(file_path, size: int, mtime: Optional[float] = None) -> None:
+    """Create a file of the given size with every block allocated"""
+    system = platform.system().lower()
+    if system == 'windows':
+        # createnew refuses to overwrite, so an existing file (a resize in reconcile, a rerun) goes first
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+        get_command_runner().run(['fsutil', 'file', 'createnew', str(file_path), str(size)], check=True)
+        return
+
+    with open(file_path, 'wb') as f:
+        if size > 0:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                _write_zeros(f, 0, size)
+        _apply_times(f, mtime)
+
+def get_allocation_extents(size: int, ratio: float,
+                           extents: int = ALLOCATION_EXTENTS):
+    """Return (offset, length) ranges covering `ratio` of a file, spread evenly"""
+    allocated = int(size * ratio) // BLOCK_SIZE * BLOCK_SIZE
+    if allocated <= 0:
+        return []
+
+    count = max(1, min(extents, allocated // BLOCK_SIZE))
+    length = allocated // count // BLOCK_SIZE * BLOCK_SIZE or BLOCK_SIZE
+    stride = size // count // BLOCK_SIZE * BLOCK_SIZE
+    return [(i * stride, min(length, size - i * stride)) for i in range(count)]
+
+def create_partial_file(file_path, size: int, ratio: float,
+                        extents: int = ALLOCATION_EXTENTS, mtime: Optional[float] = None) -> None:
+    """Create a file with `ratio` of its blocks allocated and the rest as holes"""
+    system = platform.system().lower()
+
+    with open(file_path, 'wb') as f:
+        pass
+    if system == 'windows':
+        _mark_sparse(file_path)
+
+    with open(file_path, 'r+b') as f:
+        f.truncate(size)
+        for offset, length in get_allocation_extents(size, ratio, extents):
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), offset, length)
+            else:
+                _write_zeros(f, offset, length)
+        _apply_times(f, mtime)
+
+def get_content_nonce(content_key) -> int:
+    """Return the seed of one file's content, identified by its content key"""
+    return derive_seed(get_company_seed(), 'content', content_key)
+
+def _get_content_buffer(nonce: int, size: int):
+    """Return this thread's page-aligned buffer, filled with one file's seeded content"""
+    buffer = getattr(_content_buffers, 'buffer', None)
+    if buffer is None:
+        # Anonymous mmaps are page aligned, which satisfies O_DIRECT
+        buffer = mmap.mmap(-1, DIRECT_IO_BUFFER_SIZE)
+        _content_buffers.buffer = buffer
+    length = min(len(buffer), -(-size // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT)
+    buffer[:length] = SeededRandom(nonce).randbytes(length)
+    return buffer
+
+def _stamp_blocks(buffer, length: int, nonce: int, offset: int) -> None:
+    """Stamp every block of a chunk with the file nonce and its offset so storage cannot deduplicate it"""
+    for start in range(0, length, DIRECT_IO_ALIGNMENT):
+        _BLOCK_STAMP.pack_into(buffer, start, nonce, offset + start)
+
+def _write_content_direct(file_path, size: int, nonce: int, mtime: Optional[float] = None,
+                          throttle: Optional[Callable[[int], None]] = None) -> None:
+    """Stream content to a file with O_DIRECT, raising OSError if unsupported"""
+    buffer = _get_content_buffer(nonce, size)
+    view = memoryview(buffer)
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o666)
+    try:
+        offset = 0
+        while offset < size:
+            remaining = size - offset
+            # The tail is padded to a full aligned block and truncated afterwards
+            length = min(len(buffer), -(-remaining // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT)
+            if throttle:
+                throttle(length)
+            _stamp_blocks(buffer, length, nonce, offset)
+            written = os.write(fd, view[:length])
+            if written <= 0:
+                raise OSError(errno.EIO, f"Short direct write to {file_path}")
+            offset += written
+        if offset != size:
+            os.ftruncate(fd, size)
+        _apply_times(fd, mtime)
+    finally:
+        view.release()
+        os.close(fd)
+
+def _write_content_buffered(file_path, size: int, nonce: int, drop_cache: bool,
+                            mtime: Optional[float] = None,
+                            throttle: Optional[Callable[[int], None]] = None) -> None:
+    """Write content through the page cache, optionally dropping it as we go"""
+    buffer = _get_content_buffer(nonce, size)
+    view = memoryview(buffer)
+    can_drop = drop_cache and hasattr(os, 'posix_fadvise')
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        offset = 0
+        window_start = 0
+        while offset < size:
+            length = min(len(buffer), size - offset)
+            if throttle:
+                throttle(length)
+            _stamp_blocks(buffer, length, nonce, offset)
+            offset += os.write(fd, view[:length])
+            if can_drop and (offset - window_start >= FADVISE_WINDOW or offset >= size):
+                # Dirty pages cannot be dropped, so flush the window first
+                os.fdatasync(fd)
+                os.posix_fadvise(fd, window_start, offset - window_start, os.POSIX_FADV_DONTNEED)
+                window_start = offset
+        _apply_times(fd, mtime)
+    finally:
+        view.release()
+        os.close(fd)
+
+def create_content_file(file_path, size: int,
+                        direct_io_threshold: Optional[int] = DIRECT_IO_THRESHOLD,
+                        mtime: Optional[float] = None,
+                        throttle: Optional[Callable[[int], None]] = None, content_key=None) -> None:
+    """Create a file filled with real content, bypassing the page cache if large
+
+    The content is derived from content_key (the file path by default).
+    throttle, when given, is called with the size of every chunk before it
+    is written.
+    """
+    nonce = get_content_nonce(Path(file_path).as_posix() if content_key is None else content_key)
+    large = direct_io_threshold is not None and size >= direct_io_threshold
+    if large and hasattr(os, 'O_DIRECT'):
+        try:
+            _write_content_direct(file_path, size, nonce, mtime, throttle)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+    _write_content_buffered(file_path, size, nonce, drop_cache=large, mtime=mtime, throttle=throttle)
+
+def get_allocated_bytes(file_path, size: int, allocation: str = 'full', ratios=None) -> int:
+    """Return how many bytes creating a file will allocate on disk"""
+    if size <= 0:
+        return 0
+    if allocation == 'sparse':
+        return min(size, BLOCK_SIZE)  # The final byte allocates one block
+    if allocation == 'ratio':
+        ratio = get_allocation_ratio(file_path, ratios)
+        if ratio < 1.0:
+            extents = get_allocation_extents(size, ratio) if ratio > 0.0 else []
+            return sum(length for _, length in extents) or min(size, BLOCK_SIZE)
+    return size
+
+def create_large_file(file_path, size, allocation='full', ratios=None,
+                      direct_io_threshold=DIRECT_IO_THRESHOLD, mtime=None, throttle=None, content_key=None):
+    """Create a large file using the requested allocation mode
+
+    When mtime is given the access and modification times are set on the open
+    file as part of creation, or straight afterwards where the platform cannot
+    set times on a descriptor. In content mode throttle is called with each
+    chunk size before it is written, and content_key selects the content.
+    """
+    try:
+        if allocation == 'content' and size > 0:
+            create_content_file(file_path, size, direct_io_threshold, mtime, throttle, content_key)
+        elif allocation == 'sparse' or size <= 0:
+            create_sparse_file(file_path, size, mtime)
+        elif allocation == 'ratio':
+            ratio = get_allocation_ratio(file_path, ratios)
+            if ratio >= 1.0:
+                create_allocated_file(file_path, size, mtime)
+            elif ratio <= 0.0:
+                create_sparse_file(file_path, size, mtime)
+            else:
+                create_partial_file(file_path, size, ratio, mtime=mtime)
+        else:
+            create_allocated_file(file_path, size, mtime)
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: Failed to create {file_path} with size {size} using {allocation} allocation: {e}")
+        try:
+            # Fallback to seek method
+            create_sparse_file(file_path, size, mtime)
+        except OSError as e:
+            print(f"Error: Could not create file {file_path}: {e}")
+            return False
+    if mtime is not None and not _UTIME_ON_FD:
+        os.utime(file_path, (mtime, mtime))
+    return True
+
+def parse_allocation_ratios(values) -> Dict[str, float]:
+    """Parse EXT=RATIO overrides on top of the default ratio table"""
+    ratios = dict(ALLOCATION_RATIOS)
+    for value in values or []:
+        ext, _, ratio = value.partition('=')
+        if not ratio:
+            raise ValueError(f"Invalid allocation ratio '{value}', expected EXT=RATIO")
+        ext = ext.strip().lower()
+        if ext != '*' and not ext.startswith('.'):
+            ext = '.' + ext
+        ratios[ext] = min(1.0, max(0.0, float(ratio)))
+    return ratios
+
+# Sidecar manifest written at the root of a scaled-down drive
+SIZE_MANIFEST_NAME = '.logical_sizes.jsonl'
+
+class SizeManifest:
+    """Append-only record of the logical size of every scaled-down file"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.path = self.root / SIZE_MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, file_path, logical_size: int, materialized_size: int) -> None:
+        """Append one file's logical and materialized sizes"""
+        try:
+            relative = Path(file_path).relative_to(self.root).as_posix()
+        except ValueError:
+            relative = Path(file_path).as_posix()
+        line = json.dumps({
+            'path': relative,
+            'logical_size': logical_size,
+            'materialized_size': materialized_size,
+        })
+        with self._lock:
+            if self._file is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                # Line buffered so every record is a single append, even with
+                # several populate processes writing the same manifest
+                self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(line + '\n')
+
+    def close(self) -> None:
+        """Flush and close the manifest file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def load_size_manifest(root, existing_only: bool = True) -> Dict[str, int]:
+    """Load the logical size of every recorded file under a drive root
+
+    Later records for the same path win. With existing_only, files that have
+    since been removed from the tree are left out.
+    """
+    root = Path(root)
+    sizes = {}
+    manifest_path = root / SIZE_MANIFEST_NAME
+    if not manifest_path.exists():
+        return sizes
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                sizes[record['path']] = record['logical_size']
+    if existing_only:
+        sizes = {path: size for path, size in sizes.items() if (root / path).exists()}
+    return sizes
+
+class FileFactory:
+    """Creates simulated files with the configured allocation and scale settings"""
+
+    def __init__(self, allocation='full', allocation_ratios=None,
+                 scale_divisor=1, size_cap=None, direct_io_threshold=DIRECT_IO_THRESHOLD,
+                 rate_limiter: Optional[RateLimiter] = None):
+        if allocation not in ALLOCATION_MODES:
+            raise ValueError(f"Unknown allocation mode: {allocation}")
+        if scale_divisor < 1:
+            raise ValueError("scale_divisor must be at least 1")
+        self.allocation = allocation
+        self.allocation_ratios = allocation_ratios
+        self.scale_divisor = scale_divisor
+        self.size_cap = size_cap
+        self.direct_io_threshold = direct_io_threshold
+        self.rate_limiter = rate_limiter
+        self.manifests: Dict[Path, SizeManifest] = {}
+
+    def __copy__(self) -> 'FileFactory':
+        # Copies keep their own manifests, so closing one does not close the other's
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.manifests = {}
+        return clone
+
+    @property
+    def is_scaled(self) -> bool:
+        """True when files are materialized smaller than their logical size"""
+        return self.scale_divisor > 1 or self.size_cap is not None
+
+    def attach_manifest(self, root) -> None:
+        """Record the logical sizes of files below a drive root in that root's sidecar manifest"""
+        root = Path(root)
+        if self.is_scaled and root not in self.manifests:
+            self.manifests[root] = SizeManifest(root)
+
+    def get_manifest(self, file_path, root=None) -> Optional[SizeManifest]:
+        """Return the manifest of the given drive root, or of the attached root holding file_path"""
+        if not self.manifests:
+            return None
+        if root is not None:
+            return self.manifests.get(Path(root))
+        path = Path(file_path)
+        for manifest_root, manifest in self.manifests.items():
+            if manifest_root == path or manifest_root in path.parents:
+                return manifest
+        return None
+
+    def materialized_size(self, size: int) -> int:
+        """Return the on-disk size used for a file of the given logical size"""
+        if size <= 0:
+            return 0
+        scaled = -(-size // self.scale_divisor)  # Round up so files never vanish
+        if self.size_cap is not None:
+            scaled = min(scaled, self.size_cap)
+        return scaled
+
+    def throttle(self, file_path, ops: int = 1, nbytes: int = 0) -> None:
+        """Charge an operation against the rate limits, sleeping as needed"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.charge(file_path, ops, nbytes)
+
+    def create(self, file_path, size: int, mtime: Optional[float] = None, content_key=None,
+               root=None) -> bool:
+        """Create a file standing in for one of the given logical size
+
+        In content mode, files with the same content key get the same bytes
+        wherever they are created. Scaled files are recorded in the manifest
+        of root, the drive root they belong to (found from the path if not
+        given).
+        """
+        actual_size = self.materialized_size(size)
+        throttle = None
+        if self.rate_limiter is not None:
+            if self.allocation == 'content':
+                # Charged chunk by chunk as the content is written
+                self.throttle(file_path)
+                throttle = lambda length: self.rate_limiter.charge(file_path, nbytes=length)
+            else:
+                self.throttle(file_path, nbytes=get_allocated_bytes(
+                    file_path, actual_size, self.allocation, self.allocation_ratios))
+        if not create_large_file(file_path, actual_size, self.allocation, self.allocation_ratios,
+                                 self.direct_io_threshold, mtime, throttle, content_key):
+            return False
+        manifest = self.get_manifest(file_path, root)
+        if manifest is not None:
+            manifest.record(file_path, size, actual_size)
+        return True
+
+    def close(self) -> None:
+        """Close the sidecar manifests, if any"""
+        for manifest in self.manifests.values():
+            manifest.close()
+
+def add_file_factory_arguments(parser, default_allocation='full'):
+    """Add the file creation options to a populate script's argument parser"""
+    parser.add_argument('--allocation', choices=ALLOCATION_MODES, default=default_allocation,
+                        help=f'How file blocks are allocated on disk (default: {default_allocation})')
+    parser.add_argument('--allocation-ratio', action='append', metavar='EXT=RATIO',
+                        help='Override the allocated fraction for a file type in ratio mode, '
+                             'e.g. .pst=0.4 (use *=RATIO for the default)')
+    parser.add_argument('--scale-divisor', type=int, default=1, metavar='N',
+                        help='Build a miniature replica with every file at size / N')
+    parser.add_argument('--size-cap', type=int, metavar='BYTES',
+                        help='Build a miniature replica with no file larger than BYTES')
+    parser.add_argument('--direct-io-threshold', type=int, default=DIRECT_IO_THRESHOLD, metavar='BYTES',
+                        help='In content mode, bypass the page cache for files of at least BYTES '
+                             f'(default: {DIRECT_IO_THRESHOLD})')
+    add_rate_limit_arguments(parser)
+
+def factory_from_args(args) -> FileFactory:
+    """Build a FileFactory from parsed command line arguments"""
+    return FileFactory(
+        allocation=args.allocation,
+        allocation_ratios=parse_allocation_ratios(args.allocation_ratio),
+        scale_divisor=args.scale_divisor,
+        size_cap=args.size_cap,
+        direct_io_threshold=args.direct_io_threshold,
+        rate_limiter=rate_limiter_from_args(args),
+    )
@@ -0,0 +1,258 @@
+"""
+Pipeline
+
+One entry point for a full environment build. Instead of running every script
+of the README's execution order as its own process (each reloading the company
+data, re-probing U: and G: and recompressing the drive roots), the stages are
+modelled as a dependency graph and run in one process over shared state:
+
+    generate     company_data_new.generate_company_data (only with --generate)
+    ad_cleanup   AD_cleanup.cleanup_ad                   after generate
+    ad_setup     AD_setup.setup_ad                       after ad_cleanup
+    g_setup      G_drive_setup.setup_g_drive             after ad_setup
+    g_drive      G_drive_populate.plan_g_drive           after g_setup
+    u_drive      U_drive_setup.plan_u_drive              after generate
+    desktop      U_populate_desktop.plan_desktop         after u_drive
+    downloads    U_populate_downloads.plan_downloads     after u_drive
+    emails       U_populate_emails.plan_emails           after u_drive
+
+A stage starts as soon as everything it depends on has finished, so the U:
+stages run while AD and G: are still being set up, and desktop, downloads and
+emails (disjoint subfolders of each home directory) run side by side.
+Dependencies on stages that were not selected count as already satisfied; a
+failed stage skips everything that depends on it.
+
+The company data is loaded once, the drive roots are resolved and created
+(and compressed) once, and the per-stage planners no longer re-plan the root
+directories. Every populate stage gets its own copy of the file factory and
+its own executor, so concurrent stages share the rate limits but nothing else.
+Finished stages are recorded in the checkpoint journal, and --resume skips
+them. All stages record into one state store, including the AD users and
+groups.
+
+Usage:
+    python pipeline.py [options]
+
+Options:
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to run (default: all but generate)
+    --generate N         Generate a company of N users into --data-file first
+    --parallel N         Stages allowed to run at once (default: all that are ready)
+    --ad-dry-run         Run the AD and G: setup stages without making changes
+    --list               Print the stage graph and exit
+
+Example:
+    python pipeline.py --generate 100 --allocation sparse
+    python pipeline.py --stages u_drive desktop downloads emails g_drive --resume
+"""
+
+import copy
+import json
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional
+
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import get_drive_roots, get_stage_planners, load_company_data, execute_plan
+from populate_shards import get_root_entries
+from reconcile import add_reconcile_arguments
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+
+# One node of the build graph
+Stage = namedtuple('Stage', ['name', 'depends', 'run'])
+
+# Stage outcomes
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+class PipelineContext:
+    """State shared by every stage of one build"""
+
+    def __init__(self, args, company_data: Optional[Dict] = None):
+        self.args = args
+        self.company_data = company_data
+        self.roots = get_drive_roots()
+        self.factory = factory_from_args(args)
+        self.journal = journal_from_args(args)
+        self.store = store_from_args(args)
+
+def run_generate(context: PipelineContext) -> None:
+    """Generate a new company and save it as the data file"""
+    from company_data_new import generate_company_data
+
+    context.company_data = generate_company_data(num_users=context.args.generate)
+    with open(context.args.data_file, 'w', encoding='utf-8') as f:
+        json.dump(context.company_data, f, indent=2, ensure_ascii=False)
+    print(f"Saved new company data to {context.args.data_file}")
+    if context.store:
+        context.store.record_company(context.company_data)
+
+def run_ad_cleanup(context: PipelineContext) -> None:
+    """Remove the users and groups of a previous build"""
+    from AD_cleanup import cleanup_ad
+    cleanup_ad(context.company_data, dry_run=context.args.ad_dry_run, store=context.store)
+
+def run_ad_setup(context: PipelineContext) -> None:
+    """Create the company's groups and users"""
+    from AD_setup import setup_ad
+    setup_ad(context.company_data, dry_run=context.args.ad_dry_run, store=context.store)
+
+def run_g_setup(context: PipelineContext) -> None:
+    """Create the G: project and department directories with their permissions"""
+    from G_drive_setup import setup_g_drive
+    setup_g_drive(context.company_data, str(context.roots['G']), context.args.ad_dry_run, store=context.store)
+
+def populate_stage(stage: str) -> Callable[[PipelineContext], None]:
+    """Return the runner of a populate stage, planned without the shared root directories"""
+    def run(context: PipelineContext) -> None:
+        planner = get_stage_planners()[stage]
+        root_dirs = {(entry.drive, entry.path) for entry in get_root_entries(STAGE_NAMES)}
+        entries = (entry for entry in planner(context.company_data)
+                   if (entry.drive, entry.path) not in root_dirs)
+        executor = executor_from_args(context.args)
+        stats = execute_plan(entries, context.roots, copy.copy(context.factory), executor=executor,
+                             journal=context.journal, reconcile=context.args.reconcile, store=context.store)
+        print(f"[{stage}] Created {stats.summary()}")
+    return run
+
+STAGES = [
+    Stage('generate', [], run_generate),
+    Stage('ad_cleanup', ['generate'], run_ad_cleanup),
+    Stage('ad_setup', ['ad_cleanup'], run_ad_setup),
+    Stage('g_setup', ['ad_setup'], run_g_setup),
+    Stage('g_drive', ['g_setup'], populate_stage('g_drive')),
+    Stage('u_drive', ['generate'], populate_stage('u_drive')),
+    Stage('desktop', ['u_drive'], populate_stage('desktop')),
+    Stage('downloads', ['u_drive'], populate_stage('downloads')),
+    Stage('emails', ['u_drive'], populate_stage('emails')),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+DEFAULT_STAGES = [name for name in STAGE_NAMES if name != 'generate']
+
+def run_stages(stages: List[Stage], context: PipelineContext, parallel: Optional[int] = None) -> Dict[str, str]:
+    """Run stages as their dependencies finish, returning the outcome of each"""
+    selected = {stage.name for stage in stages}
+    outcomes = {}
+    pending = list(stages)
+    running = {}
+    started = time.monotonic()
+
+    def timestamp() -> str:
+        return f"[{time.monotonic() - started:7.1f}s]"
+
+    with ThreadPoolExecutor(max_workers=parallel or len(stages) or 1, thread_name_prefix='stage') as pool:
+        while pending or running:
+            for stage in list(pending):
+                depends = [name for name in stage.depends if name in selected]
+                if any(outcomes.get(name) in (FAILED, SKIPPED) for name in depends):
+                    print(f"{timestamp()} Skipping {stage.name}: a dependency did not finish")
+                    outcomes[stage.name] = SKIPPED
+                    pending.remove(stage)
+                elif all(outcomes.get(name) == DONE for name in depends):
+                    print(f"{timestamp()} Starting {stage.name}")
+                    running[pool.submit(stage.run, context)] = (stage, time.monotonic())
+                    pending.remove(stage)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, stage_started = running.pop(future)
+                elapsed = time.monotonic() - stage_started
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"{timestamp()} {stage.name} failed after {elapsed:.1f}s: {e}")
+                    outcomes[stage.name] = FAILED
+                    continue
+                print(f"{timestamp()} Finished {stage.name} in {elapsed:.1f}s")
+                outcomes[stage.name] = DONE
+                if context.journal:
+                    context.journal.record_unit(f"stage:{stage.name}")
+    return outcomes
+
+def select_stages(names: Iterable[str], journal=None) -> List[Stage]:
+    """Return the named stages in graph order, leaving out those a previous run finished"""
+    names = set(names)
+    stages = [stage for stage in STAGES if stage.name in names]
+    if journal:
+        done = [stage.name for stage in stages if journal.is_unit_done(f"stage:{stage.name}")]
+        if done:
+            print(f"Already finished: {', '.join(done)}")
+        stages = [stage for stage in stages if stage.name not in done]
+    return stages
+
+def print_graph() -> None:
+    """Print every stage with the stages it waits for"""
+    for stage in STAGES:
+        print(f"{stage.name:<12} after {', '.join(stage.depends) or '-'}")
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Build the whole simulated environment as one stage graph')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=DEFAULT_STAGES,
+                        help='Stages to run (default: all but generate)')
+    parser.add_argument('--generate', type=int, metavar='N',
+                        help='Generate a company of N users into --data-file first')
+    parser.add_argument('--parallel', type=int,
+                        help='Stages allowed to run at once (default: all that are ready)')
+    parser.add_argument('--ad-dry-run', action='store_true',
+                        help='Run the AD and G: setup stages without making changes')
+    parser.add_argument('--list', action='store_true',
+                        help='Print the stage graph and exit')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'pipeline')
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.list:
+        print_graph()
+        return
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+
+    names = set(args.stages)
+    if args.generate:
+        names.add('generate')
+    context = PipelineContext(args)
+    stages = select_stages(names, context.journal)
+    if 'generate' not in [stage.name for stage in stages]:
+        context.company_data = load_company_data(args.data_file)
+        if context.store:
+            context.store.record_company(context.company_data)
+
+    # Drive-level directories once, instead of once per populate stage
+    populate = [stage.name for stage in stages if stage.name in get_stage_planners()]
+    if populate:
+        execute_plan(get_root_entries(populate), context.roots, copy.copy(context.factory),
+                     journal=context.journal, store=context.store)
+
+    started = time.monotonic()
+    outcomes = run_stages(stages, context, args.parallel)
+    if context.journal:
+        context.journal.close()
+    if context.store:
+        context.store.close()
+
+    print(f"\nPipeline finished in {time.monotonic() - started:.1f}s")
+    for stage in stages:
+        print(f"  {stage.name:<12} {outcomes.get(stage.name, SKIPPED)}")
+    if any(outcome != DONE for outcome in outcomes.values()):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
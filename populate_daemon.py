@@ -0,0 +1,503 @@
+"""
+Populate Daemon
+
+Long-running population service for automated test harnesses. Launching a
+populate script for every change means re-importing the planners, re-parsing
+company_data.json and re-resolving the drive roots each time; the daemon does
+that once and then takes commands over a local Unix socket, so a harness can
+ask for an environment change with milliseconds of overhead on top of the
+work itself.
+
+Kept warm between commands: the company data and its lookup index, the
+imported planners and their catalogs, the resolved and prepared drive roots,
+the file factory with its size manifest, the executor's thread pool (and the
+adaptive worker count it has learned), the teardown pool and the state store
+connection.
+
+Requests and responses are single lines of JSON. A request names a command
+and its arguments; every response has "ok", "elapsed_ms" and either "result"
+or "error":
+
+    {"command": "status"}
+    {"command": "repopulate_user", "user": "kenta_kato"}
+    {"command": "add_project", "project": {"number": "P9001", "quota_gb": 50, ...}}
+    {"command": "reset_department", "department": "Sales"}
+    {"command": "reload"}
+    {"command": "shutdown"}
+
+repopulate_user and reset_department remove the trees the affected units
+own and build them again from the plan, so whatever a test changed there is
+gone afterwards. With "reconcile": true they only fix what differs instead
+(see reconcile.py). A department reset covers its users, its projects and its
+management directory. add_project adds the project to the in-memory company
+data (not to the data file), creates its G: directory and adds it to the U:
+Projects folder of the users in its "assigned_users". AD is not touched.
+
+Commands that change the drives run one at a time; status is answered while
+one is running.
+
+Usage:
+    python populate_daemon.py [options]                         Run the daemon
+    python populate_daemon.py --call COMMAND [ARGUMENT]         Send a command
+
+Options:
+    --socket PATH        Unix socket to listen on (default: populate_daemon.sock)
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to (re)build (default: all)
+    --call COMMAND       Send one command to a running daemon and print the response;
+                         the argument is the user, the department, or a project JSON file
+
+Example:
+    python populate_daemon.py --allocation sparse --scale-divisor 1000 &
+    python populate_daemon.py --call repopulate_user kenta_kato
+    python populate_daemon.py --call add_project new_project.json
+    python populate_daemon.py --call reset_department Sales
+    python populate_daemon.py --call status
+"""
+
+import os
+import json
+import time
+import datetime
+import uuid
+import socket
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import (DIR, STAGE_ORDER, PlanEntry, ExecutionStats, get_username, get_drive_roots,
+                           load_company_data, execute_plan)
+from populate_shards import get_root_entries, get_unit_planners
+from reconcile import add_reconcile_arguments
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import CompanyIndex
+from teardown import remove_tree
+from work_queue import plan_unit
+
+DEFAULT_SOCKET = 'populate_daemon.sock'
+
+# Longest request line accepted from a client
+MAX_REQUEST_BYTES = 1_000_000
+
+class CommandError(Exception):
+    """A request the daemon cannot carry out; reported to the client"""
+
+def get_top_dirs(entries: List[PlanEntry]) -> List[Tuple[str, str]]:
+    """Return the planned directories that are not inside another planned directory"""
+    dirs = {(entry.drive, entry.path) for entry in entries if entry.kind == DIR}
+    tops = []
+    for drive, path in sorted(dirs):
+        parent = path.rpartition('/')[0]
+        while parent and (drive, parent) not in dirs:
+            parent = parent.rpartition('/')[0]
+        if not parent:
+            tops.append((drive, path))
+    return tops
+
+def filter_project_folder(entries: Iterable[PlanEntry], username: str, number: str) -> Iterator[PlanEntry]:
+    """Yield the entries of one project's folder in a user's U: Projects directory"""
+    folder = f"Users/{username}/Projects"
+    for entry in entries:
+        if entry.drive == 'U' and (entry.path == folder or entry.path.startswith(f"{folder}/{number}/")):
+            yield entry
+
+def remove_trees(paths: Iterable[Tuple[str, str]], roots, store=None) -> int:
+    """Remove (drive, path) trees from the drives and the store, returning how many existed"""
+    removed = 0
+    for drive, path in paths:
+        target = roots[drive] / path
+        if target.is_dir():
+            remove_tree(target, keep_root=False)
+            removed += 1
+        elif target.exists():
+            target.unlink()
+            removed += 1
+        if store:
+            store.forget(drive, path)
+    return removed
+
+def validate_project(project: Dict) -> None:
+    """Raise CommandError unless a new project can be planned"""
+    # Imported here because the populate scripts import populate_plan
+    from G_drive_populate import plan_project
+
+    for field in ('start_date', 'end_date'):
+        if project.get(field):
+            try:
+                datetime.datetime.strptime(str(project[field]), "%Y-%m-%d")
+            except ValueError:
+                raise CommandError(f"Invalid {field} {project[field]!r}: expected YYYY-MM-DD")
+    if not isinstance(project['quota_gb'], (int, float)) or project['quota_gb'] <= 0:
+        raise CommandError(f"Invalid quota_gb {project['quota_gb']!r}: expected a positive number")
+    if not isinstance(project['likely_technologies'], list):
+        raise CommandError("likely_technologies must be a list")
+    try:
+        # Planned on a copy, so the defaults filled in here are not kept
+        for _ in plan_project({**project, 'start_date': project.get('start_date') or None,
+                               'end_date': project.get('end_date') or None}):
+            pass
+    except Exception as e:
+        raise CommandError(f"Project {project['number']} cannot be planned: {e}")
+
+class PopulationDaemon:
+    """Company model, drives and executor kept warm, and the commands that change them"""
+
+    def __init__(self, company_data: Dict, data_file: str = 'company_data.json',
+                 stages: Iterable[str] = STAGE_ORDER, roots=None, factory: Optional[FileFactory] = None,
+                 executor=None, store=None, reconcile: bool = False):
+        self.data_file = data_file
+        self.stages = [stage for stage in STAGE_ORDER if stage in stages]
+        self.roots = roots or get_drive_roots()
+        self.factory = factory or FileFactory()
+        self.executor = executor
+        self.store = store
+        self.reconcile = reconcile
+        self.started = time.monotonic()
+        self.served = 0
+        self.busy = None
+        self.last = None
+        self._lock = threading.Lock()
+        self.set_company_data(company_data)
+
+        # Resolve and prepare the drives once, not per command
+        execute_plan(get_root_entries(self.stages), self.roots, self.factory, store=self.store)
+
+    def set_company_data(self, company_data: Dict) -> None:
+        """Replace the company model and rebuild its index"""
+        # Imported here because the populate scripts import populate_plan
+        from G_drive_populate import validate_project_dates
+        validate_project_dates(company_data)
+        self.company_data = company_data
+        self.index = CompanyIndex(company_data)
+        self.planners = get_unit_planners(company_data, self.stages)
+        if self.store:
+            self.store.record_company(company_data)
+
+    def handle(self, request: Dict) -> Dict:
+        """Run one request and return its response"""
+        started = time.monotonic()
+        command = request.get('command')
+        handler = COMMANDS.get(command)
+        try:
+            if handler is None:
+                raise CommandError(f"Unknown command {command!r}; expected one of {', '.join(COMMANDS)}")
+            if command in READ_ONLY_COMMANDS:
+                result = handler(self, request)
+            else:
+                with self._lock:
+                    self.busy = command
+                    try:
+                        result = handler(self, request)
+                    finally:
+                        self.busy = None
+                self.last = {'command': command, **result}
+            response = {'ok': True, 'result': result}
+        except CommandError as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            print(f"Error running {command}: {e}")
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        self.served += 1
+        response['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return response
+
+    def find_user(self, name: str) -> Dict:
+        """Return the user matching a username or full name"""
+        user_ids = self.index.users_by_name.get(str(name).lower(), [])
+        if not user_ids:
+            raise CommandError(f"No user matches {name!r}")
+        if len(set(user_ids)) > 1:
+            raise CommandError(f"{name!r} matches {len(set(user_ids))} users; use the username")
+        return self.company_data['users'][user_ids[0]]
+
+    def find_department(self, name: str) -> str:
+        """Return a department's name as spelled in the data"""
+        user_ids = self.index.users_by_department.get(str(name).lower())
+        if not user_ids:
+            raise CommandError(f"No department matches {name!r}")
+        return self.company_data['users'][user_ids[0]]['department']
+
+    def rebuild(self, units: List[Tuple[str, Iterable[PlanEntry]]], reset: bool = True,
+                reconcile: bool = False) -> Dict:
+        """Execute the plans of work units, first removing the trees they own when reset"""
+        entries = []
+        names = []
+        for name, unit_entries in units:
+            names.append(name)
+            entries.extend(unit_entries)
+        removed = 0
+        if reset and not reconcile:
+            removed = remove_trees(get_top_dirs(entries), self.roots, self.store)
+        stats = execute_plan(entries, self.roots, self.factory, executor=self.executor,
+                             reconcile=reconcile, store=self.store)
+        print(f"{', '.join(names)}: {stats.summary()}")
+        return {'units': names, 'removed': removed, **stats_to_dict(stats)}
+
+    def user_unit(self, user_data: Dict) -> Tuple[str, Iterable[PlanEntry]]:
+        name = f"user:{get_username(user_data)}"
+        return name, plan_unit(self.planners, name)
+
+    def project_unit(self, project: Dict) -> Tuple[str, Iterable[PlanEntry]]:
+        name = f"project:{project.get('number', 'unknown')}"
+        return name, plan_unit(self.planners, name)
+
+    def reconcile_requested(self, request: Dict) -> bool:
+        return bool(request.get('reconcile', self.reconcile))
+
+    def status(self, request: Dict) -> Dict:
+        """Report what the daemon holds and what it is doing"""
+        status = {
+            'pid': os.getpid(),
+            'uptime': round(time.monotonic() - self.started, 1),
+            'data_file': self.data_file,
+            'stages': self.stages,
+            'users': len(self.company_data['users']),
+            'projects': len(self.company_data.get('projects', {})),
+            'departments': len(self.index.users_by_department),
+            'served': self.served,
+            'busy': self.busy,
+            'last': self.last,
+        }
+        if self.store:
+            status['store'] = self.store.totals()
+        return status
+
+    def repopulate_user(self, request: Dict) -> Dict:
+        """Rebuild every planned stage of one user's U: tree"""
+        if not set(self.stages) - {'g_drive'}:
+            raise CommandError("The daemon was started without any U: stages")
+        user_data = self.find_user(request.get('user', ''))
+        return self.rebuild([self.user_unit(user_data)], reconcile=self.reconcile_requested(request))
+
+    def add_project(self, request: Dict) -> Dict:
+        """Add a project to the company model and create its G: and U: directories"""
+        project = dict(request.get('project') or {})
+        number = project.get('number')
+        if not number or 'quota_gb' not in project:
+            raise CommandError("A project needs at least a number and quota_gb")
+        if self.index.projects_by_number.get(str(number).lower()):
+            raise CommandError(f"Project {number} already exists")
+        users = self.company_data['users']
+        members = project.setdefault('assigned_users', [])
+        unknown = [user_id for user_id in members if user_id not in users]
+        if unknown:
+            raise CommandError(f"Unknown assigned users: {', '.join(unknown)}")
+        project.setdefault('id', str(uuid.uuid4()))
+        project.setdefault('name', number)
+        project.setdefault('likely_technologies', [])
+        validate_project(project)
+
+        # Nothing is kept if the model cannot take the project
+        self.company_data['projects'][project['id']] = project
+        for user_id in members:
+            users[user_id].setdefault('assigned_projects', []).append(project['id'])
+        try:
+            self.set_company_data(self.company_data)
+        except Exception:
+            del self.company_data['projects'][project['id']]
+            for user_id in members:
+                users[user_id]['assigned_projects'].remove(project['id'])
+            self.set_company_data(self.company_data)
+            raise
+
+        units = []
+        if 'g_drive' in self.stages:
+            units.append(self.project_unit(project))
+        if 'u_drive' in self.stages:
+            for user_id in members:
+                # Only the new project's folder, not the rest of the member's tree
+                name, entries = self.user_unit(users[user_id])
+                units.append((name, filter_project_folder(entries, get_username(users[user_id]), number)))
+        result = self.rebuild(units, reset=False)
+        result['id'] = project['id']
+        return result
+
+    def reset_department(self, request: Dict) -> Dict:
+        """Rebuild the users, projects and management directory of one department"""
+        department = self.find_department(request.get('department', ''))
+        units = []
+        if set(self.stages) - {'g_drive'}:
+            users = self.company_data['users']
+            units.extend(self.user_unit(users[user_id])
+                         for user_id in self.index.users_by_department[department.lower()])
+        if 'g_drive' in self.stages:
+            projects = self.company_data['projects']
+            units.extend(self.project_unit(projects[project_id])
+                         for project_id in self.index.projects_by_department.get(department.lower(), []))
+            name = f"department:{department}"
+            units.append((name, plan_unit(self.planners, name)))
+        return self.rebuild(units, reconcile=self.reconcile_requested(request))
+
+    def reload(self, request: Dict) -> Dict:
+        """Read the data file again, dropping projects added since"""
+        self.set_company_data(load_company_data(self.data_file))
+        return {'users': len(self.company_data['users']),
+                'projects': len(self.company_data.get('projects', {}))}
+
+    def shutdown(self, request: Dict) -> Dict:
+        """Stop serving once this response is sent"""
+        return {'stopping': True}
+
+    def close(self) -> None:
+        """Finish queued work and release the executor, factory and store"""
+        if self.executor:
+            self.executor.close()
+        self.factory.close()
+        if self.store:
+            self.store.close()
+
+COMMANDS = {
+    'status': PopulationDaemon.status,
+    'repopulate_user': PopulationDaemon.repopulate_user,
+    'add_project': PopulationDaemon.add_project,
+    'reset_department': PopulationDaemon.reset_department,
+    'reload': PopulationDaemon.reload,
+    'shutdown': PopulationDaemon.shutdown,
+}
+
+READ_ONLY_COMMANDS = {'status', 'shutdown'}
+
+def stats_to_dict(stats: ExecutionStats) -> Dict:
+    """Return the counters of an execution for a response"""
+    return {'files': stats.files, 'dirs': stats.dirs, 'bytes': stats.bytes, 'failed': stats.failed,
+            'deleted': stats.deleted}
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the JSON lines of one client connection"""
+
+    def handle(self) -> None:
+        daemon = self.server.daemon
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_BYTES)
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                response = {'ok': False, 'error': f"Bad request: {e}"}
+            else:
+                response = daemon.handle(request)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+            if response.get('ok') and request.get('command') == 'shutdown':
+                # shutdown() waits for serve_forever, so it cannot run on the serving thread
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class DaemonServer(socketserver.ThreadingUnixStreamServer):
+        """Unix socket server with one thread per client connection"""
+        daemon_threads = True
+
+        def __init__(self, path: str, daemon: PopulationDaemon):
+            self.daemon = daemon
+            super().__init__(path, _RequestHandler)
+else:
+    DaemonServer = None
+
+def is_listening(path: str) -> bool:
+    """Return True if a daemon already answers on the socket"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+        return True
+    except OSError:
+        return False
+
+def serve(daemon: PopulationDaemon, path: str = DEFAULT_SOCKET) -> None:
+    """Answer requests on a Unix socket until a shutdown command arrives"""
+    if DaemonServer is None:
+        raise RuntimeError("Unix sockets are not available on this platform")
+    if os.path.exists(path):
+        if is_listening(path):
+            raise RuntimeError(f"A daemon is already listening on {path}")
+        os.unlink(path)  # Left behind by a daemon that did not shut down cleanly
+    server = DaemonServer(path, daemon)
+    os.chmod(path, 0o600)
+    print(f"Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def send_command(command: str, path: str = DEFAULT_SOCKET, timeout: Optional[float] = None, **args) -> Dict:
+    """Send one command to a running daemon and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall((json.dumps({'command': command, **args}) + '\n').encode('utf-8'))
+        with client.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f"No response from the daemon on {path}")
+    return json.loads(line)
+
+def call_from_args(args) -> Dict:
+    """Turn --call COMMAND [ARGUMENT] into a request and send it"""
+    command, argument = args.call[0], (args.call[1] if len(args.call) > 1 else None)
+    request = {}
+    if command == 'repopulate_user':
+        request['user'] = argument
+    elif command == 'reset_department':
+        request['department'] = argument
+    elif command == 'add_project':
+        with open(argument, 'r', encoding='utf-8') as f:
+            request['project'] = json.load(f)
+    if args.reconcile:
+        request['reconcile'] = True
+    return send_command(command, args.socket, **request)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Keep the simulated environment warm and change it on request')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, metavar='PATH',
+                        help=f'Unix socket to listen on or send to (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to (re)build (default: all)')
+    parser.add_argument('--call', nargs='+', metavar='ARG',
+                        help='Send COMMAND [ARGUMENT] to a running daemon and print the response')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.call:
+        response = call_from_args(args)
+        print(json.dumps(response, indent=2))
+        raise SystemExit(0 if response.get('ok') else 1)
+
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    company_data = load_company_data(args.data_file)
+    daemon = PopulationDaemon(company_data, args.data_file, args.stages, factory=factory_from_args(args),
+                              executor=executor_from_args(args), store=store_from_args(args),
+                              reconcile=args.reconcile)
+    try:
+        serve(daemon, str(Path(args.socket)))
+    finally:
+        daemon.close()
+    print(f"Served {daemon.served:,} requests")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Populate Executor
+
+Thread-pool materialization for plan entries. Creating a file on an SMB-backed
+U: or G: drive is mostly waiting on metadata round-trips (create, set times,
+compact), so the populate scripts fan that work out over a pool of threads
+instead of creating files one after another.
+
+Ordering is preserved per directory. Every entry is routed to the lane of the
+directory it lives in (a directory entry to its own lane), and each lane runs
+its entries one at a time in plan order, so a directory is always created
+before the files planned into it. Different directories run concurrently.
+A clean entry waits until every lane below the directory being cleaned has
+gone idle, so it never races files still being written there.
+
+At most max_pending entries are queued at once; the dispatcher blocks beyond
+that, which keeps the streaming planner's memory bound intact.
+
+The right number of concurrent creators depends on the target (local NVMe, a
+spinning NAS, an SMB share), so by default the executor tunes it itself: an
+AIMDController watches per-operation latency and failures and raises the
+concurrency limit by one while operations stay fast and clean, halving it
+when failures appear or latency climbs well above the best seen so far.
+--workers N pins the count instead.
+
+Used through execute_plan(..., executor=PlanExecutor(workers)) or the
+--workers option that every populate script accepts.
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from populate_plan import CLEAN, DIR, PlanEntry, execute_entry
+
+DEFAULT_WORKERS = 8
+
+# Queued entries allowed per worker before the dispatcher blocks
+PENDING_PER_WORKER = 64
+
+# Bounds of the adaptive concurrency limit
+ADAPTIVE_MIN_WORKERS = 1
+ADAPTIVE_MAX_WORKERS = 64
+ADAPTIVE_START_WORKERS = 4
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease concurrency limit
+
+    Operations are judged in windows. A window whose failure rate exceeds
+    error_threshold, or whose mean latency exceeds latency_tolerance times the
+    best window so far, multiplies the limit by decrease; any other window adds
+    increase. After a decrease the best-latency baseline drifts towards the
+    latest window, so a target that has become slower for good is not throttled
+    to the minimum forever.
+    """
+
+    def __init__(self, initial: int = ADAPTIVE_START_WORKERS, minimum: int = ADAPTIVE_MIN_WORKERS,
+                 maximum: int = ADAPTIVE_MAX_WORKERS, window: int = 32, increase: int = 1,
+                 decrease: float = 0.5, latency_tolerance: float = 2.0,
+                 error_threshold: float = 0.02, baseline_drift: float = 0.05):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.baseline_drift = baseline_drift
+        self.baseline = None
+        self.peak = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self._count = 0
+        self._errors = 0
+        self._latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Count one finished operation, adjusting the limit at the end of a window"""
+        with self._lock:
+            self._count += 1
+            self._latency += latency
+            self._errors += not ok
+            if self._count >= max(self.window, self.limit):
+                self._adjust()
+
+    def _adjust(self) -> None:
+        mean = self._latency / self._count
+        error_rate = self._errors / self._count
+        self._count = self._errors = 0
+        self._latency = 0.0
+
+        if self.baseline is None or mean < self.baseline:
+            self.baseline = mean
+        if error_rate > self.error_threshold or mean > self.baseline * self.latency_tolerance:
+            self.limit = max(self.minimum, int(self.limit * self.decrease))
+            self.decreases += 1
+            self.baseline += (mean - self.baseline) * self.baseline_drift
+        else:
+            self.limit = min(self.maximum, self.limit + self.increase)
+            self.increases += 1
+        self.peak = max(self.peak, self.limit)
+
+    def summary(self) -> str:
+        """Return a one-line description of where the limit settled"""
+        return (f"adaptive concurrency settled at {self.limit} workers (peak {self.peak}, "
+                f"{self.increases} increases, {self.decreases} decreases)")
+
+class _Lane:
+    """Entries of one directory, executed in order by at most one worker"""
+
+    __slots__ = ('entries', 'active')
+
+    def __init__(self):
+        self.entries = deque()
+        self.active = False
+
+class PlanExecutor:
+    """Run plan entries on a thread pool with per-directory ordering
+
+    With a controller, workers is the most threads ever used and the number
+    of entries executing at once follows controller.limit.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: Optional[int] = None,
+                 controller: Optional[AIMDController] = None):
+        self.workers = workers
+        self.max_pending = max_pending or workers * PENDING_PER_WORKER
+        self.controller = controller
+        self._pool = None
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._pending = 0
+        self._running = 0
+        self._errors = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def pending(self) -> int:
+        """Entries submitted but not yet finished"""
+        with self._lock:
+            return self._pending
+
+    @staticmethod
+    def lane_key(entry: PlanEntry) -> Tuple[str, str]:
+        """Return the (drive, directory) lane an entry belongs to"""
+        if entry.kind == DIR:
+            return entry.drive, entry.path
+        directory, _, _ = entry.path.rpartition('/')
+        return entry.drive, directory
+
+    def submit(self, entry: PlanEntry, roots, factory, stats, verbose: bool = False, journal=None,
+               store=None, compression=None, skip_existing: bool = False) -> None:
+        """Queue an entry on its directory's lane, blocking while too much is pending"""
+        if entry.kind == CLEAN:
+            self._wait_for_subtree(entry.drive, entry.path)
+            execute_entry(entry, roots, factory, stats, verbose, journal, store, compression, skip_existing)
+            return
+
+        key = self.lane_key(entry)
+        with self._changed:
+            self._changed.wait_for(lambda: self._pending < self.max_pending)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='populate')
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            lane.entries.append((entry, roots, factory, stats, verbose, journal, store, compression,
+                                 skip_existing))
+            self._pending += 1
+            if lane.active:
+                return
+            lane.active = True
+        self._pool.submit(self._drain, key, lane)
+
+    def _limit(self) -> int:
+        """Return how many entries may execute at once"""
+        return self.controller.limit if self.controller else self.workers
+
+    def _drain(self, key: Tuple[str, str], lane: _Lane) -> None:
+        """Execute a lane's entries in order until it is empty"""
+        while True:
+            with self._changed:
+                if not lane.entries:
+                    lane.active = False
+                    del self._lanes[key]
+                    self._changed.notify_all()
+                    return
+                task = lane.entries.popleft()
+                self._changed.wait_for(lambda: self._running < self._limit())
+                self._running += 1
+            started = time.monotonic()
+            ok = False
+            try:
+                ok = execute_entry(*task)
+            except Exception as e:
+                entry = task[0]
+                print(f"Error creating {entry.drive}:/{entry.path}: {e}")
+                with self._changed:
+                    self._errors.append(e)
+            if self.controller:
+                self.controller.record(time.monotonic() - started, ok)
+            with self._changed:
+                self._running -= 1
+                self._pending -= 1
+                self._changed.notify_all()
+
+    def _wait_for_subtree(self, drive: str, path: str) -> None:
+        """Block until no lane at or below path has work left"""
+        prefix = path + '/'
+
+        def idle() -> bool:
+            return not any(lane_drive == drive and (directory == path or directory.startswith(prefix))
+                           for lane_drive, directory in self._lanes)
+
+        with self._changed:
+            self._changed.wait_for(idle)
+
+    def wait(self) -> None:
+        """Block until every queued entry has run, re-raising the first worker error"""
+        with self._changed:
+            self._changed.wait_for(lambda: not self._lanes)
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def cancel(self) -> int:
+        """Drop every queued entry that has not started, returning how many were dropped"""
+        with self._changed:
+            dropped = 0
+            for lane in self._lanes.values():
+                dropped += len(lane.entries)
+                lane.entries.clear()
+            self._pending -= dropped
+            self._changed.notify_all()
+        return dropped
+
+    def close(self) -> None:
+        """Wait for queued work and stop the worker threads"""
+        try:
+            self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+def build_executor(workers: Optional[int] = None, max_pending: Optional[int] = None,
+                   max_workers: int = ADAPTIVE_MAX_WORKERS) -> Optional[PlanExecutor]:
+    """Return an adaptive executor (workers None), a fixed one, or None for sequential creation"""
+    if workers is None:
+        return PlanExecutor(max_workers, max_pending, AIMDController(maximum=max_workers))
+    if workers <= 1:
+        return None
+    return PlanExecutor(workers, max_pending)
+
+def add_executor_arguments(parser) -> None:
+    """Add the thread-pool options to a populate script's argument parser"""
+    parser.add_argument('--workers', type=int,
+                        help='Fixed number of threads creating files, 1 for strictly sequential creation '
+                             '(default: adapt to the target automatically)')
+    parser.add_argument('--max-workers', type=int, default=ADAPTIVE_MAX_WORKERS,
+                        help=f'Upper bound for the adaptive worker count (default: {ADAPTIVE_MAX_WORKERS})')
+    parser.add_argument('--max-pending', type=int,
+                        help=f'Entries queued ahead of the workers '
+                             f'(default: {PENDING_PER_WORKER} per worker)')
+
+def executor_from_args(args) -> Optional[PlanExecutor]:
+    """Build the executor selected on the command line, or None for sequential creation"""
+    return build_executor(args.workers, args.max_pending, args.max_workers)
@@ -0,0 +1,540 @@
+"""
+Populate Plan
+
+Compiles the simulated U: and G: drive environments into a single manifest
+before any I/O happens, and executes manifests.
+
+Every populate script exposes a planner that turns company data into
+PlanEntry records instead of creating files as it goes:
+
+    U_drive_setup.plan_u_drive          Home directories and application data
+    U_populate_desktop.plan_desktop     Desktop files
+    U_populate_downloads.plan_downloads Downloads
+    U_populate_emails.plan_emails       Outlook PST archives
+    G_drive_populate.plan_g_drive       Project and management files
+
+Each entry carries the drive, the path relative to the drive root, the
+logical size, the modification time, whether NTFS compression is wanted, the
+owning user or group and the content profile (the stage that planned it).
+Because the plan exists before execution, it can be totalled, written out,
+sorted and batched independently of the catalog logic.
+
+Plans are streamed, never held in memory: planners are generators, and
+execute_plan runs the planner on a background thread that hands entries over
+in chunks through a bounded queue. When the queue is full the planner blocks,
+so peak memory stays flat however large the simulated company is.
+
+With a checkpoint_journal.CheckpointJournal, every completed entry is
+journaled and entries completed by an interrupted run are skipped (--resume).
+With reconcile, the plan is first diffed against what is already on disk
+(see reconcile.py) and only the differences are executed. With a
+state_store.StateStore, every completed entry is recorded in the store.
+
+Usage:
+    python populate_plan.py [options]
+
+Options:
+    --data-file FILE    Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...  Stages to compile (default: all, in execution order)
+    --output FILE       Write the manifest as JSON lines
+    --execute           Materialize the compiled plan after summarizing it
+    --verbose, -v       Print every entry as it is executed
+    --chunk-size N      Entries handed from the planner to the executor at a time
+    --queue-depth N     Chunks the planner may run ahead of the executor
+    --resume            Skip entries an interrupted --execute run completed
+    --reconcile         Execute only what differs from the existing tree
+    --state-db FILE     Record what is created in this store (default: simulation_state.db)
+    --seed N            Company seed; the same seed always compiles the same manifest
+
+Example:
+    python populate_plan.py --output environment.jsonl
+    python populate_plan.py --stages desktop emails --execute --scale-divisor 1000
+"""
+
+import os
+import json
+import queue
+import argparse
+import itertools
+import threading
+from collections import namedtuple
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from compression import CompressionPlanner, compress_file, compress_directory
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args
+from seeds import add_seed_arguments, set_company_seed
+from teardown import clean_directory, remove_tree
+
+# One item of the simulated environment
+PlanEntry = namedtuple('PlanEntry', ['drive', 'path', 'size', 'mtime', 'compress', 'owner', 'profile', 'kind'])
+
+# Entry kinds, executed in plan order
+CLEAN = 'clean'  # Empty an existing directory before it is repopulated
+DIR = 'dir'
+FILE = 'file'
+RETIME = 'retime'  # Set the mtime of an existing file (reconcile only)
+DELETE = 'delete'  # Remove a file or directory the plan no longer contains (reconcile only)
+
+# Stages in the README's execution order
+STAGE_ORDER = ['u_drive', 'g_drive', 'desktop', 'downloads', 'emails']
+
+# Streaming defaults: at most (PLAN_QUEUE_DEPTH + 2) * PLAN_CHUNK_SIZE entries in flight
+PLAN_CHUNK_SIZE = 1024
+PLAN_QUEUE_DEPTH = 8
+
+# Seconds a blocked planner waits before checking whether the executor gave up
+_QUEUE_POLL = 0.1
+_END = object()
+
+def get_username(user_data: Dict) -> str:
+    """Return the firstname_lastname account name used for a user"""
+    name_parts = user_data['name'].lower().split()
+    return f"{name_parts[0]}_{name_parts[-1]}"
+
+def join_path(*parts) -> str:
+    """Join relative path parts into a normalized posix path string"""
+    return PurePosixPath(*(str(part) for part in parts if part not in ('', None))).as_posix()
+
+def plan_dir(drive: str, path: str, owner: Optional[str], profile: str,
+             compress: bool = False) -> PlanEntry:
+    """Plan a directory"""
+    return PlanEntry(drive, path, 0, None, compress, owner, profile, DIR)
+
+def plan_file(drive: str, path: str, size: int, mtime: Optional[float], owner: Optional[str],
+              profile: str, compress: bool = False) -> PlanEntry:
+    """Plan a file of the given logical size"""
+    return PlanEntry(drive, path, size, mtime, compress, owner, profile, FILE)
+
+def plan_clean(drive: str, path: str, owner: Optional[str], profile: str) -> PlanEntry:
+    """Plan emptying a directory left over from a previous run"""
+    return PlanEntry(drive, path, 0, None, False, owner, profile, CLEAN)
+
+def get_drive_roots() -> Dict[str, Path]:
+    """Return the simulated drive roots, falling back to local directories"""
+    roots = {}
+    for drive, fallback in (('U', 'U_Drive'), ('G', 'G_Drive')):
+        root = Path(f'{drive}:')
+        if not root.exists():
+            print(f"Note: Using {fallback} directory since {drive}: drive not available")
+            root = Path(fallback)
+        roots[drive] = root
+    return roots
+
+def load_company_data(file_path: str = 'company_data.json') -> Dict:
+    """Load the company data from JSON file"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_stage_planners() -> Dict:
+    """Return the planner of every stage, keyed by stage name"""
+    # Imported here because the populate scripts import this module
+    import U_drive_setup
+    import U_populate_desktop
+    import U_populate_downloads
+    import U_populate_emails
+    import G_drive_populate
+
+    return {
+        'u_drive': U_drive_setup.plan_u_drive,
+        'g_drive': G_drive_populate.plan_g_drive,
+        'desktop': U_populate_desktop.plan_desktop,
+        'downloads': U_populate_downloads.plan_downloads,
+        'emails': U_populate_emails.plan_emails,
+    }
+
+def compile_environment(company_data: Dict, stages: Iterable[str] = STAGE_ORDER) -> Iterator[PlanEntry]:
+    """Compile the requested stages into one lazily generated manifest"""
+    planners = get_stage_planners()
+    return itertools.chain.from_iterable(planners[stage](company_data) for stage in stages)
+
+def new_summary() -> Dict:
+    """Return empty plan totals"""
+    return {'files': 0, 'dirs': 0, 'bytes': 0, 'profiles': {}}
+
+def add_to_summary(summary: Dict, entry: PlanEntry) -> None:
+    """Count one entry towards the plan totals"""
+    if entry.kind == CLEAN:
+        return
+    key = f"{entry.drive}:{entry.profile}"
+    totals = summary['profiles'].setdefault(key, {'files': 0, 'dirs': 0, 'bytes': 0})
+    if entry.kind == DIR:
+        summary['dirs'] += 1
+        totals['dirs'] += 1
+    else:
+        summary['files'] += 1
+        summary['bytes'] += entry.size
+        totals['files'] += 1
+        totals['bytes'] += entry.size
+
+def summarize_plan(entries: Iterable[PlanEntry]) -> Dict:
+    """Total files, directories and logical bytes per drive and profile"""
+    summary = new_summary()
+    for entry in entries:
+        add_to_summary(summary, entry)
+    return summary
+
+def tally_plan(entries: Iterable[PlanEntry], summary: Dict) -> Iterator[PlanEntry]:
+    """Pass entries through, totalling them into summary on the way"""
+    for entry in entries:
+        add_to_summary(summary, entry)
+        yield entry
+
+def print_plan_summary(summary: Dict) -> None:
+    """Print a plan summary as a table"""
+    print(f"\n{'Profile':<16} {'Files':>10} {'Dirs':>8} {'Size (GB)':>12}")
+    for key, totals in sorted(summary['profiles'].items()):
+        print(f"{key:<16} {totals['files']:>10,} {totals['dirs']:>8,} {totals['bytes'] / 1e9:>12,.1f}")
+    print(f"{'Total':<16} {summary['files']:>10,} {summary['dirs']:>8,} {summary['bytes'] / 1e9:>12,.1f}")
+
+def write_manifest(entries: Iterable[PlanEntry], file_path) -> int:
+    """Write plan entries as JSON lines, returning the number written"""
+    count = 0
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry._asdict()) + '\n')
+            count += 1
+    return count
+
+def read_manifest(file_path) -> Iterator[PlanEntry]:
+    """Stream plan entries written by write_manifest"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield PlanEntry(**json.loads(line))
+
+def iter_chunks(entries: Iterable[PlanEntry], chunk_size: int = PLAN_CHUNK_SIZE) -> Iterator[List[PlanEntry]]:
+    """Group entries into lists of at most chunk_size"""
+    entries = iter(entries)
+    while True:
+        chunk = list(itertools.islice(entries, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def stream_chunks(entries: Iterable[PlanEntry], chunk_size: int = PLAN_CHUNK_SIZE,
+                  depth: int = PLAN_QUEUE_DEPTH) -> Iterator[List[PlanEntry]]:
+    """Run the planner on a background thread, yielding its chunks through a bounded queue
+
+    The planner blocks once depth chunks are waiting, which applies backpressure
+    from the executor all the way back to the catalog generators. Errors raised
+    while planning are re-raised in the consumer.
+    """
+    chunks = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=_QUEUE_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in iter_chunks(entries, chunk_size):
+                if not put(chunk):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        put(_END)
+
+    planner = threading.Thread(target=produce, name='planner', daemon=True)
+    planner.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _END:
+                break
+            yield chunk
+    finally:
+        stop.set()
+        planner.join()
+    if errors:
+        raise errors[0]
+
+class PlanStopped(Exception):
+    """Raised by execute_plan when its stop event was set before the plan was done"""
+
+class ExecutionStats:
+    """Counters for a plan execution, safe to update from worker threads"""
+
+    def __init__(self):
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.failed = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.retimed = 0
+        self.deleted = 0
+        self._lock = threading.Lock()
+
+    def add(self, files: int = 0, dirs: int = 0, bytes: int = 0, failed: int = 0, skipped: int = 0,
+            unchanged: int = 0, retimed: int = 0, deleted: int = 0) -> None:
+        with self._lock:
+            self.files += files
+            self.dirs += dirs
+            self.bytes += bytes
+            self.failed += failed
+            self.skipped += skipped
+            self.unchanged += unchanged
+            self.retimed += retimed
+            self.deleted += deleted
+
+    def summary(self) -> str:
+        summary = (f"{self.files:,} files ({self.bytes / 1e9:,.1f}GB logical) and "
+                   f"{self.dirs:,} directories, {self.failed} failures")
+        if self.skipped:
+            summary += f", {self.skipped:,} entries already done"
+        if self.unchanged or self.retimed or self.deleted:
+            summary += f", {self.unchanged:,} unchanged, {self.retimed:,} retimed, {self.deleted:,} deleted"
+        return summary
+
+def prepare_roots(roots: Dict[str, Path], drives: Iterable[str]) -> None:
+    """Create missing drive roots, compressing them like the original scripts"""
+    for drive in drives:
+        root = roots[drive]
+        if not root.exists():
+            print(f"Creating {root} directory")
+            root.mkdir(parents=True, exist_ok=True)
+            compress_directory(root)
+
+def _completed(entry: PlanEntry, factory: FileFactory, journal, store,
+               compressed: Optional[bool] = False) -> None:
+    """Journal and record an entry that is fully done, compressed None keeping the stored flag"""
+    if journal:
+        journal.record(entry)
+    if store:
+        store.record(entry, factory, compressed)
+
+def _compression_recorder(roots: Dict[str, Path], store) -> Callable[[str, bool], None]:
+    """Return a CompressionPlanner.flush callback that records compressed paths in the store"""
+    def record(path: str, recursive: bool) -> None:
+        for drive, root in roots.items():
+            try:
+                relative = Path(path).relative_to(root)
+            except ValueError:
+                continue
+            store.record_compressed(drive, relative.as_posix(), recursive)
+            return
+    return record
+
+def execute_entry(entry: PlanEntry, roots: Dict[str, Path], factory: FileFactory,
+                  stats: ExecutionStats, verbose: bool = False, journal=None, store=None,
+                  compression: Optional[CompressionPlanner] = None, skip_existing: bool = False) -> bool:
+    """Materialize one plan entry, journaling and recording it once it is complete
+
+    Compression is left to the compression planner when one is given, and
+    done right away otherwise. With skip_existing, a file that is already
+    there is left alone, as the original populate scripts did.
+    """
+    path = roots[entry.drive] / entry.path
+    if entry.kind == CLEAN:
+        if path.exists():
+            clean_directory(path)
+        if compression:
+            compression.add_clean(path)
+        _completed(entry, factory, journal, store)
+        return True
+
+    if entry.kind in (RETIME, DELETE):
+        factory.throttle(path)
+        if entry.kind == RETIME:
+            os.utime(path, (entry.mtime, entry.mtime))
+            stats.add(retimed=1)
+        else:
+            if path.is_dir():
+                remove_tree(path, keep_root=False)
+            elif path.exists():
+                path.unlink()
+            stats.add(deleted=1)
+        _completed(entry, factory, journal, store)
+        return True
+
+    if entry.kind == DIR:
+        factory.throttle(path)
+        created = entry.compress and compression is not None and not path.is_dir()
+        path.mkdir(parents=True, exist_ok=True)
+        compressed = False
+        if entry.compress:
+            if compression:
+                compression.add_directory(path, created)
+            else:
+                compressed = compress_directory(path)
+        stats.add(dirs=1)
+        _completed(entry, factory, journal, store, compressed)
+        return True
+
+    if skip_existing and path.exists():
+        stats.add(skipped=1)
+        _completed(entry, factory, journal, store, None)
+        return True
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if verbose:
+        print(f"Creating {path} with size {entry.size / 1_000_000:.1f}MB")
+    if not factory.create(path, entry.size, entry.mtime, content_key=f"{entry.drive}:{entry.path}",
+                          root=roots[entry.drive]):
+        print(f"Failed to create {path}")
+        stats.add(failed=1)
+        return False
+    compressed = False
+    if compression:
+        compression.add_file(path, entry.compress)
+    elif entry.compress:
+        compressed = compress_file(path)
+    stats.add(files=1, bytes=entry.size)
+    _completed(entry, factory, journal, store, compressed)
+    return True
+
+def execute_plan(entries: Iterable[PlanEntry], roots: Optional[Dict[str, Path]] = None,
+                 factory: Optional[FileFactory] = None, verbose: bool = False,
+                 chunk_size: int = PLAN_CHUNK_SIZE, queue_depth: int = PLAN_QUEUE_DEPTH,
+                 executor=None, journal=None, reconcile: bool = False, store=None,
+                 compression: Optional[CompressionPlanner] = None,
+                 stop: Optional[threading.Event] = None) -> ExecutionStats:
+    """Materialize plan entries onto the drive roots, streaming them from the planner
+
+    Entries run in plan order on the calling thread, or on a
+    populate_executor.PlanExecutor when one is given. Entries already in the
+    journal are skipped, and completed ones are added to it. With reconcile,
+    only what differs from the existing tree is executed; otherwise files
+    that already exist are skipped. Completed entries are recorded in the
+    state store when one is given.
+
+    NTFS compression is collected by a CompressionPlanner and done in a few
+    compact calls after the last entry. A planner passed in is left for the
+    caller to flush. Compressed entries skipped through the journal are
+    compressed again, since the interrupted run may not have got to them.
+    The store records an entry as compressed once compact succeeded on it.
+
+    When stop is set, no further entries are started, entries still queued
+    on the executor are dropped and PlanStopped is raised once the running
+    ones have finished.
+    """
+    roots = roots or get_drive_roots()
+    factory = factory or FileFactory()
+    stats = ExecutionStats()
+    flush_compression = compression is None
+    compression = compression or CompressionPlanner()
+    if reconcile:
+        # Imported here because reconcile builds on this module
+        from reconcile import reconcile_plan
+        entries = reconcile_plan(entries, roots, factory, stats, store)
+    run = executor.submit if executor else execute_entry
+    prepared = set()
+    stopped = False
+    try:
+        for chunk in stream_chunks(entries, chunk_size, queue_depth):
+            for entry in chunk:
+                if stop is not None and stop.is_set():
+                    stopped = True
+                    break
+                if entry.drive not in prepared:
+                    prepare_roots(roots, [entry.drive])
+                    factory.attach_manifest(roots[entry.drive])
+                    prepared.add(entry.drive)
+                if journal and journal.is_done(entry):
+                    if entry.compress and entry.kind == DIR:
+                        compression.add_directory(roots[entry.drive] / entry.path, created=True)
+                    elif entry.compress and entry.kind == FILE:
+                        compression.add_file(roots[entry.drive] / entry.path, True)
+                    stats.add(skipped=1)
+                    continue
+                run(entry, roots, factory, stats, verbose, journal, store, compression, not reconcile)
+            if stopped:
+                break
+    finally:
+        try:
+            if executor:
+                if stop is not None and stop.is_set():
+                    executor.cancel()
+                executor.wait()
+            if flush_compression and not stopped:
+                compression.flush(_compression_recorder(roots, store) if store else None)
+        finally:
+            factory.close()
+            if journal:
+                journal.checkpoint()
+            if store:
+                store.flush()
+    if stopped:
+        raise PlanStopped(f"Stopped after {stats.files:,} files and {stats.dirs:,} directories")
+    return stats
+
+def parse_arguments():
+    """Parse command line arguments"""
+    # Imported here because populate_executor, reconcile and state_store build on this module
+    from populate_executor import add_executor_arguments
+    from reconcile import add_reconcile_arguments
+    from state_store import add_store_arguments
+
+    parser = argparse.ArgumentParser(description='Compile the simulated environment into a manifest')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to compile (default: all)')
+    parser.add_argument('--output', help='Write the manifest as JSON lines')
+    parser.add_argument('--execute', action='store_true',
+                        help='Materialize the compiled plan after summarizing it')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Print every entry as it is executed')
+    parser.add_argument('--chunk-size', type=int, default=PLAN_CHUNK_SIZE,
+                        help=f'Entries handed from the planner to the executor at a time (default: {PLAN_CHUNK_SIZE})')
+    parser.add_argument('--queue-depth', type=int, default=PLAN_QUEUE_DEPTH,
+                        help=f'Chunks the planner may run ahead of the executor (default: {PLAN_QUEUE_DEPTH})')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'populate_plan')
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    from populate_executor import executor_from_args
+    from state_store import store_from_args
+
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    company_data = load_company_data(args.data_file)
+
+    print(f"Compiling stages: {', '.join(args.stages)}")
+    summary = new_summary()
+    entries = tally_plan(compile_environment(company_data, args.stages), summary)
+
+    # The plan is generated once and streamed; with --output it is replayed from the manifest
+    if args.output:
+        count = write_manifest(entries, args.output)
+        print_plan_summary(summary)
+        print(f"\nWrote {count:,} entries to {args.output}")
+        entries = read_manifest(args.output)
+    elif not args.execute:
+        for _ in entries:
+            pass
+        print_plan_summary(summary)
+
+    if args.execute:
+        executor = executor_from_args(args)
+        store = store_from_args(args, company_data)
+        stats = execute_plan(entries, factory=factory_from_args(args), verbose=args.verbose,
+                             chunk_size=args.chunk_size, queue_depth=args.queue_depth,
+                             executor=executor, journal=journal_from_args(args),
+                             reconcile=args.reconcile, store=store)
+        if store:
+            store.close()
+        if not args.output:
+            print_plan_summary(summary)
+        print(f"\nCreated {stats.summary()}")
+        if executor and executor.controller:
+            print(f"Executor {executor.controller.summary()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Populate Shards
+
+Multiprocess population of the simulated environment, sharded by user.
+
+Per-user work is very skewed: AI practitioners get tens of GB of model files,
+network engineers get piles of ISOs and most users get a handful of documents.
+Splitting users evenly across processes leaves everyone waiting on whichever
+worker drew the pack rats. Instead the environment is planned first, each
+independent work unit is weighed, and units are handed out longest first:
+
+    user:<name>         Every U: stage of one user, in stage order
+    project:<number>    One G: project directory
+    department:<name>   One G: management directory
+
+A unit's weight is its planned file count times --file-cost plus the bytes
+that will actually be allocated (nothing for sparse allocation). Units are
+submitted to a process pool in descending weight order, so each idle worker
+takes the largest unit left (longest-processing-time list scheduling), and
+wall-clock time approaches total work divided by the number of processes.
+
+Planned entries are spilled to a temporary JSON lines file while they are
+weighed, so the parent only keeps one small record per unit in memory.
+
+Workers share one checkpoint journal. Each finished unit is journaled as a
+whole, so --resume skips completed users, projects and departments without
+planning them, and resumes interrupted units entry by entry. Workers record
+what they create in the parent's state store through their own connections.
+
+Usage:
+    python populate_shards.py [options]
+
+Options:
+    --data-file FILE    Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...  Stages to populate (default: all)
+    --processes N       Worker processes (default: CPU count)
+    --file-cost BYTES   Weight of creating one file, in allocated-byte equivalents
+    --dry-run, -n       Plan and print the schedule without creating anything
+    --resume            Skip units and entries an interrupted run completed
+
+Example:
+    python populate_shards.py --processes 8 --workers 4 --allocation sparse
+    python populate_shards.py --dry-run --stages u_drive emails
+"""
+
+import os
+import copy
+import json
+import heapq
+import time
+import argparse
+import functools
+import itertools
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import file_dates
+from checkpoint_journal import CheckpointJournal, add_journal_arguments, journal_from_args
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args
+from populate_executor import ADAPTIVE_MAX_WORKERS, add_executor_arguments, build_executor
+from seeds import DEFAULT_COMPANY_SEED, add_seed_arguments, get_company_seed, set_company_seed
+from state_store import StateStore, add_store_arguments, store_from_args
+from populate_plan import (FILE, STAGE_ORDER, PlanEntry, ExecutionStats, get_username, plan_dir,
+                           get_drive_roots, load_company_data, execute_plan)
+
+# Default weight of one file creation: metadata round-trips, timestamping, compression
+DEFAULT_FILE_COST = 1_000_000
+
+# A planned unit: where its entries are in the spill file and what it weighs
+WorkUnit = namedtuple('WorkUnit', ['name', 'offset', 'length', 'files', 'bytes', 'weight'])
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+def get_root_entries(stages: Iterable[str]) -> List[PlanEntry]:
+    """Return the drive-level directories every unit depends on"""
+    stages = set(stages)
+    entries = []
+    if stages - {'g_drive'}:
+        entries.append(plan_dir('U', 'Users', None, 'home', compress=True))
+    if 'g_drive' in stages:
+        entries.append(plan_dir('G', 'Projects', None, 'project'))
+        entries.append(plan_dir('G', 'Management', None, 'management'))
+    return entries
+
+def iter_work_units(company_data: Dict, stages: Iterable[str] = STAGE_ORDER) -> Iterator[Tuple[str, Iterable[PlanEntry]]]:
+    """Yield (name, entries) for every independently executable unit of work"""
+    for name, planner in iter_unit_planners(company_data, stages):
+        yield name, planner()
+
+def get_unit_planners(company_data: Dict, stages: Iterable[str] = STAGE_ORDER) -> Dict[str, Callable[[], Iterable[PlanEntry]]]:
+    """Return a planner for every work unit by name, so single units can be planned without walking the rest"""
+    planners = {}
+    for name, planner in iter_unit_planners(company_data, stages):
+        if name in planners:
+            # Users sharing a username share their U: tree, and were one unit's worth of entries before
+            planner = functools.partial(_chain_planners, planners[name], planner)
+        planners[name] = planner
+    return planners
+
+def _chain_planners(*planners: Callable[[], Iterable[PlanEntry]]) -> Iterable[PlanEntry]:
+    return itertools.chain.from_iterable(planner() for planner in planners)
+
+def iter_unit_planners(company_data: Dict, stages: Iterable[str] = STAGE_ORDER) -> Iterator[Tuple[str, Callable[[], Iterable[PlanEntry]]]]:
+    """Yield (name, planner) for every unit, where calling planner returns the unit's entries"""
+    # Imported here because the populate scripts import populate_plan
+    import U_drive_setup
+    import U_populate_desktop
+    import U_populate_downloads
+    import U_populate_emails
+    import G_drive_populate
+
+    def plan_u_drive_user(user_id, user_data):
+        technologies = U_drive_setup.select_technologies(user_data)
+        return U_drive_setup.plan_user_directory(get_username(user_data), technologies,
+                                                 user_data['role'], user_data, company_data)
+
+    user_planners = {
+        'u_drive': plan_u_drive_user,
+        'desktop': lambda user_id, user_data: U_populate_desktop.plan_user_desktop(user_data),
+        'downloads': lambda user_id, user_data: U_populate_downloads.plan_user_downloads(user_data),
+        'emails': U_populate_emails.plan_user_emails,
+    }
+    stages = [stage for stage in STAGE_ORDER if stage in stages]
+    user_stages = [user_planners[stage] for stage in stages if stage in user_planners]
+
+    def plan_user(user_id, user_data):
+        return itertools.chain.from_iterable(planner(user_id, user_data) for planner in user_stages)
+
+    if user_stages:
+        for user_id, user_data in company_data['users'].items():
+            yield f"user:{get_username(user_data)}", functools.partial(plan_user, user_id, user_data)
+
+    if 'g_drive' in stages:
+        G_drive_populate.validate_project_dates(company_data)
+        for project in company_data['projects'].values():
+            yield (f"project:{project.get('number', 'unknown')}",
+                   functools.partial(G_drive_populate.plan_project, project))
+        for dept, users in G_drive_populate.get_department_users(company_data).items():
+            yield f"department:{dept}", functools.partial(G_drive_populate.plan_management, dept, users)
+
+def unit_weight(files: int, allocated_bytes: int, file_cost: int = DEFAULT_FILE_COST) -> int:
+    """Estimate the cost of a unit from its file count and allocated bytes"""
+    return files * file_cost + allocated_bytes
+
+def spill_units(units: Iterable[Tuple[str, Iterable[PlanEntry]]], spill, factory: FileFactory,
+                file_cost: int = DEFAULT_FILE_COST) -> List[WorkUnit]:
+    """Write every unit's entries to the spill file, returning the weighed units"""
+    planned = []
+    for name, entries in units:
+        offset = spill.tell()
+        files = 0
+        logical_bytes = 0
+        allocated_bytes = 0
+        for entry in entries:
+            spill.write((json.dumps(entry._asdict()) + '\n').encode('utf-8'))
+            if entry.kind == FILE:
+                files += 1
+                logical_bytes += entry.size
+                if factory.allocation != 'sparse':
+                    allocated_bytes += factory.materialized_size(entry.size)
+        planned.append(WorkUnit(name, offset, spill.tell() - offset, files, logical_bytes,
+                                unit_weight(files, allocated_bytes, file_cost)))
+    return planned
+
+def read_unit(spill_path: str, unit: WorkUnit) -> Iterator[PlanEntry]:
+    """Stream a unit's entries back from the spill file"""
+    with open(spill_path, 'rb') as f:
+        f.seek(unit.offset)
+        for line in f.read(unit.length).splitlines():
+            yield PlanEntry(**json.loads(line))
+
+def schedule_lpt(units: List[WorkUnit], processes: int) -> Tuple[List[WorkUnit], List[int]]:
+    """Order units longest first and return the per-process loads LPT would give"""
+    ordered = sorted(units, key=lambda unit: unit.weight, reverse=True)
+    loads = [(0, index) for index in range(processes)]
+    for unit in ordered:
+        load, index = heapq.heappop(loads)
+        heapq.heappush(loads, (load + unit.weight, index))
+    return ordered, sorted((load for load, _ in loads), reverse=True)
+
+def _init_worker(roots, factory: FileFactory, workers: Optional[int], max_pending: Optional[int],
+                 max_workers: int, journal_path: Optional[str] = None, store_path: Optional[str] = None,
+                 seed: int = DEFAULT_COMPANY_SEED, age_profiles: Optional[Dict] = None) -> None:
+    """Set up the company seed, age profiles, file factory, thread pool, journal and state store of a worker process"""
+    # Spawned processes do not inherit the parent's seed or --age-profile overrides
+    set_company_seed(seed)
+    file_dates.AGE_PROFILES.update(age_profiles or {})
+    _worker['roots'] = roots
+    _worker['factory'] = factory
+    _worker['executor'] = build_executor(workers, max_pending, max_workers)
+    # Every worker appends to the parent's journal through its own handle
+    _worker['journal'] = CheckpointJournal(journal_path, resume=True) if journal_path else None
+    _worker['store'] = StateStore(store_path) if store_path else None
+
+def _run_unit(spill_path: str, unit: WorkUnit) -> Tuple[int, int, int, int, int, int, float]:
+    """Execute one unit in a worker process, returning its counters and busy time"""
+    started = time.monotonic()
+    stats = execute_plan(read_unit(spill_path, unit), _worker['roots'], _worker['factory'],
+                         executor=_worker['executor'], journal=_worker['journal'], store=_worker['store'])
+    return (os.getpid(), stats.files, stats.dirs, stats.bytes, stats.failed, stats.skipped,
+            time.monotonic() - started)
+
+def populate_sharded(company_data: Dict, stages: Iterable[str] = STAGE_ORDER,
+                     processes: Optional[int] = None, roots=None, factory: Optional[FileFactory] = None,
+                     workers: Optional[int] = 1, max_pending: Optional[int] = None,
+                     max_workers: int = ADAPTIVE_MAX_WORKERS, file_cost: int = DEFAULT_FILE_COST, dry_run: bool = False,
+                     journal: Optional[CheckpointJournal] = None,
+                     store: Optional[StateStore] = None) -> ExecutionStats:
+    """Plan, weigh and populate the environment on a pool of worker processes"""
+    processes = processes or os.cpu_count() or 1
+    roots = roots or get_drive_roots()
+    factory = factory or FileFactory()
+    stats = ExecutionStats()
+
+    fd, spill_path = tempfile.mkstemp(prefix='populate_plan_', suffix='.jsonl')
+    try:
+        with os.fdopen(fd, 'wb') as spill:
+            units = iter_work_units(company_data, stages)
+            if journal and journal.units:
+                units = ((name, entries) for name, entries in units if not journal.is_unit_done(name))
+            units = spill_units(units, spill, factory, file_cost)
+        ordered, loads = schedule_lpt(units, processes)
+        total_files = sum(unit.files for unit in units)
+        total_bytes = sum(unit.bytes for unit in units)
+        print(f"\nPlanned {len(units):,} units: {total_files:,} files ({total_bytes / 1e9:,.1f}GB logical)")
+        if ordered:
+            print(f"Largest unit: {ordered[0].name} ({ordered[0].files:,} files, {ordered[0].bytes / 1e9:,.1f}GB)")
+            print(f"Predicted load per process: max {loads[0]:,} / min {loads[-1]:,} "
+                  f"({loads[0] / max(loads[-1], 1):.2f}x spread)")
+        if dry_run:
+            return stats
+
+        # Drive-level directories first, with a copy so the factory stays picklable
+        prelude = execute_plan(get_root_entries(stages), roots, copy.copy(factory), journal=journal, store=store)
+        stats.add(dirs=prelude.dirs, skipped=prelude.skipped)
+
+        # Every process gets an equal share of the rate limits
+        worker_factory = copy.copy(factory)
+        if factory.rate_limiter is not None:
+            worker_factory.rate_limiter = factory.rate_limiter.split(processes)
+
+        busy = {}
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(roots, worker_factory, workers, max_pending, max_workers,
+                                           str(journal.path) if journal else None,
+                                           store.path if store else None, get_company_seed(),
+                                           dict(file_dates.AGE_PROFILES))) as pool:
+            # Submitted longest first, so every idle process takes the largest unit left
+            futures = {pool.submit(_run_unit, spill_path, unit): unit for unit in ordered}
+            for future in as_completed(futures):
+                pid, files, dirs, size, failed, skipped, elapsed = future.result()
+                stats.add(files=files, dirs=dirs, bytes=size, failed=failed, skipped=skipped)
+                busy[pid] = busy.get(pid, 0.0) + elapsed
+                # Units with failures are retried entry by entry on resume
+                if journal and not failed:
+                    journal.record_unit(futures[future].name)
+        if busy:
+            print(f"Finished in {time.monotonic() - started:.1f}s; process busy time "
+                  f"max {max(busy.values()):.1f}s / min {min(busy.values()):.1f}s")
+    finally:
+        os.unlink(spill_path)
+        if journal:
+            journal.close()
+        if store:
+            store.close()
+    return stats
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate the simulated environment on a pool of processes')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to populate (default: all)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--file-cost', type=int, default=DEFAULT_FILE_COST, metavar='BYTES',
+                        help='Weight of creating one file, in allocated-byte equivalents '
+                             f'(default: {DEFAULT_FILE_COST})')
+    parser.add_argument('--dry-run', '-n', action='store_true',
+                        help='Plan and print the schedule without creating anything')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'populate_shards')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    company_data = load_company_data(args.data_file)
+
+    print(f"Sharding stages: {', '.join(args.stages)} across {args.processes} processes")
+    stats = populate_sharded(company_data, args.stages, args.processes,
+                             factory=factory_from_args(args), workers=args.workers,
+                             max_pending=args.max_pending, max_workers=args.max_workers,
+                             file_cost=args.file_cost, dry_run=args.dry_run,
+                             journal=None if args.dry_run else journal_from_args(args),
+                             store=None if args.dry_run else store_from_args(args, company_data))
+    if not args.dry_run:
+        print(f"\nCreated {stats.summary()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Rate Limits
+
+Token-bucket throttling of the materialization path, for populating test
+shares on arrays that also serve other teams.
+
+Two budgets are enforced, each globally and optionally per target root:
+
+    bytes/s   Bytes actually allocated or written: the whole file for full
+              allocation, the allocated extents in ratio mode, the single
+              tail block of a sparse file, and every chunk as it is written
+              in content mode (so a 30GB PST cannot burst past the limit)
+    ops/s     Files and directories created
+
+Buckets run a debt model: a request larger than the remaining tokens is
+granted straight away but drives the bucket negative, and the caller sleeps
+until the debt would have been refilled. Long-run throughput therefore holds
+at the configured rate whatever the request sizes, and concurrent callers are
+served roughly in arrival order.
+
+Command line options (all populate scripts):
+
+    --max-bytes-per-sec SIZE        Global byte budget, e.g. 200M
+    --max-ops-per-sec N             Global file and directory creation budget
+    --root-limit ROOT=SIZE[,OPS]    Budget for one target root, e.g. U:=100M,500
+"""
+
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+_SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_size(value: str) -> float:
+    """Parse a byte count with an optional K, M, G or T suffix"""
+    value = str(value).strip().upper().rstrip('B')
+    multiplier = 1
+    if value and value[-1] in _SIZE_SUFFIXES:
+        multiplier = _SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+    return float(value) * multiplier
+
+class TokenBucket:
+    """Thread-safe token bucket refilling at rate tokens per second"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or rate  # One second of burst by default
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Buckets travel to populate_shards worker processes without their lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens, returning how long the caller must wait for them"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self, amount: float) -> None:
+        """Take amount tokens, sleeping until the bucket can afford them"""
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+class RateLimiter:
+    """Byte and operation budgets, global and per target root"""
+
+    def __init__(self, max_bytes_per_sec: Optional[float] = None, max_ops_per_sec: Optional[float] = None,
+                 root_limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None):
+        self.limits = (max_bytes_per_sec, max_ops_per_sec)
+        self.root_limits = dict(root_limits or {})
+        self.global_buckets = self._make_buckets(max_bytes_per_sec, max_ops_per_sec)
+        # Longest root first, so nested roots match before their parents
+        self.root_buckets = sorted(
+            ((os.path.normcase(os.path.abspath(root)), self._make_buckets(*limits))
+             for root, limits in self.root_limits.items()),
+            key=lambda item: len(item[0]), reverse=True)
+        self.waited = 0.0
+        self._waited_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_waited_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._waited_lock = threading.Lock()
+
+    @staticmethod
+    def _make_buckets(max_bytes: Optional[float], max_ops: Optional[float]) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        return (TokenBucket(max_bytes) if max_bytes else None,
+                TokenBucket(max_ops) if max_ops else None)
+
+    def _buckets_for(self, path) -> List[Tuple[Optional[TokenBucket], Optional[TokenBucket]]]:
+        """Return the global buckets plus those of the root containing path"""
+        buckets = [self.global_buckets]
+        if self.root_buckets:
+            target = os.path.normcase(os.path.abspath(path))
+            for root, root_buckets in self.root_buckets:
+                if target == root or target.startswith(root.rstrip(os.sep) + os.sep):
+                    buckets.append(root_buckets)
+                    break
+        return buckets
+
+    def charge(self, path, ops: int = 0, nbytes: int = 0) -> None:
+        """Charge operations and bytes against path's budgets, sleeping as needed"""
+        delay = 0.0
+        for byte_bucket, op_bucket in self._buckets_for(path):
+            if byte_bucket and nbytes:
+                delay = max(delay, byte_bucket.reserve(nbytes))
+            if op_bucket and ops:
+                delay = max(delay, op_bucket.reserve(ops))
+        if delay > 0:
+            with self._waited_lock:
+                self.waited += delay
+            time.sleep(delay)
+
+    def split(self, parts: int) -> 'RateLimiter':
+        """Return a limiter with every budget divided between parts processes"""
+        def divide(limit):
+            return limit / parts if limit else None
+        return RateLimiter(*(divide(limit) for limit in self.limits),
+                           {root: tuple(divide(limit) for limit in limits)
+                            for root, limits in self.root_limits.items()})
+
+def parse_root_limits(values) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """Parse ROOT=SIZE[,OPS] options into per-root (bytes/s, ops/s) budgets"""
+    limits = {}
+    for value in values or []:
+        root, _, spec = value.rpartition('=')
+        byte_limit, _, op_limit = spec.partition(',')
+        if not root or not (byte_limit or op_limit):
+            raise ValueError(f"Invalid root limit '{value}', expected ROOT=BYTES_PER_SEC[,OPS_PER_SEC]")
+        limits[root] = (parse_size(byte_limit) if byte_limit else None,
+                        float(op_limit) if op_limit else None)
+    return limits
+
+def add_rate_limit_arguments(parser) -> None:
+    """Add the I/O rate limit options to a populate script's argument parser"""
+    parser.add_argument('--max-bytes-per-sec', type=parse_size, metavar='SIZE',
+                        help='Limit bytes allocated or written per second, e.g. 200M (default: unlimited)')
+    parser.add_argument('--max-ops-per-sec', type=float, metavar='N',
+                        help='Limit files and directories created per second (default: unlimited)')
+    parser.add_argument('--root-limit', action='append', metavar='ROOT=SIZE[,OPS]',
+                        help='Limit one target root, e.g. U:=100M,500 (repeatable)')
+
+def rate_limiter_from_args(args) -> Optional[RateLimiter]:
+    """Build the rate limiter selected on the command line, or None when unlimited"""
+    root_limits = parse_root_limits(args.root_limit)
+    if not (args.max_bytes_per_sec or args.max_ops_per_sec or root_limits):
+        return None
+    return RateLimiter(args.max_bytes_per_sec, args.max_ops_per_sec, root_limits)
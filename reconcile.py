@@ -0,0 +1,175 @@
+"""
+Reconcile
+
+Diff-based repopulation: instead of wiping each user's directory and
+recreating everything, compare the tree that is already on disk with the plan
+and only touch what differs.
+
+A clean entry opens a scope. The directory it would have emptied is scanned
+once with os.scandir, and every planned entry inside it is looked up in the
+scan:
+
+    missing                      created as planned
+    file of the wrong size       recreated at the planned (materialized) size
+    file with the wrong mtime    retimed in place
+    directory or matching file   left alone
+    wrong type                   removed and created as planned
+
+When the scope ends (the next clean, or the first entry outside it),
+everything in the scan that the plan did not mention is deleted. Entries
+outside any scope are checked with a single stat each. A repeat run therefore
+costs one scan plus work proportional to the changes, not to the size of the
+environment.
+
+Used through execute_plan(..., reconcile=True) or the --reconcile option of
+the populate scripts.
+"""
+
+import os
+import stat
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from populate_plan import CLEAN, DIR, FILE, RETIME, DELETE, PlanEntry
+from teardown import remove_tree
+
+# Filesystems store mtimes with different precision (FAT: 2 seconds)
+MTIME_TOLERANCE = 2.0
+
+# What is on disk at a path: (is_dir, size, mtime)
+Existing = Tuple[bool, int, float]
+
+def scan_tree(root: Path, path: str) -> Dict[str, Existing]:
+    """Return everything at and below a drive-relative directory, keyed by relative path"""
+    found = {}
+    top = root / path
+    if not top.is_dir():
+        return found
+    found[path] = (True, 0, 0.0)
+    pending = [(os.fspath(top), path)]
+    while pending:
+        directory, relative = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                for item in it:
+                    item_path = f"{relative}/{item.name}"
+                    if item.is_dir(follow_symlinks=False):
+                        found[item_path] = (True, 0, 0.0)
+                        pending.append((item.path, item_path))
+                    else:
+                        st = item.stat(follow_symlinks=False)
+                        found[item_path] = (False, st.st_size, st.st_mtime)
+        except OSError as e:
+            print(f"Error scanning {directory}: {e}")
+    return found
+
+def stat_path(root: Path, path: str) -> Optional[Existing]:
+    """Return what is on disk at one drive-relative path, or None"""
+    try:
+        st = os.stat(root / path, follow_symlinks=False)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return True, 0, 0.0
+    return False, st.st_size, st.st_mtime
+
+def delete_entry(drive: str, path: str) -> PlanEntry:
+    """Plan the removal of a file or directory the plan no longer contains"""
+    return PlanEntry(drive, path, 0, None, False, None, 'reconcile', DELETE)
+
+def _remove(target: Path, is_dir: bool) -> None:
+    """Remove a file or directory standing where the plan wants the other type"""
+    if is_dir:
+        remove_tree(target, keep_root=False)
+    else:
+        target.unlink()
+
+class _Scope:
+    """Scan of one cleaned directory and the paths the plan has visited in it"""
+
+    def __init__(self, drive: str, path: str, existing: Dict[str, Existing]):
+        self.drive = drive
+        self.path = path
+        self.existing = existing
+        self.seen = {path}
+
+    def contains(self, entry: PlanEntry) -> bool:
+        return entry.drive == self.drive and (entry.path == self.path or
+                                              entry.path.startswith(self.path + '/'))
+
+    def visit(self, path: str) -> Optional[Existing]:
+        """Mark a path and its parent directories as planned, returning what is there"""
+        self.seen.add(path)
+        parent = path.rpartition('/')[0]
+        while len(parent) > len(self.path) and parent not in self.seen:
+            self.seen.add(parent)
+            parent = parent.rpartition('/')[0]
+        return self.existing.get(path)
+
+    def leftovers(self) -> Iterator[PlanEntry]:
+        """Yield deletions for everything unplanned, skipping what a deleted directory covers"""
+        deleted = set()
+        for path in sorted(self.existing):
+            if path in self.seen:
+                continue
+            parent = path.rpartition('/')[0]
+            while len(parent) > len(self.path) and parent not in deleted:
+                parent = parent.rpartition('/')[0]
+            if len(parent) > len(self.path):
+                continue
+            if self.existing[path][0]:
+                deleted.add(path)
+            yield delete_entry(self.drive, path)
+
+def reconcile_plan(entries: Iterable[PlanEntry], roots: Dict[str, Path], factory,
+                   stats=None, store=None) -> Iterator[PlanEntry]:
+    """Yield only the entries needed to turn what is on disk into the plan
+
+    Entries already in place are recorded in the store, when one is given,
+    keeping their recorded compression state.
+    """
+    scope = None
+    for entry in entries:
+        if scope and not scope.contains(entry):
+            yield from scope.leftovers()
+            scope = None
+
+        if entry.kind == CLEAN:
+            if scope:
+                yield from scope.leftovers()
+            scope = _Scope(entry.drive, entry.path, scan_tree(roots[entry.drive], entry.path))
+            continue
+        if entry.kind not in (DIR, FILE):
+            yield entry
+            continue
+
+        existing = scope.visit(entry.path) if scope else stat_path(roots[entry.drive], entry.path)
+        if existing is None:
+            yield entry
+            continue
+
+        is_dir, size, mtime = existing
+        if is_dir != (entry.kind == DIR):
+            # Rare type change; removed here so it cannot race the new entry's lane
+            _remove(roots[entry.drive] / entry.path, is_dir)
+            if stats is not None:
+                stats.add(deleted=1)
+            yield entry
+        elif entry.kind == FILE and size != factory.materialized_size(entry.size):
+            yield entry
+        elif entry.kind == FILE and entry.mtime is not None and abs(mtime - entry.mtime) > MTIME_TOLERANCE:
+            yield entry._replace(kind=RETIME)
+        else:
+            if stats is not None:
+                stats.add(unchanged=1)
+            if store:
+                store.record(entry, factory, compressed=None)
+
+    if scope:
+        yield from scope.leftovers()
+
+def add_reconcile_arguments(parser) -> None:
+    """Add the reconcile option to a populate script's argument parser"""
+    parser.add_argument('--reconcile', action='store_true',
+                        help='Only create, resize, retime or delete what differs from the plan '
+                             'instead of wiping and recreating user directories')
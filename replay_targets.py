@@ -0,0 +1,290 @@
+"""
+Replay Targets
+
+Materializes one plan onto several targets at once, for test rigs (different
+mount points and filesystems) that must hold the same simulated environment.
+The planners and their random draws run once: the plan is written to a
+manifest (or an existing populate_plan.py --output manifest is used) and
+every target streams the same manifest concurrently.
+
+A target is a directory holding the two drive roots as U_Drive and G_Drive,
+like the local fallback of the populate scripts, or explicit drive roots:
+
+    --target /mnt/rig1
+    --target U=/mnt/rig2/users,G=/mnt/rig2/groups
+
+Each target gets its own thread, its own executor (so the adaptive worker
+count settles for that target's filesystem) and its own checkpoint journal
+(<journal>.<n>.jsonl), so an interrupted replay resumes target by target
+with --resume. Progress is printed per target. The state store records the
+environment once, from the first target.
+
+Sizes, modification times, allocation and, with --allocation content, the
+bytes themselves come from the plan and the company seed, so the targets
+are identical. Files planned without a modification time (created "now")
+all get the latest modification time in the plan, which is the same for
+every target and for a resumed replay. --verify compares every target's tree
+(paths, types, sizes, modification times) with the first one's afterwards.
+
+Usage:
+    python replay_targets.py --target PATH [--target PATH ...] [options]
+
+Options:
+    --target SPEC        Target directory, or U=PATH,G=PATH (repeatable)
+    --manifest FILE      Replay this manifest instead of planning
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to plan (default: all)
+    --verify             Compare the targets' trees after the replay
+
+Example:
+    python replay_targets.py --target /mnt/rig1 --target /mnt/rig2 --allocation sparse --verify
+    python populate_plan.py --output plan.jsonl
+    python replay_targets.py --manifest plan.jsonl --target /mnt/rig1 --target U=/mnt/u,G=/mnt/g
+"""
+
+import os
+import copy
+import time
+import datetime
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from checkpoint_journal import CheckpointJournal, add_journal_arguments
+from file_dates import AGE_PROFILES, add_date_arguments, parse_age_profiles
+from file_factory import SIZE_MANIFEST_NAME, FileFactory, add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import (FILE, STAGE_ORDER, PlanEntry, ExecutionStats, compile_environment, load_company_data,
+                           read_manifest, write_manifest, execute_plan)
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Drive root directory names inside a target directory
+TARGET_DRIVES = {'U': 'U_Drive', 'G': 'G_Drive'}
+
+def parse_target(spec: str) -> Dict[str, Path]:
+    """Return the drive roots of a target given as a directory or as U=PATH,G=PATH"""
+    if '=' not in spec:
+        return {drive: Path(spec) / name for drive, name in TARGET_DRIVES.items()}
+    roots = {}
+    for part in spec.split(','):
+        drive, _, path = part.partition('=')
+        drive = drive.strip().upper().rstrip(':')
+        if drive not in TARGET_DRIVES or not path:
+            raise ValueError(f"Invalid target {spec!r}: expected a directory or U=PATH,G=PATH")
+        roots[drive] = Path(path)
+    missing = set(TARGET_DRIVES) - set(roots)
+    if missing:
+        raise ValueError(f"Target {spec!r} has no root for drive {', '.join(sorted(missing))}")
+    return roots
+
+def scan_manifest(path: str) -> Tuple[int, float]:
+    """Return a manifest's entry count and the time given to files planned without one
+
+    That time is the latest modification time in the plan, or the end of the
+    default age profile if no entry has one, so it never depends on when or
+    how often the replay runs.
+    """
+    count = 0
+    latest = None
+    for entry in read_manifest(path):
+        count += 1
+        if entry.mtime is not None and (latest is None or entry.mtime > latest):
+            latest = entry.mtime
+    if latest is None:
+        latest = datetime.datetime.strptime(AGE_PROFILES['default']['end'], "%Y-%m-%d").timestamp()
+    return count, latest
+
+def get_target_journal(path: str, index: int) -> str:
+    """Return the journal path of the index-th target"""
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{index}{suffix}"
+
+class TargetProgress:
+    """Entries and bytes of one target, counted as they are handed to its executor"""
+
+    def __init__(self, name: str, total: int, executor=None):
+        self.name = name
+        self.total = total
+        self.executor = executor
+        self.entries = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.stats: Optional[ExecutionStats] = None
+        self.error: Optional[BaseException] = None
+
+    def track(self, entries: Iterable[PlanEntry], mtime: float) -> Iterator[PlanEntry]:
+        """Yield entries with files' missing mtimes pinned, counting them as they are taken"""
+        for entry in entries:
+            self.entries += 1
+            if entry.kind == FILE:
+                self.bytes += entry.size
+                if entry.mtime is None:
+                    entry = entry._replace(mtime=mtime)
+            yield entry
+
+    def line(self) -> str:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        queued = self.executor.pending if self.executor and not self.finished else 0
+        done = self.entries - queued
+        share = done / self.total if self.total else 1.0
+        state = 'failed' if self.error else 'done' if self.finished else f"running, {queued:,} queued"
+        return (f"  {self.name}: {done:,}/{self.total:,} entries ({share:.0%}), "
+                f"{self.bytes / 1e9:,.1f}GB logical, {done / max(elapsed, 1e-6):,.0f} entries/s, {state}")
+
+def replay_target(manifest: str, roots: Dict[str, Path], progress: TargetProgress, factory: FileFactory,
+                  mtime: float, executor=None, journal=None, store=None) -> None:
+    """Materialize the manifest onto one target, recording the outcome in progress"""
+    try:
+        progress.stats = execute_plan(progress.track(read_manifest(manifest), mtime), roots, factory,
+                                      executor=executor, journal=journal, store=store)
+    except Exception as e:
+        progress.error = e
+        print(f"{progress.name} failed: {e}")
+    finally:
+        if executor:
+            executor.close()
+        if journal:
+            journal.close()
+        progress.finished = time.monotonic()
+
+def replay(manifest: str, targets: List[Tuple[str, Dict[str, Path]]], total: int, mtime: float,
+           factory: FileFactory, executors: List, journals: List, store=None) -> List[TargetProgress]:
+    """Replay a manifest onto every target in parallel, printing progress until all finish
+
+    mtime is given to files planned without a modification time.
+    """
+    progress = [TargetProgress(name, total, executor) for (name, _), executor in zip(targets, executors)]
+    threads = []
+    for index, (name, roots) in enumerate(targets):
+        thread = threading.Thread(target=replay_target, name=f"target-{index}", args=(
+            manifest, roots, progress[index], copy.copy(factory), mtime, executors[index], journals[index],
+            store if index == 0 else None))
+        thread.start()
+        threads.append(thread)
+
+    running = threads
+    while running:
+        running[0].join(PROGRESS_INTERVAL)
+        running = [thread for thread in running if thread.is_alive()]
+        if running:
+            print(f"{time.strftime('%H:%M:%S')} progress:")
+            for target in progress:
+                print(target.line())
+    return progress
+
+def snapshot_tree(roots: Dict[str, Path]) -> Dict[Tuple[str, str], Tuple[bool, int, int]]:
+    """Return (is_dir, size, whole-second mtime) of everything below a target's drive roots"""
+    found = {}
+    for drive, root in roots.items():
+        for directory, dirnames, filenames in os.walk(root):
+            relative = Path(directory).relative_to(root).as_posix()
+            prefix = '' if relative == '.' else f"{relative}/"
+            for dirname in dirnames:
+                found[(drive, prefix + dirname)] = (True, 0, 0)
+            for filename in filenames:
+                if filename == SIZE_MANIFEST_NAME and not prefix:
+                    continue  # Appended in completion order, which differs between targets
+                st = os.stat(os.path.join(directory, filename))
+                found[(drive, prefix + filename)] = (False, st.st_size, int(st.st_mtime))
+    return found
+
+def verify_targets(targets: List[Tuple[str, Dict[str, Path]]]) -> bool:
+    """Compare every target's tree with the first target's, printing differences"""
+    reference_name, reference_roots = targets[0]
+    reference = snapshot_tree(reference_roots)
+    identical = True
+    for name, roots in targets[1:]:
+        tree = snapshot_tree(roots)
+        missing = sorted(set(reference) - set(tree))
+        extra = sorted(set(tree) - set(reference))
+        different = sorted(key for key in set(reference) & set(tree) if reference[key] != tree[key])
+        if missing or extra or different:
+            identical = False
+            print(f"{name} differs from {reference_name}: {len(missing):,} missing, "
+                  f"{len(extra):,} extra, {len(different):,} different")
+            for label, keys in (('missing', missing), ('extra', extra), ('different', different)):
+                for drive, path in keys[:5]:
+                    print(f"    {label}: {drive}:/{path}")
+        else:
+            print(f"{name} matches {reference_name}: {len(tree):,} entries")
+    return identical
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Materialize one plan onto several targets in parallel')
+    parser.add_argument('--target', action='append', required=True, metavar='SPEC',
+                        help='Target directory holding U_Drive and G_Drive, or U=PATH,G=PATH (repeatable)')
+    parser.add_argument('--manifest', metavar='FILE',
+                        help='Replay this manifest (populate_plan.py --output) instead of planning')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to plan (default: all)')
+    parser.add_argument('--verify', action='store_true',
+                        help="Compare every target's tree with the first one's after the replay")
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'replay_targets')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    try:
+        targets = [(spec, parse_target(spec)) for spec in args.target]
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise SystemExit(2)
+
+    started = time.monotonic()
+    company_data = None
+    temp_manifest = None
+    manifest = args.manifest
+    if not manifest:
+        company_data = load_company_data(args.data_file)
+        fd, temp_manifest = tempfile.mkstemp(prefix='replay_', suffix='.jsonl')
+        os.close(fd)
+        manifest = temp_manifest
+        total = write_manifest(compile_environment(company_data, args.stages), manifest)
+        print(f"Planned {total:,} entries in {time.monotonic() - started:.1f}s")
+
+    try:
+        total, mtime = scan_manifest(manifest)
+        journals = [None if args.no_journal else
+                    CheckpointJournal(get_target_journal(args.journal, index), resume=args.resume)
+                    for index in range(len(targets))]
+        for (name, _), journal in zip(targets, journals):
+            if journal and journal.resumed:
+                print(f"Resuming {name}: {len(journal.done):,} entries already done")
+        executors = [executor_from_args(args) for _ in targets]
+        store = store_from_args(args, company_data)
+        print(f"Replaying onto {len(targets)} targets")
+        progress = replay(manifest, targets, total, mtime, factory_from_args(args), executors, journals, store)
+        if store:
+            store.close()
+    finally:
+        if temp_manifest:
+            os.unlink(temp_manifest)
+
+    print(f"\nFinished in {time.monotonic() - started:.1f}s")
+    for target in progress:
+        print(f"  {target.name}: " + (f"failed: {target.error}" if target.error else f"created {target.stats.summary()}"))
+    failed = any(target.error or target.stats.failed for target in progress)
+    if args.verify and not verify_targets(targets):
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Sampling
+
+Materializes a small, deterministic, stratified sample of the company and
+predicts the totals of the full environment from it, for smoke tests that
+need a representative environment in seconds but want to check full-scale
+expectations.
+
+Users are stratified by level and role and projects by department. Each
+stratum gets its share of --fraction (largest remainders, so the sample has
+round(fraction * population) units), and within a stratum the units with the
+lowest seeded sort keys are taken, so the same seed always picks the same
+sample. Every department's management directory is included as it is.
+
+Each sampled unit stands for the units of its stratum. Strata too small to
+be sampled are represented by the sampled users of the same level, or by the
+whole sample if that level has none, so the weights always add up to the
+population. The predicted totals (files, directories, bytes, bytes per
+department, email and download pack rats) are the weighted sums over the
+sampled units.
+
+Usage:
+    python sampling.py [options]
+
+Options:
+    --fraction F         Share of users and projects to sample (default: 0.02)
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to populate (default: all)
+    --predict-only       Plan the sample and print the prediction without creating anything
+    --report FILE        Write the sample and the predicted totals as JSON
+
+Example:
+    python sampling.py --fraction 0.02 --allocation sparse --report sample.json
+    python sampling.py --fraction 0.1 --predict-only --seed 42
+"""
+
+import json
+import math
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from checkpoint_journal import add_journal_arguments, journal_from_args
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import DIR, FILE, STAGE_ORDER, PlanEntry, get_username, load_company_data, execute_plan
+from populate_shards import get_root_entries, iter_work_units
+from seeds import derive_seed, get_company_seed, add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+
+DEFAULT_FRACTION = 0.02
+
+def allocate(strata: Dict[object, List[str]], fraction: float) -> Dict[object, int]:
+    """Split round(fraction * population) sample slots over strata by largest remainder"""
+    population = sum(len(members) for members in strata.values())
+    total = min(population, max(1, round(fraction * population))) if population else 0
+    quotas = {key: fraction * len(members) for key, members in strata.items()}
+    counts = {key: min(len(strata[key]), math.floor(quota)) for key, quota in quotas.items()}
+    remainders = sorted((key for key in strata if counts[key] < len(strata[key])),
+                        key=lambda key: (-(quotas[key] - counts[key]), -len(strata[key]), str(key)))
+    for key in remainders[:max(0, total - sum(counts.values()))]:
+        counts[key] += 1
+    return counts
+
+class Sample:
+    """Sampled work units with the weight each one carries in the prediction"""
+
+    def __init__(self):
+        self.weights: Dict[str, float] = {}
+        self.departments: Dict[str, str] = {}
+        self.population: Dict[str, int] = defaultdict(int)
+        self.sampled: Dict[str, int] = defaultdict(int)
+
+    def add_strata(self, kind: str, strata: Dict[object, List[Tuple[str, str]]], fraction: float,
+                   fallback=None) -> None:
+        """Sample units of one kind from strata of (unit name, department) pairs
+
+        fallback maps a stratum to a coarser group whose sampled units stand
+        in for it when it has no sampled units of its own.
+        """
+        seed = get_company_seed()
+        counts = allocate(strata, fraction)
+        chosen = {}
+        for key, members in strata.items():
+            ranked = sorted(members, key=lambda member: derive_seed(seed, 'sample', member[0]))
+            chosen[key] = ranked[:counts[key]]
+            self.population[kind] += len(members)
+            self.sampled[kind] += counts[key]
+            for name, department in chosen[key]:
+                self.weights[name] = len(members) / counts[key]
+                self.departments[name] = department
+
+        # Strata without a sampled unit are spread over the nearest sampled units
+        everyone = [name for members in chosen.values() for name, _ in members]
+        for key, members in strata.items():
+            if chosen[key] or not everyone:
+                continue
+            group = fallback(key) if fallback else None
+            stand_ins = [name for other, picked in chosen.items() if group is not None and fallback(other) == group
+                         for name, _ in picked] or everyone
+            for name in stand_ins:
+                self.weights[name] += len(members) / len(stand_ins)
+
+def sample_company(company_data: Dict, fraction: float = DEFAULT_FRACTION,
+                   stages: Iterable[str] = STAGE_ORDER) -> Sample:
+    """Choose a stratified sample of users and projects, with every department's management files"""
+    stages = set(stages)
+    sample = Sample()
+    if stages - {'g_drive'}:
+        strata = defaultdict(list)
+        for user_data in company_data['users'].values():
+            strata[(user_data.get('level'), user_data.get('role'))].append(
+                (f"user:{get_username(user_data)}", user_data.get('department')))
+        sample.add_strata('users', strata, fraction, fallback=lambda key: key[0])
+    if 'g_drive' in stages:
+        strata = defaultdict(list)
+        for project in company_data['projects'].values():
+            strata[project.get('department')].append(
+                (f"project:{project.get('number', 'unknown')}", project.get('department')))
+        sample.add_strata('projects', strata, fraction)
+        for dept in {user.get('department', 'Other') for user in company_data['users'].values()}:
+            sample.weights[f"department:{dept}"] = 1.0
+            sample.departments[f"department:{dept}"] = dept
+    return sample
+
+class Prediction:
+    """Weighted totals of the sampled units, accumulated as their entries stream past"""
+
+    def __init__(self, sample: Sample):
+        self.sample = sample
+        self.sample_files = 0
+        self.sample_bytes = 0
+        self.files = 0.0
+        self.dirs = 0.0
+        self.bytes = 0.0
+        self.department_bytes: Dict[str, float] = defaultdict(float)
+        self.department_files: Dict[str, float] = defaultdict(float)
+        self.pack_rats: Dict[str, float] = defaultdict(float)
+
+    def tally(self, name: str, entries: Iterable[PlanEntry]) -> Iterator[PlanEntry]:
+        """Yield a unit's entries, adding them to the prediction"""
+        weight = self.sample.weights.get(name, 1.0)  # Shared entries such as the drive roots count once
+        department = self.sample.departments.get(name) or 'Other'
+        for entry in entries:
+            if entry.kind == FILE:
+                self.sample_files += 1
+                self.sample_bytes += entry.size
+                self.files += weight
+                self.bytes += weight * entry.size
+                self.department_files[department] += weight
+                self.department_bytes[department] += weight * entry.size
+            elif entry.kind == DIR:
+                self.dirs += weight
+            yield entry
+
+    def add_pack_rats(self, company_data: Dict, stages: Iterable[str]) -> None:
+        """Count the sampled users' pack-rat traits with their weights"""
+        # Imported here because the populate scripts import populate_plan
+        from seeds import user_rng
+        from U_populate_downloads import get_user_downloads
+        from U_populate_emails import get_mailbox_profile
+
+        for user_data in company_data['users'].values():
+            name = f"user:{get_username(user_data)}"
+            if name not in self.sample.weights:
+                continue
+            weight = self.sample.weights[name]
+            if 'emails' in stages and get_mailbox_profile(user_data)[2]:
+                self.pack_rats['email'] += weight
+            if 'downloads' in stages and get_user_downloads(
+                    user_data, user_rng(get_username(user_data), 'downloads'))[1]:
+                self.pack_rats['download'] += weight
+
+    def report(self) -> Dict:
+        """Return the sample and the predicted totals as a JSON-ready dict"""
+        return {
+            'sample': {kind: {'sampled': self.sample.sampled[kind], 'population': self.sample.population[kind]}
+                       for kind in self.sample.population},
+            'sample_files': self.sample_files,
+            'sample_bytes': self.sample_bytes,
+            'predicted': {
+                'files': round(self.files),
+                'dirs': round(self.dirs),
+                'bytes': round(self.bytes),
+                'departments': {dept: {'files': round(self.department_files[dept]),
+                                       'bytes': round(self.department_bytes[dept])}
+                                for dept in sorted(self.department_files)},
+                'pack_rats': {kind: round(count) for kind, count in sorted(self.pack_rats.items())},
+            },
+        }
+
+    def print_report(self) -> None:
+        """Print the sample and the predicted totals"""
+        for kind in self.sample.population:
+            print(f"Sampled {self.sample.sampled[kind]:,} of {self.sample.population[kind]:,} {kind}")
+        print(f"Sample: {self.sample_files:,} files ({self.sample_bytes / 1e9:,.1f}GB logical)")
+        print(f"\nPredicted full environment: {self.files:,.0f} files ({self.bytes / 1e9:,.1f}GB logical) "
+              f"and {self.dirs:,.0f} directories")
+        for dept in sorted(self.department_bytes, key=self.department_bytes.get, reverse=True):
+            print(f"  {dept:<20} {self.department_files[dept]:>10,.0f} files {self.department_bytes[dept] / 1e9:>10,.1f}GB")
+        for kind, count in sorted(self.pack_rats.items()):
+            print(f"  {kind.capitalize()} pack rats: {count:,.0f}")
+
+def plan_sample(company_data: Dict, sample: Sample, prediction: Prediction,
+                stages: Iterable[str] = STAGE_ORDER) -> Iterator[PlanEntry]:
+    """Plan the drive roots and the sampled units"""
+    yield from prediction.tally('roots', get_root_entries(stages))
+    for name, entries in iter_work_units(company_data, stages):
+        if name in sample.weights:
+            yield from prediction.tally(name, entries)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate a stratified sample and predict the full environment')
+    parser.add_argument('--fraction', type=float, default=DEFAULT_FRACTION,
+                        help=f'Share of users and projects to sample (default: {DEFAULT_FRACTION})')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to populate (default: all)')
+    parser.add_argument('--predict-only', action='store_true',
+                        help='Plan the sample and print the prediction without creating anything')
+    parser.add_argument('--report', metavar='FILE',
+                        help='Write the sample and the predicted totals as JSON')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_journal_arguments(parser, 'sampling')
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    company_data = load_company_data(args.data_file)
+
+    sample = sample_company(company_data, args.fraction, args.stages)
+    prediction = Prediction(sample)
+    entries = plan_sample(company_data, sample, prediction, args.stages)
+    if args.predict_only:
+        for _ in entries:
+            pass
+    else:
+        store = store_from_args(args, company_data)
+        stats = execute_plan(entries, factory=factory_from_args(args), executor=executor_from_args(args),
+                             journal=journal_from_args(args), store=store)
+        if store:
+            store.close()
+        print(f"Created {stats.summary()}\n")
+    prediction.add_pack_rats(company_data, args.stages)
+    prediction.print_report()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(prediction.report(), f, indent=2)
+        print(f"\nWrote report to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Seeds
+
+Hierarchical seeding for reproducible populate output. Every random decision
+is drawn from a local SeededRandom instead of the global `random` module:
+
+    company seed                    --seed, or DEFAULT_COMPANY_SEED
+      user:<name>:<stage>           user_rng(): structure of one user's stage
+      technologies:<name>           shared by every stage that needs it
+      project:<number>              unit_rng(): one G: project
+      department:<name>             unit_rng(): one G: management directory
+        <path>                      rng.child(path): one file's size or date
+
+Child seeds are derived by hashing the parent seed with a label (blake2b, not
+the per-process salted hash()), so a user's files are the same whichever
+order users are planned in, in whichever process, and whether or not other
+users are planned at all. That is what makes sharding (populate_shards),
+resuming (checkpoint_journal) and reconciling (reconcile) repeatable.
+
+Command line options (all populate scripts):
+
+    --seed N    Company seed (default: DEFAULT_COMPANY_SEED)
+"""
+
+import random
+import hashlib
+
+DEFAULT_COMPANY_SEED = 20240101
+
+_company_seed = DEFAULT_COMPANY_SEED
+
+def derive_seed(parent: int, *labels) -> int:
+    """Return the seed of a child identified by labels below a parent seed"""
+    key = '\0'.join([str(parent)] + [str(label) for label in labels])
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class SeededRandom(random.Random):
+    """Random number generator that remembers its seed and derives child generators"""
+
+    def __init__(self, seed_value: int):
+        super().__init__(seed_value)
+        self.seed_value = seed_value
+
+    def child(self, *labels) -> 'SeededRandom':
+        """Return an independent generator for a part of this one's output"""
+        return SeededRandom(derive_seed(self.seed_value, *labels))
+
+def set_company_seed(seed: int) -> None:
+    """Select the company seed every other seed is derived from"""
+    global _company_seed
+    _company_seed = seed
+
+def get_company_seed() -> int:
+    """Return the company seed, for deriving child seeds without building a generator"""
+    return _company_seed
+
+def company_rng() -> SeededRandom:
+    """Return a generator seeded with the company seed"""
+    return SeededRandom(_company_seed)
+
+def user_rng(username: str, stage: str) -> SeededRandom:
+    """Return the generator for one user's output in one stage"""
+    return company_rng().child('user', username, stage)
+
+def unit_rng(kind: str, name) -> SeededRandom:
+    """Return the generator for a non-user unit such as a project or department"""
+    return company_rng().child(kind, name)
+
+def add_seed_arguments(parser) -> None:
+    """Add the company seed option to a populate script's argument parser"""
+    parser.add_argument('--seed', type=int, default=DEFAULT_COMPANY_SEED,
+                        help=f'Company seed all generated names, sizes and dates derive from '
+                             f'(default: {DEFAULT_COMPANY_SEED})')
@@ -0,0 +1,339 @@
+"""
+State Store
+
+Indexed SQLite record of everything the simulation created: AD users and
+groups, and every directory and file with its logical, materialized and
+allocated size, modification time, owner and compression state. Cleanup and
+auditing query the store instead of walking the drives or AD.
+
+All populate scripts record into one store (default: simulation_state.db), as
+do AD_setup.py and AD_cleanup.py. Writes are buffered and applied in one
+transaction per BATCH_SIZE records, so recording costs a list append per
+entry. A clean or delete entry removes the recorded contents below its path,
+and the company's users are recorded with their departments so that entries
+can be grouped by department through their owner.
+
+Usage:
+    python state_store.py [options]
+
+Options:
+    --state-db FILE          Store to query (default: simulation_state.db)
+    --user NAME              List the files of a user (username as on U:)
+    --departments            Total files and bytes per department
+    --paths-to-remove        List the top-level paths of the selected users or departments
+    --department NAME        Select a department for --paths-to-remove (repeatable)
+    --remove                 Remove the listed paths from the drives and the store
+
+Example:
+    python state_store.py
+    python state_store.py --user kenta_kato
+    python state_store.py --paths-to-remove --department Sales --remove
+"""
+
+import time
+import sqlite3
+import argparse
+import threading
+from itertools import groupby
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from file_factory import get_allocated_bytes
+from populate_plan import CLEAN, DIR, FILE, RETIME, DELETE, get_username
+
+DEFAULT_STATE_DB = 'simulation_state.db'
+
+# Records buffered before they are written in one transaction
+BATCH_SIZE = 5000
+
+# One recorded file
+FileRecord = namedtuple('FileRecord', ['drive', 'path', 'size', 'materialized', 'allocated', 'mtime', 'compressed'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    drive TEXT NOT NULL,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    materialized INTEGER NOT NULL DEFAULT 0,
+    allocated INTEGER NOT NULL DEFAULT 0,
+    mtime REAL,
+    owner TEXT,
+    profile TEXT,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    PRIMARY KEY (drive, path)
+);
+CREATE INDEX IF NOT EXISTS entries_owner ON entries (owner, kind);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    department TEXT,
+    role TEXT,
+    ad_created REAL
+);
+CREATE INDEX IF NOT EXISTS users_department ON users (department);
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY,
+    ad_created REAL NOT NULL
+);
+"""
+
+_UPSERT_ENTRY = ("INSERT OR REPLACE INTO entries (drive, path, kind, size, materialized, allocated, mtime, owner, "
+                 "profile, compressed, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+# Entries found already in place keep their compression state and creation time
+_TOUCH_ENTRY = ("INSERT INTO entries (drive, path, kind, size, materialized, allocated, mtime, owner, profile, "
+                "compressed, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT (drive, path) DO UPDATE SET kind = excluded.kind, size = excluded.size, "
+                "materialized = excluded.materialized, allocated = excluded.allocated, mtime = excluded.mtime, "
+                "owner = excluded.owner, profile = excluded.profile")
+_COMPRESS_ENTRY = "UPDATE entries SET compressed = 1 WHERE drive = ? AND path = ?"
+_COMPRESS_BELOW = "UPDATE entries SET compressed = 1 WHERE drive = ? AND path > ? AND path < ?"
+_RETIME_ENTRY = "UPDATE entries SET mtime = ? WHERE drive = ? AND path = ?"
+# Paths below a directory sort between 'dir/' and 'dir0' ('0' follows '/')
+_DELETE_BELOW = "DELETE FROM entries WHERE drive = ? AND path > ? AND path < ?"
+_DELETE_ENTRY = "DELETE FROM entries WHERE drive = ? AND path = ?"
+_UPSERT_USER = ("INSERT INTO users (username, name, department, role) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET name = excluded.name, department = excluded.department, "
+                "role = excluded.role")
+
+class StateStore:
+    """Batched, thread-safe writer and query interface of the state store"""
+
+    def __init__(self, path=DEFAULT_STATE_DB, batch_size: int = BATCH_SIZE):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self._pending: List[Tuple[str, tuple]] = []
+        self._lock = threading.Lock()
+        # Shared by executor threads; every use holds the lock
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Runs of the same statement in one executemany, keeping their order
+            for sql, group in groupby(self._pending, key=lambda item: item[0]):
+                self.db.executemany(sql, [params for _, params in group])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self._pending = []
+
+    def flush(self) -> None:
+        """Write all buffered records"""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        """Flush and close the store"""
+        with self._lock:
+            self._flush()
+            self.db.close()
+
+    def record(self, entry, factory=None, compressed: Optional[bool] = False) -> None:
+        """Record a completed plan entry
+
+        compressed is whether compact has run on it; None keeps what is
+        recorded, for entries that were found already in place.
+        """
+        if entry.kind == CLEAN:
+            self._write(_DELETE_BELOW, (entry.drive, entry.path + '/', entry.path + '0'))
+        elif entry.kind == DELETE:
+            self._write(_DELETE_ENTRY, (entry.drive, entry.path))
+            self._write(_DELETE_BELOW, (entry.drive, entry.path + '/', entry.path + '0'))
+        elif entry.kind == RETIME:
+            self._write(_RETIME_ENTRY, (entry.mtime, entry.drive, entry.path))
+        else:
+            materialized = allocated = 0
+            if entry.kind == FILE:
+                materialized = factory.materialized_size(entry.size) if factory else entry.size
+                allocated = get_allocated_bytes(entry.path, materialized, factory.allocation,
+                                                factory.allocation_ratios) if factory else materialized
+            if compressed is None:
+                self._write(_TOUCH_ENTRY, (entry.drive, entry.path, entry.kind, entry.size, materialized, allocated,
+                                           entry.mtime, entry.owner, entry.profile, time.time()))
+            else:
+                self._write(_UPSERT_ENTRY, (entry.drive, entry.path, entry.kind, entry.size, materialized,
+                                            allocated, entry.mtime, entry.owner, entry.profile, int(compressed),
+                                            time.time()))
+
+    def record_compressed(self, drive: str, path: str, recursive: bool = False) -> None:
+        """Record that compact has run on an entry, and with recursive on everything below it"""
+        self._write(_COMPRESS_ENTRY, (drive, path))
+        if recursive:
+            self._write(_COMPRESS_BELOW, (drive, path + '/', path + '0'))
+
+    def record_company(self, company_data: Dict) -> None:
+        """Record the company's users and departments"""
+        for user_data in company_data['users'].values():
+            self._write(_UPSERT_USER, (get_username(user_data), user_data['name'],
+                                       user_data.get('department'), user_data.get('role')))
+
+    def record_ad_user(self, user_data: Dict) -> None:
+        """Record a user created in AD"""
+        username = get_username(user_data)
+        self._write(_UPSERT_USER, (username, user_data['name'], user_data.get('department'), user_data.get('role')))
+        self._write("UPDATE users SET ad_created = ? WHERE username = ?", (time.time(), username))
+
+    def record_ad_group(self, name: str) -> None:
+        """Record a group created in AD"""
+        self._write("INSERT OR REPLACE INTO groups (name, ad_created) VALUES (?, ?)", (name, time.time()))
+
+    def remove_ad_user(self, username: str) -> None:
+        """Record that a user was deleted from AD"""
+        self._write("UPDATE users SET ad_created = NULL WHERE username = ?", (username,))
+
+    def remove_ad_group(self, name: str) -> None:
+        """Record that a group was deleted from AD"""
+        self._write("DELETE FROM groups WHERE name = ?", (name,))
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            self._flush()
+            return self.db.execute(sql, params).fetchall()
+
+    def files_of_user(self, username: str) -> List[FileRecord]:
+        """Return every recorded file a user owns"""
+        return [FileRecord(*row) for row in self._query(
+            "SELECT drive, path, size, materialized, allocated, mtime, compressed FROM entries "
+            "WHERE owner = ? AND kind = ? ORDER BY drive, path", (username, FILE))]
+
+    def bytes_by_department(self) -> List[Tuple[str, int, int, int]]:
+        """Return (department, files, logical bytes, allocated bytes) of user-owned files, largest first"""
+        return self._query(
+            "SELECT u.department, COUNT(*), SUM(e.size), SUM(e.allocated) FROM entries e "
+            "JOIN users u ON e.owner = u.username WHERE e.kind = ? "
+            "GROUP BY u.department ORDER BY SUM(e.size) DESC", (FILE,))
+
+    def paths_to_remove(self, usernames: Iterable[str] = (), departments: Iterable[str] = ()) -> List[Tuple[str, str]]:
+        """Return the top-most recorded (drive, path) entries owned by the given users or departments"""
+        owners = set(usernames)
+        departments = list(departments)
+        if departments:
+            marks = ', '.join('?' * len(departments))
+            owners.update(row[0] for row in self._query(
+                f"SELECT username FROM users WHERE department IN ({marks})", tuple(departments)))
+        if not owners:
+            return []
+        marks = ', '.join('?' * len(owners))
+        rows = self._query(f"SELECT drive, path, kind FROM entries WHERE owner IN ({marks}) "
+                           f"ORDER BY drive, path", tuple(owners))
+        kept = set()
+        paths = []
+        for drive, path, kind in rows:
+            parent = path.rpartition('/')[0]
+            while parent and (drive, parent) not in kept:
+                parent = parent.rpartition('/')[0]
+            if parent:
+                continue  # Inside a directory that is already listed
+            if kind == DIR:
+                kept.add((drive, path))
+            paths.append((drive, path))
+        return paths
+
+    def forget(self, drive: str, path: str) -> None:
+        """Remove a path and everything below it from the store"""
+        self._write(_DELETE_ENTRY, (drive, path))
+        self._write(_DELETE_BELOW, (drive, path + '/', path + '0'))
+
+    def totals(self) -> Dict[str, int]:
+        """Return counts of everything recorded"""
+        (users, ad_users), = self._query("SELECT COUNT(*), COUNT(ad_created) FROM users")
+        (groups,), = self._query("SELECT COUNT(*) FROM groups")
+        totals = {'users': users, 'ad_users': ad_users, 'groups': groups, 'dirs': 0, 'files': 0,
+                  'bytes': 0, 'allocated': 0, 'compressed': 0}
+        for kind, count, size, allocated, compressed in self._query(
+                "SELECT kind, COUNT(*), SUM(size), SUM(allocated), SUM(compressed) FROM entries GROUP BY kind"):
+            if kind == DIR:
+                totals['dirs'] = count
+            elif kind == FILE:
+                totals.update(files=count, bytes=size, allocated=allocated, compressed=compressed)
+        return totals
+
+def add_store_arguments(parser) -> None:
+    """Add the state store options to a script's argument parser"""
+    parser.add_argument('--state-db', default=DEFAULT_STATE_DB, metavar='FILE',
+                        help=f'SQLite record of everything created (default: {DEFAULT_STATE_DB})')
+    parser.add_argument('--no-state-db', action='store_true',
+                        help='Do not record what is created')
+
+def store_from_args(args, company_data: Optional[Dict] = None) -> Optional[StateStore]:
+    """Open the store selected on the command line, or None, recording the company's users"""
+    if args.no_state_db:
+        return None
+    store = StateStore(args.state_db)
+    if company_data:
+        store.record_company(company_data)
+    return store
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Query the record of everything the simulation created')
+    parser.add_argument('--state-db', default=DEFAULT_STATE_DB, metavar='FILE',
+                        help=f'Store to query (default: {DEFAULT_STATE_DB})')
+    parser.add_argument('--user', action='append', default=[], metavar='NAME',
+                        help='List the files of a user, or select the user for --paths-to-remove')
+    parser.add_argument('--departments', action='store_true',
+                        help='Total files and bytes per department')
+    parser.add_argument('--paths-to-remove', action='store_true',
+                        help='List the top-level paths of the selected users or departments')
+    parser.add_argument('--department', action='append', default=[], metavar='NAME',
+                        help='Select a department for --paths-to-remove')
+    parser.add_argument('--remove', action='store_true',
+                        help='Remove the listed paths from the drives and the store')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    store = StateStore(args.state_db)
+    started = time.monotonic()
+    try:
+        if args.paths_to_remove:
+            paths = store.paths_to_remove(args.user, args.department)
+            roots = None
+            if args.remove:
+                # Imported here because only removal needs the drives
+                from populate_plan import get_drive_roots
+                from teardown import remove_tree
+                roots = get_drive_roots()
+            for drive, path in paths:
+                print(f"{drive}:/{path}")
+                if roots:
+                    target = roots[drive] / path
+                    if target.is_dir():
+                        remove_tree(target, keep_root=False)
+                    elif target.exists():
+                        target.unlink()
+                    store.forget(drive, path)
+            print(f"{len(paths):,} paths {'removed' if args.remove else 'to remove'}")
+        elif args.user:
+            for username in args.user:
+                files = store.files_of_user(username)
+                for record in files:
+                    print(f"{record.drive}:/{record.path}  {record.size / 1e6:,.1f}MB")
+                print(f"{username}: {len(files):,} files, {sum(r.size for r in files) / 1e9:,.2f}GB")
+        elif args.departments:
+            for department, files, size, allocated in store.bytes_by_department():
+                print(f"{department or '(none)':<24} {files:>9,} files {size / 1e9:>10,.2f}GB "
+                      f"({allocated / 1e9:,.2f}GB allocated)")
+        else:
+            totals = store.totals()
+            print(f"{totals['users']:,} users ({totals['ad_users']:,} in AD), {totals['groups']:,} groups")
+            print(f"{totals['dirs']:,} directories, {totals['files']:,} files ({totals['compressed']:,} compressed)")
+            print(f"{totals['bytes'] / 1e9:,.2f}GB logical, {totals['allocated'] / 1e9:,.2f}GB allocated")
+        print(f"\nQuery took {(time.monotonic() - started) * 1000:.1f}ms")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Subset Selectors
+
+Shared --users, --departments, --projects and --roles options that restrict a
+script to part of the company, so fixing one user's tree or one project's
+permissions does not reprocess everything.
+
+    --users NAME ...          Users by username (first_last) or full name
+    --departments NAME ...    Users, projects and G: directories of departments
+    --projects NUMBER ...     Projects by number
+    --roles ROLE ...          Users by role
+
+Names are matched case-insensitively. User options combine: --departments IT
+--roles Developer selects IT's developers. --departments also selects the
+department's projects and its G: department and management directories.
+Users are only selected by the user options and projects only by --projects
+and --departments, so --users alone leaves G: alone and --projects alone
+leaves U: alone. Without any option everything is selected.
+
+Selections are resolved through an index of the company data built once per
+run (users by username, name, department and role; projects by number and
+department), so the work of a script scales with the size of the subset. The
+company data itself is not filtered: scripts still look up managers, project
+details and whole departments in it.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from populate_plan import get_username
+
+class CompanyIndex:
+    """Lookups from names to user and project ids, in company data order"""
+
+    def __init__(self, company_data: Dict):
+        self.position = {}
+        self.users_by_name = defaultdict(list)
+        self.users_by_department = defaultdict(list)
+        self.users_by_role = defaultdict(list)
+        self.projects_by_number = defaultdict(list)
+        self.projects_by_department = defaultdict(list)
+        for position, (user_id, user_data) in enumerate(company_data['users'].items()):
+            self.position[user_id] = position
+            self.users_by_name[get_username(user_data).lower()].append(user_id)
+            self.users_by_name[user_data['name'].lower()].append(user_id)
+            self.users_by_department[(user_data.get('department') or '').lower()].append(user_id)
+            self.users_by_role[(user_data.get('role') or '').lower()].append(user_id)
+        for position, (project_id, project) in enumerate(company_data.get('projects', {}).items()):
+            self.position[project_id] = position
+            self.projects_by_number[str(project.get('number', '')).lower()].append(project_id)
+            self.projects_by_department[(project.get('department') or '').lower()].append(project_id)
+
+def _lookup(table: Dict[str, List[str]], names: Iterable[str], kind: str) -> Set[str]:
+    """Return the ids matching any of the names, warning about names that match nothing"""
+    ids = set()
+    for name in names:
+        matches = table.get(name.lower())
+        if matches:
+            ids.update(matches)
+        else:
+            print(f"Warning: no {kind} matches '{name}'")
+    return ids
+
+class Selection:
+    """Users, departments, projects and roles chosen on the command line"""
+
+    def __init__(self, users: Iterable[str] = (), departments: Iterable[str] = (),
+                 projects: Iterable[str] = (), roles: Iterable[str] = ()):
+        self.users = list(users or [])
+        self.departments = list(departments or [])
+        self.projects = list(projects or [])
+        self.roles = list(roles or [])
+        self._index = None
+        self._indexed_data = None
+
+    def __bool__(self) -> bool:
+        return bool(self.users or self.departments or self.projects or self.roles)
+
+    def describe(self) -> str:
+        parts = []
+        for label, values in (('users', self.users), ('departments', self.departments),
+                              ('projects', self.projects), ('roles', self.roles)):
+            if values:
+                parts.append(f"{label} {', '.join(values)}")
+        return '; '.join(parts) or 'everything'
+
+    def index(self, company_data: Dict) -> CompanyIndex:
+        """Return the index of the company data, building it on first use"""
+        if self._indexed_data is not company_data:
+            self._index = CompanyIndex(company_data)
+            self._indexed_data = company_data
+        return self._index
+
+    def user_ids(self, company_data: Dict) -> List[str]:
+        """Return the ids of the selected users, in company data order"""
+        if not (self.users or self.departments or self.roles):
+            return [] if self.projects else list(company_data['users'])
+        index = self.index(company_data)
+        matches = []
+        if self.users:
+            matches.append(_lookup(index.users_by_name, self.users, 'user'))
+        if self.departments:
+            matches.append(_lookup(index.users_by_department, self.departments, 'department'))
+        if self.roles:
+            matches.append(_lookup(index.users_by_role, self.roles, 'role'))
+        ids = set.intersection(*sorted(matches, key=len))
+        return sorted(ids, key=index.position.get)
+
+    def project_ids(self, company_data: Dict) -> List[str]:
+        """Return the ids of the selected projects, in company data order"""
+        projects = company_data.get('projects', {})
+        if not self:
+            return list(projects)
+        if not (self.projects or self.departments):
+            return []
+        index = self.index(company_data)
+        matches = []
+        if self.projects:
+            matches.append(_lookup(index.projects_by_number, self.projects, 'project'))
+        if self.departments:
+            matches.append(set().union(*(index.projects_by_department.get(d.lower(), [])
+                                         for d in self.departments)))
+        ids = set.intersection(*sorted(matches, key=len))
+        return sorted(ids, key=index.position.get)
+
+    def department_names(self, company_data: Dict) -> Optional[Set[str]]:
+        """Return the selected departments as spelled in the data, or None for all"""
+        if not self:
+            return None
+        wanted = {department.lower() for department in self.departments}
+        users = company_data['users']
+        return {users[user_ids[0]]['department']
+                for name, user_ids in self.index(company_data).users_by_department.items() if name in wanted}
+
+def selected_users(company_data: Dict, selection: Optional[Selection] = None) -> Dict[str, Dict]:
+    """Return the selected users as a user id -> user data mapping"""
+    if not selection:
+        return company_data['users']
+    users = company_data['users']
+    return {user_id: users[user_id] for user_id in selection.user_ids(company_data)}
+
+def selected_projects(company_data: Dict, selection: Optional[Selection] = None) -> Dict[str, Dict]:
+    """Return the selected projects as a project id -> project mapping"""
+    projects = company_data.get('projects', {})
+    if not selection:
+        return projects
+    return {project_id: projects[project_id] for project_id in selection.project_ids(company_data)}
+
+def is_department_selected(company_data: Dict, department: str, selection: Optional[Selection] = None) -> bool:
+    """Return True if a department's shared directories and groups are selected"""
+    if not selection:
+        return True
+    return department in selection.department_names(company_data)
+
+def add_selector_arguments(parser) -> None:
+    """Add the subset options to a script's argument parser"""
+    group = parser.add_argument_group('subset selection')
+    group.add_argument('--users', nargs='+', metavar='NAME',
+                       help='Only these users (username or full name)')
+    group.add_argument('--departments', nargs='+', metavar='NAME',
+                       help="Only these departments' users, projects and shared directories")
+    group.add_argument('--projects', nargs='+', metavar='NUMBER',
+                       help='Only these projects')
+    group.add_argument('--roles', nargs='+', metavar='ROLE',
+                       help='Only users with these roles')
+
+def selection_from_args(args) -> Optional[Selection]:
+    """Return the selection made on the command line, or None for everything"""
+    selection = Selection(args.users, args.departments, args.projects, args.roles)
+    if not selection:
+        return None
+    print(f"Selected: {selection.describe()}")
+    return selection
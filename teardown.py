@@ -0,0 +1,234 @@
+"""
+Teardown Engine
+
+Fast removal of simulated directory trees. Replaces the recursive
+Path.iterdir()/is_file()/is_dir() clean_directory helper that each populate
+script used to carry, and provides a full-environment teardown command for the
+U: and G: roots.
+
+Directories are listed with os.scandir so the entry type comes from the cached
+d_type instead of an extra stat per entry. Subtrees are cleared in parallel on
+a thread pool: each task unlinks the files of one directory and hands its
+subdirectories back to the scheduler, and the emptied directories are removed
+deepest-first once every file is gone.
+
+Usage:
+    python teardown.py [options]
+
+Options:
+    --u-root PATH    U drive root (default: U:, falling back to U_Drive)
+    --g-root PATH    G drive root (default: G:, falling back to G_Drive)
+    --skip-u         Leave the U drive untouched
+    --skip-g         Leave the G drive untouched
+    --workers N      Number of deletion threads (default: 16)
+    --dry-run, -n    Count what would be removed without deleting anything
+
+Example:
+    python teardown.py --dry-run
+    python teardown.py --skip-g --workers 32
+"""
+
+import os
+import stat
+import time
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+DEFAULT_WORKERS = 16
+
+# Seconds between progress lines during a long teardown
+PROGRESS_INTERVAL = 5.0
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+class TeardownStats:
+    """Counters for a teardown run"""
+
+    def __init__(self):
+        self.files = 0
+        self.dirs = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, files: int = 0, dirs: int = 0, errors: int = 0) -> None:
+        with self._lock:
+            self.files += files
+            self.dirs += dirs
+            self.errors += errors
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def summary(self) -> str:
+        """Return a one-line throughput summary"""
+        elapsed = max(self.elapsed, 1e-6)
+        entries = self.files + self.dirs
+        return (f"{self.files:,} files and {self.dirs:,} directories in {elapsed:.1f}s "
+                f"({entries / elapsed:,.0f} entries/s, {self.errors} errors)")
+
+def _get_shared_pool(workers: int) -> ThreadPoolExecutor:
+    """Return the process-wide deletion pool, creating it on first use"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='teardown')
+        return _shared_pool
+
+def _remove_file(path: str) -> None:
+    """Unlink a file, clearing the read-only attribute if Windows refuses"""
+    try:
+        os.unlink(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE)
+        os.unlink(path)
+
+def _clear_files(path: str, stats: TeardownStats, dry_run: bool) -> List[str]:
+    """Unlink every non-directory entry of a directory, returning its subdirectories"""
+    subdirs = []
+    files = 0
+    errors = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    # d_type is cached by scandir, so this costs no extra syscall
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not dry_run:
+                        _remove_file(entry.path)
+                    files += 1
+                except OSError as e:
+                    print(f"Warning: Could not remove {entry.path}: {e}")
+                    errors += 1
+    except OSError as e:
+        print(f"Warning: Could not list {path}: {e}")
+        errors += 1
+    stats.add(files=files, errors=errors)
+    return subdirs
+
+def remove_tree(path, keep_root: bool = True, workers: Optional[int] = None,
+                dry_run: bool = False, progress: bool = False,
+                stats: Optional[TeardownStats] = None) -> TeardownStats:
+    """Remove everything below path (and path itself unless keep_root)
+
+    Without an explicit worker count the process-wide pool is reused, which
+    keeps the many small per-user cleanups of the populate scripts cheap.
+    """
+    stats = stats or TeardownStats()
+    root = os.fspath(path)
+    if not os.path.isdir(root):
+        return stats
+
+    if workers is None:
+        return _remove_tree(_get_shared_pool(DEFAULT_WORKERS), root, keep_root, dry_run, progress, stats)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='teardown') as pool:
+        return _remove_tree(pool, root, keep_root, dry_run, progress, stats)
+
+def _remove_tree(pool, root: str, keep_root: bool, dry_run: bool, progress: bool,
+                 stats: TeardownStats) -> TeardownStats:
+    """Two-phase parallel removal of a directory tree on the given pool"""
+    directories = [(0, root)]
+    pending = {pool.submit(_clear_files, root, stats, dry_run): 0}
+    last_report = time.monotonic()
+
+    # Phase 1: unlink files, fanning subdirectories out across the pool
+    while pending:
+        done, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+        for future in done:
+            depth = pending.pop(future) + 1
+            for subdir in future.result():
+                directories.append((depth, subdir))
+                pending[pool.submit(_clear_files, subdir, stats, dry_run)] = depth
+        if progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            print(f"  ... {stats.summary()}")
+            last_report = time.monotonic()
+
+    # Phase 2: remove the now-empty directories, deepest level first
+    if not keep_root or len(directories) > 1:
+        by_depth = {}
+        for depth, directory in directories:
+            if depth > 0 or not keep_root:
+                by_depth.setdefault(depth, []).append(directory)
+        for depth in sorted(by_depth, reverse=True):
+            level = by_depth[depth]
+            if dry_run:
+                stats.add(dirs=len(level))
+                continue
+            for removed in pool.map(_remove_directory, level):
+                stats.add(dirs=int(removed), errors=int(not removed))
+
+    return stats
+
+def _remove_directory(path: str) -> bool:
+    """Remove an empty directory, returning False on failure"""
+    try:
+        os.rmdir(path)
+        return True
+    except OSError as e:
+        print(f"Warning: Could not remove directory {path}: {e}")
+        return False
+
+def clean_directory(path):
+    """Remove all files and subdirectories in the given path"""
+    if path.exists():
+        print(f"Cleaning directory: {path}")
+        remove_tree(path, keep_root=True)
+
+def resolve_root(path: Optional[str], drive: str, fallback: str) -> Path:
+    """Pick the simulated drive root the populate scripts would have used"""
+    if path:
+        return Path(path)
+    root = Path(drive)
+    return root if root.exists() else Path(fallback)
+
+def teardown_environment(roots: List[Path], workers: int = DEFAULT_WORKERS,
+                         dry_run: bool = False) -> TeardownStats:
+    """Empty every given drive root, reporting progress and throughput"""
+    total = TeardownStats()
+    for root in roots:
+        if not root.exists():
+            print(f"Skipping {root}: not found")
+            continue
+        print(f"\n{'Counting' if dry_run else 'Removing'} contents of {root} with {workers} workers...")
+        stats = remove_tree(root, keep_root=True, workers=workers, dry_run=dry_run, progress=True)
+        print(f"{root}: {'would remove' if dry_run else 'removed'} {stats.summary()}")
+        total.add(files=stats.files, dirs=stats.dirs, errors=stats.errors)
+    return total
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Tear down the simulated U: and G: drive environments')
+    parser.add_argument('--u-root', help='U drive root (default: U:, falling back to U_Drive)')
+    parser.add_argument('--g-root', help='G drive root (default: G:, falling back to G_Drive)')
+    parser.add_argument('--skip-u', action='store_true', help='Leave the U drive untouched')
+    parser.add_argument('--skip-g', action='store_true', help='Leave the G drive untouched')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of deletion threads (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--dry-run', '-n', action='store_true',
+                        help='Count what would be removed without deleting anything')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    roots = []
+    if not args.skip_u:
+        roots.append(resolve_root(args.u_root, 'U:', 'U_Drive'))
+    if not args.skip_g:
+        roots.append(resolve_root(args.g_root, 'G:', 'G_Drive'))
+
+    if args.dry_run:
+        print("\nDRY RUN - No changes will be made")
+
+    total = teardown_environment(roots, args.workers, args.dry_run)
+    print(f"\nTeardown {'simulation' if args.dry_run else 'operation'} complete: {total.summary()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Watch Mode
+
+Keeps a live environment in sync with company_data.json as it is edited or
+regenerated. Instead of a full rebuild after every change, the file is
+compared with the version that was last applied and only the affected AD
+objects, G: project folders and U: home trees are updated.
+
+The last applied version is kept next to the data file (--applied, default
+company_data.applied.json for company_data.json). Without it, the current
+file is taken as what the environment was built from. Changes are detected
+by polling the file's size and modification time; a change is applied once
+the file has stopped changing for --settle seconds and parses as JSON, so
+half-written saves are skipped.
+
+The delta covers added, removed and changed users and projects, with the
+changed fields listed (assignments and technologies as added and removed
+items). It maps onto work units as named in populate_shards:
+
+    user added or changed          user:<name> rebuilt; AD user created or re-created
+    user removed or renamed        old U: tree removed; AD user deleted
+    project added or changed       project:<number> rebuilt; group created; folder permissions set
+    project removed or renumbered  old G: folder removed; group deleted
+    project renamed, retooled      the U: trees of its members rebuilt
+      or removed
+    any user change                department:<name> rebuilt for its old and new departments
+
+Rebuilt trees are removed and recreated from the plan, or, with --reconcile,
+only changed where they differ. An AD user is only re-created when a field
+that decides its groups or description changed. Without pywin32 (or with
+--skip-ad) the AD and permission steps are skipped with a warning.
+
+Usage:
+    python watch_mode.py [options]
+
+Options:
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --applied FILE       Last applied version (default: <data file name>.applied.json)
+    --stages STAGE ...   Stages to keep in sync (default: all)
+    --interval SECONDS   Polling interval (default: 1.0)
+    --settle SECONDS     Quiet time before a change is applied (default: 0.5)
+    --once               Apply the pending change, if any, and exit
+    --dry-run, -n        Print the delta and the affected units without changing anything
+    --skip-ad            Leave AD users, groups and G: permissions alone
+    --ad-dry-run         Print the AD and permission changes without making them
+
+Example:
+    python watch_mode.py --allocation sparse --reconcile
+    python watch_mode.py --once --dry-run
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import add_file_factory_arguments, factory_from_args
+from populate_daemon import get_top_dirs, remove_trees
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_shards import iter_work_units
+from populate_plan import STAGE_ORDER, get_username, get_drive_roots, execute_plan
+from reconcile import add_reconcile_arguments
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+from subset_selectors import Selection
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_SETTLE = 0.5
+
+# User fields that decide AD group memberships or the account's description
+AD_USER_FIELDS = {'name', 'true_name', 'role', 'department', 'level', 'current_technologies', 'assigned_projects'}
+
+# Project fields that the project folders in its members' U: trees are planned from
+U_PROJECT_FIELDS = {'number', 'name', 'likely_technologies'}
+
+def diff_values(old, new) -> str:
+    """Describe how one field changed"""
+    if isinstance(old, list) and isinstance(new, list):
+        added = [str(item) for item in new if item not in old]
+        removed = [str(item) for item in old if item not in new]
+        return ' '.join([f"+{item}" for item in added] + [f"-{item}" for item in removed]) or 'reordered'
+    return f"{old!r} -> {new!r}"
+
+def diff_records(old: Dict[str, Dict], new: Dict[str, Dict]) -> Tuple[List[str], List[str], Dict[str, Dict[str, str]]]:
+    """Return the added ids, removed ids and per-field changes of two id -> record mappings"""
+    added = [record_id for record_id in new if record_id not in old]
+    removed = [record_id for record_id in old if record_id not in new]
+    changed = {}
+    for record_id, record in new.items():
+        previous = old.get(record_id)
+        if previous is None or previous == record:
+            continue
+        changed[record_id] = {field: diff_values(previous.get(field), record.get(field))
+                              for field in sorted(set(previous) | set(record))
+                              if previous.get(field) != record.get(field)}
+    return added, removed, changed
+
+class CompanyDelta:
+    """Users and projects added, removed and changed between two versions of the company data"""
+
+    def __init__(self, old: Dict, new: Dict):
+        self.old = old
+        self.new = new
+        self.users_added, self.users_removed, self.users_changed = diff_records(
+            old['users'], new['users'])
+        self.projects_added, self.projects_removed, self.projects_changed = diff_records(
+            old.get('projects', {}), new.get('projects', {}))
+
+    def __bool__(self) -> bool:
+        return bool(self.users_added or self.users_removed or self.users_changed
+                    or self.projects_added or self.projects_removed or self.projects_changed)
+
+    def describe(self) -> List[str]:
+        """Return one line per added, removed or changed user and project"""
+        lines = []
+        for kind, data, added, removed, changed, label in (
+                ('user', 'users', self.users_added, self.users_removed, self.users_changed, get_username),
+                ('project', 'projects', self.projects_added, self.projects_removed, self.projects_changed,
+                 lambda project: project.get('number', 'unknown'))):
+            lines.extend(f"  + {kind} {label(self.new[data][record_id])}" for record_id in added)
+            lines.extend(f"  - {kind} {label(self.old[data][record_id])}" for record_id in removed)
+            for record_id, fields in changed.items():
+                lines.append(f"  ~ {kind} {label(self.new[data][record_id])}: "
+                             + '; '.join(f"{field} {change}" for field, change in fields.items()))
+        return lines
+
+    def renamed_users(self) -> List[str]:
+        """Return the ids of changed users whose username changed"""
+        return [user_id for user_id in self.users_changed
+                if get_username(self.old['users'][user_id]) != get_username(self.new['users'][user_id])]
+
+    def renumbered_projects(self) -> List[str]:
+        """Return the ids of changed projects whose number changed"""
+        return [project_id for project_id, fields in self.projects_changed.items() if 'number' in fields]
+
+def get_affected_units(delta: CompanyDelta, stages: Iterable[str] = STAGE_ORDER) -> Tuple[List[str], List[str]]:
+    """Return the work units to remove (named in the old data) and to rebuild (named in the new data)"""
+    stages = set(stages)
+    old_users, new_users = delta.old['users'], delta.new['users']
+    old_projects, new_projects = delta.old.get('projects', {}), delta.new.get('projects', {})
+    remove = []
+    rebuild = []
+
+    if stages - {'g_drive'}:
+        gone = delta.users_removed + delta.renamed_users()
+        remove.extend(f"user:{get_username(old_users[user_id])}" for user_id in gone)
+        users = set(delta.users_added) | set(delta.users_changed)
+        for project_id, fields in delta.projects_changed.items():
+            if U_PROJECT_FIELDS & set(fields):
+                users.update(user_id for user_id, user_data in new_users.items()
+                             if project_id in user_data.get('assigned_projects', []))
+        for project_id in delta.projects_removed:
+            # Members still listing a removed project lose its folder
+            users.update(user_id for user_id, user_data in old_users.items()
+                         if project_id in user_data.get('assigned_projects', []) and user_id in new_users)
+        rebuild.extend(f"user:{get_username(user_data)}" for user_id, user_data in new_users.items()
+                       if user_id in users)
+
+    if 'g_drive' in stages:
+        gone = delta.projects_removed + delta.renumbered_projects()
+        remove.extend(f"project:{old_projects[project_id].get('number', 'unknown')}" for project_id in gone)
+        projects = set(delta.projects_added) | set(delta.projects_changed)
+        rebuild.extend(f"project:{project.get('number', 'unknown')}" for project_id, project in new_projects.items()
+                       if project_id in projects)
+
+        departments = set()
+        for user_id in delta.users_added + delta.users_removed + list(delta.users_changed):
+            for users in (old_users, new_users):
+                if user_id in users:
+                    departments.add(users[user_id].get('department', 'Other'))
+        new_departments = {user.get('department', 'Other') for user in new_users.values()}
+        old_departments = {user.get('department', 'Other') for user in old_users.values()}
+        remove.extend(f"department:{dept}" for dept in sorted(departments & old_departments - new_departments))
+        rebuild.extend(f"department:{dept}" for dept in sorted(departments & new_departments))
+    return remove, rebuild
+
+def plan_units(company_data: Dict, stages: Iterable[str], names: Iterable[str]) -> Iterator[Tuple[str, List]]:
+    """Plan the named work units in one pass over the company"""
+    wanted = set(names)
+    for name, entries in iter_work_units(company_data, stages):
+        if name in wanted:
+            yield name, list(entries)
+
+class WatchContext:
+    """Drives, factory, executor and store kept open between applied changes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.stages = [stage for stage in STAGE_ORDER if stage in args.stages]
+        self.roots = get_drive_roots()
+        self.factory = factory_from_args(args)
+        self.executor = executor_from_args(args)
+        self.store = store_from_args(args)
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.close()
+        if self.store:
+            self.store.close()
+
+def apply_ad(delta: CompanyDelta, context: WatchContext) -> None:
+    """Delete, create and re-create the AD users and groups the delta touches"""
+    try:
+        # Imported here because AD needs pywin32, which the drive updates do not
+        from AD_cleanup import cleanup_ad
+        from AD_setup import setup_ad
+    except ImportError as e:
+        print(f"Warning: AD changes skipped: {e}")
+        return
+    old, new = delta.old, delta.new
+    dry_run = context.args.ad_dry_run
+    store = context.store
+    recreated = [user_id for user_id, fields in delta.users_changed.items() if AD_USER_FIELDS & set(fields)]
+
+    deleted_users = [get_username(old['users'][user_id]) for user_id in delta.users_removed + recreated]
+    if deleted_users:
+        cleanup_ad(old, dry_run=dry_run, users_only=True, store=store, selection=Selection(users=deleted_users))
+    deleted_projects = [old['projects'][project_id].get('number', 'unknown')
+                        for project_id in delta.projects_removed + delta.renumbered_projects()]
+    if deleted_projects:
+        cleanup_ad(old, dry_run=dry_run, groups_only=True, store=store, selection=Selection(projects=deleted_projects))
+
+    new_projects = [new['projects'][project_id].get('number', 'unknown')
+                    for project_id in delta.projects_added + delta.renumbered_projects()]
+    if new_projects:
+        setup_ad(new, dry_run=dry_run, skip_users=True, store=store, selection=Selection(projects=new_projects))
+    new_users = [get_username(new['users'][user_id]) for user_id in delta.users_added + recreated]
+    if new_users:
+        setup_ad(new, dry_run=dry_run, store=store, selection=Selection(users=new_users))
+
+def apply_permissions(delta: CompanyDelta, context: WatchContext) -> None:
+    """Set the G: folder permissions of added and changed projects"""
+    projects = [delta.new['projects'][project_id].get('number', 'unknown')
+                for project_id in delta.projects_added + list(delta.projects_changed)]
+    if not projects:
+        return
+    try:
+        from G_drive_setup import setup_g_drive
+    except ImportError as e:
+        print(f"Warning: G: permissions skipped: {e}")
+        return
+    setup_g_drive(delta.new, str(context.roots['G']), context.args.ad_dry_run,
+                  skip_departments=True, selection=Selection(projects=projects), store=context.store)
+
+def apply_delta(delta: CompanyDelta, context: WatchContext) -> None:
+    """Bring AD and the drives from the old version of the company to the new one"""
+    remove, rebuild = get_affected_units(delta, context.stages)
+    print(f"Units: {len(remove):,} to remove, {len(rebuild):,} to rebuild")
+    if context.args.dry_run:
+        for name in remove:
+            print(f"  remove  {name}")
+        for name in rebuild:
+            print(f"  rebuild {name}")
+        return
+
+    ad = not context.args.skip_ad
+    if ad:
+        apply_ad(delta, context)
+
+    started = time.monotonic()
+    reconcile = context.args.reconcile
+    removed = 0
+    for _, unit_entries in plan_units(delta.old, context.stages, remove):
+        removed += remove_trees(get_top_dirs(unit_entries), context.roots, context.store)
+    entries = []
+    for _, unit_entries in plan_units(delta.new, context.stages, rebuild):
+        if not reconcile:
+            removed += remove_trees(get_top_dirs(unit_entries), context.roots, context.store)
+        entries.extend(unit_entries)
+    stats = execute_plan(entries, context.roots, context.factory, executor=context.executor,
+                         reconcile=reconcile, store=context.store)
+    print(f"Removed {removed:,} trees, created {stats.summary()} in {time.monotonic() - started:.1f}s")
+
+    if ad and 'g_drive' in context.stages:
+        apply_permissions(delta, context)
+
+def read_data_file(path: str) -> Optional[Tuple[str, Dict]]:
+    """Return the text and parsed data of a data file, or None while it is missing or half-written"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        return text, json.loads(text)
+    except (OSError, ValueError):
+        return None
+
+def get_signature(path: str) -> Optional[Tuple[int, int]]:
+    """Return the (mtime, size) of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def wait_for_change(path: str, signature, interval: float = DEFAULT_INTERVAL,
+                    settle: float = DEFAULT_SETTLE) -> Tuple[int, int]:
+    """Block until the file's signature changes and then stays the same for settle seconds"""
+    while True:
+        time.sleep(interval)
+        current = get_signature(path)
+        if current is None or current == signature:
+            continue
+        while True:
+            time.sleep(settle)
+            latest = get_signature(path)
+            if latest == current:
+                return current
+            current = latest
+
+def save_applied(path: str, text: str) -> None:
+    """Record the text of the version that was applied, replacing the file atomically"""
+    temp = f"{path}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp, path)
+
+def apply_pending(data_file: str, applied_file: str, context: WatchContext) -> bool:
+    """Apply the difference between the data file and the last applied version, returning True if done"""
+    current = read_data_file(data_file)
+    if current is None:
+        print(f"Warning: {data_file} is missing or not valid JSON; waiting for the next change")
+        return False
+    text, new = current
+    applied = read_data_file(applied_file)
+    if applied is None:
+        print(f"No applied version found; taking {data_file} as the current environment")
+        if not context.args.dry_run:
+            save_applied(applied_file, text)
+        return True
+    if text == applied[0]:
+        return True
+
+    delta = CompanyDelta(applied[1], new)
+    print(f"\n{time.strftime('%H:%M:%S')} {data_file} changed")
+    for line in delta.describe() or ['  No user or project changes']:
+        print(line)
+    if delta:
+        if context.store:
+            context.store.record_company(new)
+        apply_delta(delta, context)
+    if not context.args.dry_run:
+        save_applied(applied_file, text)
+    return True
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Apply company data changes to a live environment as they are saved')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--applied', metavar='FILE',
+                        help='Last applied version (default: <data file name>.applied.json)')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to keep in sync (default: all)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, metavar='SECONDS',
+                        help=f'Polling interval (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE, metavar='SECONDS',
+                        help=f'Quiet time before a change is applied (default: {DEFAULT_SETTLE})')
+    parser.add_argument('--once', action='store_true',
+                        help='Apply the pending change, if any, and exit')
+    parser.add_argument('--dry-run', '-n', action='store_true',
+                        help='Print the delta and the affected units without changing anything')
+    parser.add_argument('--skip-ad', action='store_true',
+                        help='Leave AD users, groups and G: permissions alone')
+    parser.add_argument('--ad-dry-run', action='store_true',
+                        help='Print the AD and permission changes without making them')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    set_company_seed(args.seed)
+    parse_age_profiles(args.age_profile)
+    applied_file = args.applied or f"{os.path.splitext(args.data_file)[0]}.applied.json"
+
+    context = WatchContext(args)
+    try:
+        signature = get_signature(args.data_file)
+        apply_pending(args.data_file, applied_file, context)
+        if args.once:
+            return
+        print(f"Watching {args.data_file} (Ctrl+C to stop)")
+        while True:
+            signature = wait_for_change(args.data_file, signature, args.interval, args.settle)
+            apply_pending(args.data_file, applied_file, context)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        context.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Work Queue
+
+Distributes one environment build over any number of worker processes, on one
+machine or on several that mount the same target and the same queue file. A
+SQLite database stands in for a real queue service.
+
+The queue holds the work units of populate_shards (user:<name>,
+project:<number>, department:<name>), heaviest first. A worker claims a unit
+atomically, takes a lease on it and keeps the lease alive with a heartbeat
+thread while it plans and materializes the unit. A worker that crashes stops
+heartbeating, its lease expires and the unit is handed to the next worker that
+asks. A unit that keeps failing is given up on after --max-attempts.
+
+Units are stored by name only: plans are reproducible (seeds.py), so every
+worker re-plans exactly the entries the unit had when the queue was filled.
+The stages and seed are stored in the queue for that purpose. Re-running a
+unit after a crash is safe; its clean entries start the unit's folders over.
+
+Usage:
+    python work_queue.py --db FILE --init [options]     Fill the queue
+    python work_queue.py --db FILE [options]            Run a worker
+    python work_queue.py --db FILE --status             Show progress
+
+Options:
+    --db FILE            Queue database (default: populate_queue.db)
+    --init               Plan and weigh every unit and (re)fill the queue
+    --status             Print task counts by state and exit
+    --data-file FILE     Path to company data JSON file (default: company_data.json)
+    --stages STAGE ...   Stages to queue with --init (default: all)
+    --lease SECONDS      Lease length; a silent worker loses its unit after this
+    --max-attempts N     Attempts before a unit is marked failed
+
+Example:
+    python work_queue.py --db /mnt/share/queue.db --init --seed 42
+    python work_queue.py --db /mnt/share/queue.db --allocation sparse    # On every worker
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from file_dates import add_date_arguments, parse_age_profiles
+from file_factory import FileFactory, add_file_factory_arguments, factory_from_args
+from populate_executor import add_executor_arguments, executor_from_args
+from populate_plan import (FILE, STAGE_ORDER, ExecutionStats, PlanStopped, get_drive_roots, load_company_data,
+                           execute_plan)
+from populate_shards import DEFAULT_FILE_COST, get_root_entries, get_unit_planners, iter_work_units, unit_weight
+from reconcile import add_reconcile_arguments
+from seeds import add_seed_arguments, set_company_seed
+from state_store import add_store_arguments, store_from_args
+
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before asking again while other workers hold leases
+IDLE_POLL = 2.0
+
+# Task states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    name TEXT PRIMARY KEY,
+    weight INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (state, weight);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+class WorkQueue:
+    """SQLite-backed queue of work units with leases
+
+    Every thread must use its own WorkQueue, since SQLite connections are
+    not shared between threads.
+    """
+
+    def __init__(self, path, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode, so every write below controls its own transaction
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def fill(self, units: Iterable[Tuple[str, int]], meta: Dict[str, object]) -> int:
+        """Replace the queue's contents with the given (name, weight) units"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM tasks")
+            self.db.execute("DELETE FROM meta")
+            count = 0
+            for name, weight in units:
+                self.db.execute("INSERT INTO tasks (name, weight, state) VALUES (?, ?, ?)", (name, weight, PENDING))
+                count += 1
+            self.db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                [(key, json.dumps(value)) for key, value in meta.items()])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return count
+
+    def meta(self) -> Dict[str, object]:
+        """Return the settings stored when the queue was filled"""
+        return {key: json.loads(value) for key, value in self.db.execute("SELECT key, value FROM meta")}
+
+    def claim(self, worker: str) -> Optional[str]:
+        """Lease the heaviest unit that is pending or whose lease has expired"""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT name FROM tasks WHERE (state = ? OR (state = ? AND lease_expires < ?)) "
+                "AND attempts < ? ORDER BY weight DESC LIMIT 1",
+                (PENDING, LEASED, now, self.max_attempts)).fetchone()
+            if row:
+                self.db.execute(
+                    "UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "started = ? WHERE name = ?",
+                    (LEASED, worker, now + self.lease_seconds, now, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def heartbeat(self, name: str, worker: str) -> bool:
+        """Extend a lease, returning False if the unit is no longer ours"""
+        cursor = self.db.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE name = ? AND worker = ? AND state = ?",
+            (time.time() + self.lease_seconds, name, worker, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, name: str, worker: str) -> bool:
+        """Mark a leased unit done"""
+        cursor = self.db.execute(
+            "UPDATE tasks SET state = ?, finished = ?, error = NULL WHERE name = ? AND worker = ? AND state = ?",
+            (DONE, time.time(), name, worker, LEASED))
+        return cursor.rowcount == 1
+
+    def fail(self, name: str, worker: str, error: str) -> None:
+        """Release a unit after an error, giving up on it after max_attempts"""
+        self.db.execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, "
+            "lease_expires = NULL WHERE name = ? AND worker = ? AND state = ?",
+            (self.max_attempts, FAILED, PENDING, error, name, worker, LEASED))
+
+    def reap(self) -> int:
+        """Mark expired units that have run out of attempts as failed"""
+        cursor = self.db.execute(
+            "UPDATE tasks SET state = ?, error = COALESCE(error, 'lease expired') "
+            "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+            (FAILED, LEASED, time.time(), self.max_attempts))
+        return cursor.rowcount
+
+    def live_leases(self) -> int:
+        """Return how many units other workers are still working on"""
+        return self.db.execute("SELECT COUNT(*) FROM tasks WHERE state = ? AND lease_expires >= ?",
+                               (LEASED, time.time())).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of units in each state"""
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+def weigh_units(company_data: Dict, stages: Iterable[str], factory: FileFactory,
+                file_cost: int = DEFAULT_FILE_COST) -> Iterable[Tuple[str, int]]:
+    """Plan every unit once and yield its name and weight"""
+    for name, entries in iter_work_units(company_data, stages):
+        files = 0
+        allocated_bytes = 0
+        for entry in entries:
+            if entry.kind == FILE:
+                files += 1
+                if factory.allocation != 'sparse':
+                    allocated_bytes += factory.materialized_size(entry.size)
+        yield name, unit_weight(files, allocated_bytes, file_cost)
+
+def plan_unit(planners: Dict[str, Callable[[], Iterable]], name: str) -> Iterable:
+    """Return the plan of one work unit by name, from populate_shards.get_unit_planners()"""
+    planner = planners.get(name)
+    if planner is None:
+        raise KeyError(f"No work unit {name} in the company data")
+    return planner()
+
+def get_worker_id() -> str:
+    """Return a name for this worker that is unique across machines"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _keep_alive(path: str, lease_seconds: float, name: str, worker: str, stop: threading.Event,
+                lost: threading.Event) -> None:
+    """Extend a unit's lease every third of the lease time until stopped, setting lost if it is taken over"""
+    queue = WorkQueue(path, lease_seconds)
+    try:
+        while not stop.wait(lease_seconds / 3):
+            if not queue.heartbeat(name, worker):
+                print(f"Lost the lease on {name}")
+                lost.set()
+                return
+    finally:
+        queue.close()
+
+def run_worker(queue: WorkQueue, company_data: Dict, roots=None, factory: Optional[FileFactory] = None,
+               executor=None, reconcile: bool = False, worker: Optional[str] = None,
+               store=None) -> ExecutionStats:
+    """Claim and execute units until the queue is drained"""
+    worker = worker or get_worker_id()
+    roots = roots or get_drive_roots()
+    factory = factory or FileFactory()
+    stages = queue.meta().get('stages', STAGE_ORDER)
+    planners = get_unit_planners(company_data, stages)
+    stats = ExecutionStats()
+
+    execute_plan(get_root_entries(stages), roots, factory, store=store)
+    while True:
+        name = queue.claim(worker)
+        if name is None:
+            queue.reap()
+            if queue.live_leases():
+                time.sleep(IDLE_POLL)
+                continue
+            break
+
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=_keep_alive, name='heartbeat', daemon=True,
+                                     args=(queue.path, queue.lease_seconds, name, worker, stop, lost))
+        heartbeat.start()
+        started = time.monotonic()
+        try:
+            # A lost lease stops the unit, so this worker never races its new owner on the same folders
+            unit_stats = execute_plan(plan_unit(planners, name), roots, factory,
+                                      executor=executor, reconcile=reconcile, store=store, stop=lost)
+        except PlanStopped:
+            print(f"Abandoned {name}: its lease was taken over")
+            continue
+        except Exception as e:
+            print(f"{name} failed: {e}")
+            queue.fail(name, worker, str(e))
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+        stats.add(files=unit_stats.files, dirs=unit_stats.dirs, bytes=unit_stats.bytes, failed=unit_stats.failed)
+        if unit_stats.failed:
+            # Handed out again, so the failed entries get another try
+            queue.fail(name, worker, f"{unit_stats.failed:,} entries failed")
+        elif queue.complete(name, worker):
+            print(f"{name}: {unit_stats.files:,} files in {time.monotonic() - started:.1f}s")
+        else:
+            print(f"{name} was taken over before it could be marked done")
+    return stats
+
+def print_status(queue: WorkQueue) -> None:
+    """Print task counts by state"""
+    counts = queue.counts()
+    total = sum(counts.values())
+    print(f"{total:,} units: " + ", ".join(f"{counts.get(state, 0):,} {state}"
+                                         for state in (PENDING, LEASED, DONE, FAILED)))
+    for name, worker, error in queue.db.execute("SELECT name, worker, error FROM tasks WHERE state = ?", (FAILED,)):
+        print(f"  {name} (last worker {worker}): {error}")
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Populate the simulated environment from a shared work queue')
+    parser.add_argument('--db', default='populate_queue.db',
+                        help='Queue database (default: populate_queue.db)')
+    parser.add_argument('--init', action='store_true',
+                        help='Plan and weigh every unit and (re)fill the queue')
+    parser.add_argument('--status', action='store_true',
+                        help='Print task counts by state and exit')
+    parser.add_argument('--data-file', default='company_data.json',
+                        help='Path to company data JSON file')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_ORDER, default=STAGE_ORDER,
+                        help='Stages to queue with --init (default: all)')
+    parser.add_argument('--file-cost', type=int, default=DEFAULT_FILE_COST, metavar='BYTES',
+                        help=f'Weight of creating one file, in allocated-byte equivalents (default: {DEFAULT_FILE_COST})')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS, metavar='SECONDS',
+                        help=f'Lease length (default: {DEFAULT_LEASE_SECONDS:.0f})')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Attempts before a unit is marked failed (default: {DEFAULT_MAX_ATTEMPTS})')
+    add_file_factory_arguments(parser)
+    add_executor_arguments(parser)
+    add_reconcile_arguments(parser)
+    add_store_arguments(parser)
+    add_seed_arguments(parser)
+    add_date_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    queue = WorkQueue(args.db, args.lease, args.max_attempts)
+    try:
+        if args.status:
+            print_status(queue)
+            return
+
+        if args.init:
+            set_company_seed(args.seed)
+            parse_age_profiles(args.age_profile)
+            company_data = load_company_data(args.data_file)
+            count = queue.fill(weigh_units(company_data, args.stages, factory_from_args(args), args.file_cost),
+                               {'stages': args.stages, 'seed': args.seed, 'age_profile': args.age_profile})
+            print(f"Queued {count:,} units in {args.db}")
+            return
+
+        # Plan exactly as the queue was filled
+        meta = queue.meta()
+        set_company_seed(meta.get('seed', args.seed))
+        parse_age_profiles(meta.get('age_profile', args.age_profile))
+        company_data = load_company_data(args.data_file)
+        store = store_from_args(args, company_data)
+        stats = run_worker(queue, company_data, factory=factory_from_args(args),
+                           executor=executor_from_args(args), reconcile=args.reconcile, store=store)
+        if store:
+            store.close()
+        print(f"\nWorker {get_worker_id()} created {stats.summary()}")
+        print_status(queue)
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    main()